@@ -8,6 +8,7 @@ import multiprocessing
 from operator import itemgetter
 from datetime import datetime
 from model import Model
+from condition_refs import ConditionRefs
 from other_useful_functions import *
 
 
@@ -17,7 +18,7 @@ class AIRIS(object):
 
         # clear logfile
         if DEBUG_WITH_LOGFILE:
-            open(DEBUG_LOGFILE_PATH, 'w').close()
+            clear_debug_log()
 
         pprint('initializing AIRIS ...', new_line_start=True, draw_line=False)
         start_time = datetime.now()
@@ -93,7 +94,10 @@ class AIRIS(object):
         self.round_to = 2
         self.assume_sample_size = 2
 
-        pprint('initialization complete. duration: %s' % (datetime.now() - start_time))
+        # compiled vis_ref and aux_ref of the conditions under each action/output/focus value path of the knowledge
+        self.condition_refs = {}
+
+        pprint('initialization complete. duration: %s', datetime.now() - start_time)
 
     def print_mind(self, indent=DEFAULT_INDENT, num_indents=0,
                    new_line_start=False, new_line_end=False,
@@ -125,13 +129,13 @@ class AIRIS(object):
                     self.print_change_lists()
 
             if focus_value:
-                pprint('focus_value:\t\t\t%s' % self.models[self.current_model_index].focus_value)
+                pprint('focus_value:\t\t\t%s', self.models[self.current_model_index].focus_value)
 
             if global_sets:
                 self.print_global_sets()
 
             if current_model_index:
-                pprint('Current Model Index:\t\t%s' % self.current_model_index)
+                pprint('Current Model Index:\t\t%s', self.current_model_index)
 
             if models:
                 self.print_models()
@@ -143,15 +147,15 @@ class AIRIS(object):
                 # pass  # tbd ... how do we print this in a concise way? this might be where a gui comes in handy
 
             if goal:
-                pprint('Goal Type:\t%s' % self.goal_type)
-                pprint('Goal Action:\t%s' % self.goal_action)
-                pprint('Goal Output:\t%s' % self.goal_output)
+                pprint('Goal Type:\t%s', self.goal_type)
+                pprint('Goal Action:\t%s', self.goal_action)
+                pprint('Goal Output:\t%s', self.goal_output)
                 self.print_goal_source()
 
             if action_plan:
-                pprint('Action Plan:\n%d actions' % len(self.action_plan))
+                pprint('Action Plan:\n%d actions', len(self.action_plan))
                 for goal_action, goal_output in self.action_plan:
-                    pprint(goal_action, goal_output)
+                    pprint('%s %s', goal_action, goal_output)
 
             pprint('\\--------------------------------------------------------/\n')
 
@@ -177,16 +181,13 @@ class AIRIS(object):
             pprint('Global Sets:', indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, draw_line=draw_line)
 
-            pprint('all visual values ever seen:   \t%s' %
-                np.array(list(self.vis_global_set)).astype(int),
+            pprint('all visual values ever seen:   \t%s', np.array(list(self.vis_global_set)).astype(int),
                 indent=indent, num_indents=num_indents + 1)
 
-            pprint('all focus values ever seen:   \t%s' %
-                np.array(list(self.focus_global_set)).astype(int),
+            pprint('all focus values ever seen:   \t%s', np.array(list(self.focus_global_set)).astype(int),
                 indent=indent, num_indents=num_indents + 1)
 
-            pprint('all auxiliary values ever seen:\t%s' %
-                np.array(list(self.aux_global_set)).astype(int),
+            pprint('all auxiliary values ever seen:\t%s', np.array(list(self.aux_global_set)).astype(int),
                 indent=indent, num_indents=num_indents + 1,
                 new_line_end=new_line_end, draw_line=draw_line)
 
@@ -200,15 +201,15 @@ class AIRIS(object):
                 indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, draw_line=draw_line)
 
-            pprint('Source value:\t%s' % self.goal_source['value'],
+            pprint('Source value:\t%s', self.goal_source['value'],
                 indent=indent, num_indents=num_indents + 1)
-            pprint('x:    \t%s' % self.goal_source['x'],
+            pprint('x:    \t%s', self.goal_source['x'],
                 indent=indent, num_indents=num_indents + 1)
-            pprint('y:    \t%s' % self.goal_source['y'],
+            pprint('y:    \t%s', self.goal_source['y'],
                 indent=indent, num_indents=num_indents + 1)
-            pprint('i:    \t%s' % self.goal_source['i'],
+            pprint('i:    \t%s', self.goal_source['i'],
                 indent=indent, num_indents=num_indents + 1)
-            pprint('Goal value:    \t%s' % self.goal_value,
+            pprint('Goal value:    \t%s', self.goal_value,
                 indent=indent, num_indents=num_indents + 1,
                 new_line_end=new_line_end, draw_line=draw_line)
 
@@ -218,11 +219,11 @@ class AIRIS(object):
 
         if DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE:
 
-            pprint('Visual Change List:   \t\t%s' % self.vis_change_list,
+            pprint('Visual Change List:   \t\t%s', self.vis_change_list,
                 indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, draw_line=draw_line)
 
-            pprint('Auxiliary Change List:\t\t%s' % self.aux_change_list,
+            pprint('Auxiliary Change List:\t\t%s', self.aux_change_list,
                 indent=indent, num_indents=num_indents,
                 new_line_end=new_line_end, draw_line=draw_line)
 
@@ -232,7 +233,7 @@ class AIRIS(object):
 
         if DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE:
 
-            pprint('Condition ID:\t\t%s' % self.condition_id,
+            pprint('Condition ID:\t\t%s', self.condition_id,
                 indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, new_line_end=new_line_end,
                 draw_line=draw_line)
@@ -245,7 +246,7 @@ class AIRIS(object):
 
             pprint('Knowledge:', indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, draw_line=draw_line)
-            pprint('size: %s' % sys.getsizeof(self.knowledge),
+            pprint('size: %s', sys.getsizeof(self.knowledge),
                 indent=indent, num_indents=num_indents + 1)
 
             if self.knowledge:
@@ -265,7 +266,7 @@ class AIRIS(object):
                                 pprint(output, indent=indent, num_indents=num_indents + 4)
                                 pprint('Condition Focus Values:', indent=indent, num_indents=num_indents + 5)
                                 try:
-                                    pprint('aux_raw:             %s' % self.knowledge[output_path + '/aux_raw'],
+                                    pprint('aux_raw:             %s', self.knowledge[output_path + '/aux_raw'],
                                            indent=indent, num_indents=num_indents + 5)
                                 except KeyError:
                                     pass
@@ -286,32 +287,32 @@ class AIRIS(object):
                                             except:
                                                 continue  # don't search for knowledge of this condition_id if it doesnt exist
                                             try:
-                                                pprint('rel_abs:        %s' % self.knowledge[id_path + '/rel_abs'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('rel_abs:        %s', self.knowledge[id_path + '/rel_abs'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('posterior_val:        %s' % self.knowledge[id_path + '/posterior_val'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('posterior_val:        %s', self.knowledge[id_path + '/posterior_val'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
                                                 x, y = self.knowledge[id_path + '/focus_x'], self.knowledge[id_path + '/focus_y']
-                                                pprint('(focus_x, focus_y):   (%s, %s)' % (x, y), indent=indent, num_indents=num_indents + 9)
+                                                pprint('(focus_x, focus_y):   (%s, %s)', x, y, indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('focus_i:              %s' % self.knowledge[id_path + '/focus_i'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('focus_i:              %s', self.knowledge[id_path + '/focus_i'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('aux_ref:              %s' % self.knowledge[id_path + '/aux_ref'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('aux_ref:              %s', self.knowledge[id_path + '/aux_ref'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('aux_data:             %s' % self.knowledge[id_path + '/aux_data'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('aux_data:             %s', self.knowledge[id_path + '/aux_data'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('vis_ref:              %s' % self.knowledge[id_path + '/vis_ref'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('vis_ref:              %s', self.knowledge[id_path + '/vis_ref'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
@@ -319,7 +320,7 @@ class AIRIS(object):
                                             except KeyError:
                                                 pass
                                             try:
-                                                pprint('post_aux_data:             %s' % self.knowledge[id_path + '/post_aux_data'], indent=indent, num_indents=num_indents + 9)
+                                                pprint('post_aux_data:             %s', self.knowledge[id_path + '/post_aux_data'], indent=indent, num_indents=num_indents + 9)
                                             except KeyError:
                                                 pass
                                             try:
@@ -354,16 +355,16 @@ class AIRIS(object):
 
                     if first:
                         first = False
-                        pprint('key:     %s' % k, indent=indent, num_indents=num_indents + 1)
+                        pprint('key:     %s', k, indent=indent, num_indents=num_indents + 1)
                     else:
-                        pprint('key:     %s' % k, indent=indent,
+                        pprint('key:     %s', k, indent=indent,
                             num_indents=num_indents + 1, new_line_start=True, draw_line=False)
 
                     if isinstance(v, np.ndarray) and v.ndim == 2:
                         pprint('value:', indent=indent, num_indents=num_indents + 1)
                         print_vis_env(v, indent=indent, num_indents=num_indents + 1)
                     else:
-                        pprint('value:   %s' % v, indent=indent, num_indents=num_indents + 1)
+                        pprint('value:   %s', v, indent=indent, num_indents=num_indents + 1)
 
             else:
                 pprint('Empty', indent=indent, num_indents=num_indents + 1)
@@ -374,7 +375,7 @@ class AIRIS(object):
 
         if DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE:
 
-            pprint('Focus Value:\t\t%s' % self.models[self.current_model_index].focus_value,
+            pprint('Focus Value:\t\t%s', self.models[self.current_model_index].focus_value,
                 indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, new_line_end=new_line_end,
                 draw_line=draw_line)
@@ -385,7 +386,7 @@ class AIRIS(object):
 
         if DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE:
 
-            pprint('Goal Condition:\t\t%s' % self.goal_condition,
+            pprint('Goal Condition:\t\t%s', self.goal_condition,
                 indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, new_line_end=new_line_end,
                 draw_line=draw_line)
@@ -415,7 +416,7 @@ class AIRIS(object):
             while not self.action_plan and not self.goal_reached:
                 pprint('no plan has been made yet',
                     num_indents=num_indents + 1, new_line_start=True)
-                pprint('self.action_plan:\t%s' % self.action_plan,
+                pprint('self.action_plan:\t%s', self.action_plan,
                     num_indents=num_indents + 2)
 
                 # clear old models, create a new model of this environment
@@ -442,7 +443,7 @@ class AIRIS(object):
             if self.action_plan:
                 # get the action at the end of the list
                 if self.store_worst_index != None and len(self.action_plan) == 1:
-                    pprint('Adding to worst set: '+str(self.store_worst),
+                    pprint('Adding to worst set: %s', self.store_worst,
                         num_indents=num_indents + 1, new_line_start=True)
                     self.worst_set.add(self.store_worst)
 
@@ -460,8 +461,7 @@ class AIRIS(object):
 
                 self.current_model_index = predicted_model_index
 
-                pprint('(action, output, predicted_model_index) = (%s, %s, %s)'
-                    % (action, output, predicted_model_index),
+                pprint('(action, output, predicted_model_index) = (%s, %s, %s)', action, output, predicted_model_index,
                     num_indents=num_indents + 1)
 
                 pprint('do the action in the game', num_indents=1, new_line_start=True)
@@ -470,7 +470,7 @@ class AIRIS(object):
                 action = None
                 pprint('No action needs to be taken', num_indents=1, new_line_start=True)
 
-            pprint('input captured. duration: %s' % (datetime.now() - start_time),
+            pprint('input captured. duration: %s', datetime.now() - start_time,
                 new_line_start=True, draw_line=True)
 
             return (action, self.models[self.current_model_index].predicted_vis_change, self.models[self.current_model_index].predicted_aux_change)
@@ -496,7 +496,7 @@ class AIRIS(object):
 
             # self.print_mind(prior=False)
 
-            pprint('input captured. duration: %s' % (datetime.now() - start_time),
+            pprint('input captured. duration: %s', datetime.now() - start_time,
                 new_line_start=True, draw_line=True)
 
     def create_model(self, from_model_index, num_indents=0):
@@ -524,7 +524,7 @@ class AIRIS(object):
 
             self.print_global_sets(num_indents=num_indents + 1)
 
-            focus_heap = copy.deepcopy(self.models[0].vis_count_heap)
+            focus_heap = list(self.models[0].vis_count_heap)
 
             if self.focus_global_set:
                 while focus_heap and self.models[0].focus_value == None:
@@ -534,7 +534,7 @@ class AIRIS(object):
                         heapq.heappop(focus_heap)
 
                 if self.models[0].focus_value == None:
-                    not_focus_heap = copy.deepcopy(self.models[0].vis_count_heap)
+                    not_focus_heap = list(self.models[0].vis_count_heap)
                     while not_focus_heap and self.models[0].focus_value == None:
                         if not_focus_heap[0][1] not in self.not_focus_global_set:
                             self.models[0].focus_value = not_focus_heap[0][1]
@@ -546,7 +546,7 @@ class AIRIS(object):
 
         else:  # for the rest of the models
 
-            pprint('creating a model from model %s ...' % from_model_index,
+            pprint('creating a model from model %s ...', from_model_index,
                 num_indents=num_indents, new_line_start=True)
             start_time = datetime.now()
 
@@ -557,10 +557,10 @@ class AIRIS(object):
 
         pprint('updating self.current_model_index', num_indents=num_indents + 1,
             new_line_start=True)
-        pprint('from:\t\t\t%s' % self.current_model_index, num_indents=num_indents + 2)
-        pprint('to:  \t\t\t%s' % (len(self.models) - 1), num_indents=num_indents + 2)
+        pprint('from:\t\t\t%s', self.current_model_index, num_indents=num_indents + 2)
+        pprint('to:  \t\t\t%s', len(self.models) - 1, num_indents=num_indents + 2)
 
-        pprint('model created. duration: %s' % (datetime.now() - start_time),
+        pprint('model created. duration: %s', datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
         return len(self.models) - 1
 
@@ -606,10 +606,10 @@ class AIRIS(object):
         action_output = self.action_output_list[action_index]
         output_range = range(action_output[0], action_output[1], action_output[2])
         self.goal_output = str(random.choice(output_range))
-        pprint('self.goal_action = %s' % self.goal_action, num_indents=num_indents + 2)
-        pprint('self.goal_output = %s' % self.goal_output, num_indents=num_indents + 2)
+        pprint('self.goal_action = %s', self.goal_action, num_indents=num_indents + 2)
+        pprint('self.goal_output = %s', self.goal_output, num_indents=num_indents + 2)
 
-        pprint('goal_type: %s' % self.goal_type,
+        pprint('goal_type: %s', self.goal_type,
             num_indents=num_indents + 1, new_line_start=True)
 
         if self.goal_type == 'Random':
@@ -634,8 +634,8 @@ class AIRIS(object):
                 pprint('Pruning found knowledge:', num_indents=num_indents + 2)
                 for knowledge_focus in knowledge_found:
                     if knowledge_focus[0] != 'A':
-                        if float(knowledge_focus) not in model.vis_count_list:
-                            pprint('focus value ' + str(knowledge_focus) + ' not in visual count', num_indents=num_indents + 3)
+                        if float(knowledge_focus) not in model.vis_count:
+                            pprint('focus value %s not in visual count', knowledge_focus, num_indents=num_indents + 3)
                             knowledge_prune.append(knowledge_focus)
 
                 for val in knowledge_prune:
@@ -659,7 +659,7 @@ class AIRIS(object):
                         except KeyError:
                             pass
                     if not keep:
-                        pprint('focus value ' + str(knowledge_focus) + ' no vis_ref in any condition data', num_indents=num_indents + 3)
+                        pprint('focus value %s no vis_ref in any condition data', knowledge_focus, num_indents=num_indents + 3)
                         knowledge_prune.append(knowledge_focus)
 
                 for val in knowledge_prune:
@@ -668,7 +668,7 @@ class AIRIS(object):
                     else:
                         no_conditions = True
 
-                pprint('MODEL FOCUS VALUE DEFAULT '+str(model.focus_value), num_indents=num_indents + 7)
+                pprint('MODEL FOCUS VALUE DEFAULT %s', model.focus_value, num_indents=num_indents + 7)
 
                 # set model.focus_value to a random focus value in knowledge_found
                 pprint('selecting a random focus_value from the usable knowledge:', num_indents=num_indents + 2)
@@ -683,14 +683,13 @@ class AIRIS(object):
                 if not model.focus_value_is_aux:
                     # (x, y) position of a model.focus_value in the
                     # list of positions for that value in the model
-                    model.focus_pos = model.vis_count_pos[float(model.focus_value)][0]
+                    model.focus_pos = model.first_position(float(model.focus_value))
                 model.focus_value = float(model.focus_value[1:]) if \
                     model.focus_value_is_aux else float(model.focus_value)
                 self.goal_focus_value = copy.deepcopy(model.focus_value)
                 self.print_focus_value(num_indents=4)
-                pprint('flag model.focus_value_is_aux:\t%s' %
-                    model.focus_value_is_aux, num_indents=num_indents + 2)
-                pprint('model.focus_value: '+str(model.focus_value), num_indents=num_indents + 2)
+                pprint('flag model.focus_value_is_aux:\t%s', model.focus_value_is_aux, num_indents=num_indents + 2)
+                pprint('model.focus_value: %s', model.focus_value, num_indents=num_indents + 2)
 
                 # choose a random goal condition
                 pprint('selecting a random goal_condition from the knowledge:',
@@ -732,7 +731,7 @@ class AIRIS(object):
                 pprint('we have no knowledge of this action/output', num_indents=num_indents + 2)
                 self.goal_type = 'New Action'  # do an action we've not done before
                 goal_found = True
-                pprint('goal_type reset to:\t%s' % self.goal_type, num_indents=num_indents + 2)
+                pprint('goal_type reset to:\t%s', self.goal_type, num_indents=num_indents + 2)
 
             fv = str(model.focus_value) if not model.focus_value_is_aux else 'A' + str(model.focus_value)
             gc = str(self.goal_condition) if self.goal_condition else ''
@@ -743,7 +742,7 @@ class AIRIS(object):
 
             if not goal_found and not no_conditions:
                 try:
-                    pprint('searching for goal_source knowledge at: ' + path + '/vis_ref',
+                    pprint('searching for goal_source knowledge at: %s/vis_ref', path,
                            num_indents=num_indents + 1, new_line_start=True)
 
                     while True:
@@ -771,7 +770,7 @@ class AIRIS(object):
 
             if not goal_found and self.goal_condition:
                 try:
-                    pprint('searching for goal_source knowledge at: ' + path + '/aux_ref',
+                    pprint('searching for goal_source knowledge at: %s/aux_ref', path,
                            num_indents=num_indents + 1, new_line_start=True)
                     i, val, _ = random.choice(self.knowledge[path + '/aux_ref'])
                     self.goal_source = {
@@ -810,7 +809,7 @@ class AIRIS(object):
 
 
         if goal_found:
-            pprint('goal set. duration: %s' % (datetime.now() - start_time),
+            pprint('goal set. duration: %s', datetime.now() - start_time,
                 num_indents=num_indents, new_line_start=True, draw_line=True)
 
     def make_plan(self, action, num_indents=0):
@@ -821,7 +820,7 @@ class AIRIS(object):
             num_indents=num_indents, new_line_start=True)
         start_time = datetime.now()
 
-        pprint('goal_type: %s' % self.goal_type,
+        pprint('goal_type: %s', self.goal_type,
             num_indents=num_indents + 1, new_line_start=True)
 
         # how many steps are in the plan
@@ -829,7 +828,7 @@ class AIRIS(object):
         worst_condition = []
         new_condition = []
 
-        pprint('GOALVALUE '+str(self.goal_value), num_indents=num_indents+1)
+        pprint('GOALVALUE %s', self.goal_value, num_indents=num_indents+1)
 
         if (self.goal_type == 'Random' and self.goal_value != None) or self.goal_type == 'Fixed':
 
@@ -864,7 +863,7 @@ class AIRIS(object):
             if model.compare == 999999:
                 self.goal_reached = True
 
-            pprint('MODELCOMPARE '+str(model.compare), num_indents=num_indents + 1)
+            pprint('MODELCOMPARE %s', model.compare, num_indents=num_indents + 1)
 
             while not self.goal_reached and base_model_heap and plan_depth <= self.action_plan_depth_limit:
 
@@ -884,14 +883,14 @@ class AIRIS(object):
                 #         break
                 base_model = heapq.heappop(base_model_heap)[1]
                 plan_depth += 1
-                pprint(str(plan_depth) + ' / ' + str(self.action_plan_depth_limit), num_indents=num_indents + 1)
+                pprint('%s / %s', plan_depth, self.action_plan_depth_limit, num_indents=num_indents + 1)
                 for action_index, try_action in enumerate(self.action_space):
                     if not self.goal_reached:
                         for try_output in range(self.action_output_list[action_index][0], self.action_output_list[action_index][1], self.action_output_list[action_index][2]):
                             self.current_model_index = base_model
                             model = self.models[self.current_model_index]
                             hold_depth = model.depth
-                            pprint('base model depth: '+str(model.depth), num_indents=num_indents + 1)
+                            pprint('base model depth: %s', model.depth, num_indents=num_indents + 1)
                             self.predict(try_action, try_output, num_indents=num_indents + 1)
                             if model.best_condition_id:
                                 worst_dif = int(copy.deepcopy(model.best_condition_dif))
@@ -906,8 +905,8 @@ class AIRIS(object):
                                 if model.compare != 999999:
                                     worst_condition.append((worst_dif, model.previous_model_index, worst_id, model.compare, try_action, try_output, 999999, prev_model.focus_value, self.current_model_index))
 
-                                pprint('This model\'s (' + str(self.current_model_index) + ') depth: '+str(model.depth), num_indents=num_indents + 1)
-                                pprint('This model\'s (' + str(self.current_model_index) + ') compare: '+str(model.compare), num_indents=num_indents + 1)
+                                pprint("This model's (%s) depth: %s", self.current_model_index, model.depth, num_indents=num_indents + 1)
+                                pprint("This model's (%s) compare: %s", self.current_model_index, model.compare, num_indents=num_indents + 1)
                                 model_env = np.array_str(model.vis_env) \
                                           + np.array_str(model.aux_env)
                                 if model_env not in model_set:
@@ -978,7 +977,7 @@ class AIRIS(object):
                     for dif, index, id, compare, act, out, raw, focus, current in worst_condition_prune:
                         check_worst = (str(self.models[index].vis_env)+str(self.models[index].aux_env), act, out, raw)
                         if check_worst in self.worst_set:
-                            pprint('deleting duplicate worst_condition: ('+str(dif)+','+str(index)+','+str(act)+','+str(out)+','+str(raw)+')', num_indents=num_indents + 1)
+                            pprint('deleting duplicate worst_condition: (%s,%s,%s,%s,%s)', dif, index, act, out, raw, num_indents=num_indents + 1)
                             #print('deleting duplicate worst_condition: ('+str(dif)+','+str(index)+','+str(act)+','+str(out)+','+str(raw)+')')
                             worst_condition.remove((dif, index, id, compare, act, out, raw, focus, current))
 
@@ -998,7 +997,7 @@ class AIRIS(object):
                     # if we cant figure out how to achieve our goal
                     # then instead, do whatever action we're the least confident about to see what action to do
                     if worst_condition:
-                        pprint('worst_condition: '+str(worst_condition), num_indents=num_indents + 1)
+                        pprint('worst_condition: %s', worst_condition, num_indents=num_indents + 1)
                         print('Trying the closest thing I can think of...')
                         print('worst_condition: ', worst_condition)
                         worst_index = worst_condition.index(min(worst_condition, key=itemgetter(3)))
@@ -1018,7 +1017,7 @@ class AIRIS(object):
                             print('I\'m not sure about trying \''+str(worst_condition[worst_index][4])+'\' under these conditions...')
                             self.action_plan.append((worst_condition[worst_index][4], worst_condition[worst_index][5], worst_condition[worst_index][8]))
                         pprint('Cannot determine how to achieve goal.', num_indents=num_indents + 1)
-                        pprint('Attempting worst_condition: '+str(worst_condition[worst_index]), num_indents=num_indents + 1)
+                        pprint('Attempting worst_condition: %s', worst_condition[worst_index], num_indents=num_indents + 1)
 
                         if self.current_model_index != None:
                             model = self.models[self.current_model_index]
@@ -1063,7 +1062,7 @@ class AIRIS(object):
 
                         pprint('Cannot determine how to achieve goal.', num_indents=num_indents + 1)
                         pprint('No more worst_condition\'s left to try.', num_indents=num_indents + 1)
-                        pprint('Closest I can think of is '+str(closest_model), num_indents=num_indents + 1)
+                        pprint('Closest I can think of is %s', closest_model, num_indents=num_indents + 1)
                         #pprint('Clearing worst_set:', num_indents=num_indents)
                         #self.worst_set.clear()
                         #print('Clearing worst_set')
@@ -1081,18 +1080,18 @@ class AIRIS(object):
                 for try_output in range(self.action_output_list[action_index][0], self.action_output_list[action_index][1], self.action_output_list[action_index][2]):
                     self.predict(try_action, try_output, num_indents=num_indents + 1)
                     self.action_plan.append((try_action, try_output, self.current_model_index))
-                    pprint ('Plan: '+str(self.action_plan), num_indents=num_indents + 1)
+                    pprint ('Plan: %s', self.action_plan, num_indents=num_indents + 1)
 
         elif self.goal_type == 'Observe':
             pprint ('Observing...', num_indents=num_indents + 1)
             self.predict(action, 1, num_indents=num_indents + 1)
             self.action_plan.append((action, 1, self.current_model_index))
-            pprint ('Observed action: '+str(self.action_plan), num_indents=num_indents + 1)
+            pprint ('Observed action: %s', self.action_plan, num_indents=num_indents + 1)
 
-        pprint('self.action_plan:\t%s' % self.action_plan,
+        pprint('self.action_plan:\t%s', self.action_plan,
             num_indents=num_indents + 1, new_line_start=True)
 
-        pprint('plan made. duration: %s' % (datetime.now() - start_time),
+        pprint('plan made. duration: %s', datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
 
     def compare_model(self, model_index, num_indents=0):
@@ -1111,7 +1110,7 @@ class AIRIS(object):
         best_compare = None
         compare = None
         model = self.models[model_index]
-        vis_env = copy.deepcopy(model.vis_env)
+        vis_env = model.vis_env
 
         fv = model.focus_value
 
@@ -1120,89 +1119,10 @@ class AIRIS(object):
                 if model.vis_count[fv]:
                     for fx, fy in model.vis_count_pos[fv]:
                         gx, gy = fx + self.goal_source['x'], fy + self.goal_source['y']
-                        pprint('gx, gy: '+str(gx)+','+str(gy), num_indents=num_indents)
+                        pprint('gx, gy: %s,%s', gx, gy, num_indents=num_indents)
                         if not 0 <= gx < len(vis_env) or not 0 <= gy < len(vis_env[0]):
                             compare = 999999
 
-                        # edges of the vis_env
-                        vis_top = len(vis_env[0]) - 1
-                        vis_bottom = 0
-                        vis_left = 0
-                        vis_right = len(vis_env) - 1
-
-                        # max_d = maximum distance from the focus value to an edge of the vis_env
-                        # max_d is used so the search terminates when the whole vis_env has been searched
-                        max_d = max([
-                            abs(vis_top - gy),
-                            abs(vis_bottom - gy),
-                            abs(vis_left - gx),
-                            abs(vis_right - gx)
-                        ])
-
-                        def next_search_border(env, cx, cy, d):
-
-                            # next_search_border returns a list of tuples:
-                            # [(value, (x, y)), ...]
-                            # where each tuple provides the value and position
-                            # of inputs in the env for the inputs of that env
-                            # that form a square border around the center (cx, cy).
-                            # d is the number of inputs from the focus value
-                            # to the center of any of the border's edges.
-
-                            def get_edge(env, inbounds,
-                                        start_x, end_x, only_x,
-                                        start_y, end_y, only_y,
-                                        horizontal=False,
-                                        vertical=False):
-
-                                # get_edge returns a list of tuples for the top
-                                # bottom, left, or right edge of the border (inclusive)
-                                # If the edge is completely outside the env, [] is returned.
-                                # If part of the edge is outside the env, those parts outside
-                                # are excluded from the list returned. If the whole edge is
-                                # inside the env, the whole edge is returned.
-
-                                return list(map(
-                                    lambda x, y: (env[x][y], (x, y)),
-                                    list(range(start_x, end_x + 1)) if horizontal else [only_x] * (end_y - start_y + 1),
-                                    list(range(start_y, end_y + 1)) if vertical else [only_y] * (end_x - start_x + 1)
-                                )) if inbounds else []
-
-                            # edges of the square search border positions
-                            sqr_top = cy + d
-                            sqr_bottom = cy - d
-                            sqr_left = cx - d
-                            sqr_right = cx + d
-
-                            # lists of values and positions of each edge of the border
-                            top_row = get_edge(
-                                env, sqr_top <= vis_top,
-                                sqr_left if sqr_left > vis_left else vis_left,
-                                sqr_right if sqr_right < vis_right else vis_right, None,
-                                None, None, sqr_top,
-                                horizontal=True)
-                            bottom_row = get_edge(
-                                env, sqr_bottom >= vis_bottom,
-                                sqr_left if sqr_left > vis_left else vis_left,
-                                sqr_right if sqr_right < vis_right else vis_right, None,
-                                None, None, sqr_bottom,
-                                horizontal=True)
-                            left_row = get_edge(
-                                env, sqr_left >= vis_left,
-                                None, None, sqr_left,
-                                sqr_bottom if sqr_bottom > vis_bottom else vis_bottom,
-                                sqr_top if sqr_top < vis_top else vis_top, None,
-                                vertical=True)
-                            right_row = get_edge(
-                                env, sqr_right <= vis_right,
-                                None, None, sqr_right,
-                                sqr_bottom if sqr_bottom > vis_bottom else vis_bottom,
-                                sqr_top if sqr_top < vis_top else vis_top, None,
-                                vertical=True)
-
-                            # set is used to remove duplicates
-                            return set(top_row + bottom_row + left_row + right_row)
-
                         if 0 <= gx < len(vis_env) and 0 <= gy < len(vis_env[0]):
                             if vis_env[gx][gy] == self.goal_value:
                                 best_compare = 0
@@ -1214,47 +1134,12 @@ class AIRIS(object):
 
                             pprint('the current goal value\'s position does not satisfy the knowledge condition.',
                                 num_indents=num_indents + 1, new_line_start=True, draw_line=False)
-                            pprint('using an expanding square search of the model\'s vis_env',
+                            pprint('looking up the closest goal value in the model\'s value positions ...',
                                 num_indents=num_indents + 1)
-                            pprint('to find the closest goal value ...', num_indents=num_indents + 1)
-
-                            d = 1  # d = distance from focus value
-                            while True:
-
-                                # stop searching if the closest possible goal value has been found
-                                if compare and d > compare:
-                                    break
-
-                                # stop searching if there is guaranteed to be no more border
-                                # because we have reached the final edge of the vis_env
-                                if d > max_d:
-                                    break
-
-                                # get the current square border and increment its
-                                # distance for the next border
-                                border = next_search_border(vis_env, gx, gy, d)
-                                d += 1
-
-                                # if no border was found, we've reached the final edge
-                                if not border:
-                                    break
-
-                                for val, (x, y) in border:
-
-                                    # if this value of the model is the goal value
-                                    if val == self.goal_value:
 
-                                        # distance = number of sub-symbolic inputs from the
-                                        # the goal_source's position to the current position
-                                        distance = abs(gx - x) + abs(gy - y)
-
-                                        # update compare if there's no compare value
-                                        # or this value is closer
-                                        compare = distance if not compare or \
-                                            distance < compare else compare
-
-                                        #if not 0 <= x - gx <= len(vis_env) or not 0 <= y - gy <= len(vis_env[0]):
-                                            #compare = 999999
+                            # distance = number of sub-symbolic inputs from the
+                            # the goal_source's position to the closest other goal value
+                            compare = model.nearest_distance(np.float32(self.goal_value), gx, gy)
 
                         # set the model's compare field to the number
                         # of moves to the closest goal
@@ -1271,8 +1156,7 @@ class AIRIS(object):
 
         model.compare = round(best_compare, self.round_to)
 
-        pprint('goal value%sfound. model.compare set to: %s. duration: %s' %
-            (' ' if model.compare != None else ' not ', model.compare, (datetime.now() - start_time)),
+        pprint('goal value%sfound. model.compare set to: %s. duration: %s', ' ' if model.compare != None else ' not ', model.compare, datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
 
     def predict(self, action, output, num_indents=0):
@@ -1281,7 +1165,7 @@ class AIRIS(object):
         # past knowledge of an experience closest to the
         # current environment
 
-        pprint('making a prediction for action: %s ...' % action, num_indents=num_indents, new_line_start=True)
+        pprint('making a prediction for action: %s ...', action, num_indents=num_indents, new_line_start=True)
         start_time = datetime.now()
 
         # get the difference between memory and
@@ -1299,14 +1183,14 @@ class AIRIS(object):
         # if we found a condition
         if model.best_condition_id:
 
-            pprint('best_condition_id: ' + str(model.best_condition_id),
+            pprint('best_condition_id: %s', model.best_condition_id,
                 num_indents=num_indents + 1, new_line_start=True)
 
             self.models[self.current_model_index].source_condition_path = model.best_condition_path
             model = self.models[self.current_model_index]
             focus_found = False
 
-            pprint('new model initial focus_pos: ' + str(model.focus_pos),
+            pprint('new model initial focus_pos: %s', model.focus_pos,
                 num_indents=num_indents + 1, new_line_start=True)
             model.previous_action = action
             model.previous_output = output
@@ -1340,7 +1224,7 @@ class AIRIS(object):
                         model.focus_pos = (x, y)
                         focus_found = True
             if model.focus_pos:
-                pprint('new model predicted focus_pos: ' + str(model.focus_pos),
+                pprint('new model predicted focus_pos: %s', model.focus_pos,
                     num_indents=num_indents + 1, new_line_start=True)
 
             try:
@@ -1357,14 +1241,13 @@ class AIRIS(object):
 
             # Update focus value if previous models focus value no longer exists
             if not focus_found:
-                focus_heap = copy.deepcopy(model.vis_count_heap)
-                count_pos = copy.deepcopy(model.vis_count_pos)
+                focus_heap = list(model.vis_count_heap)
 
                 if self.focus_global_set:
                     while focus_heap and not focus_found:
                         if focus_heap[0][1] in self.focus_global_set:
                             model.focus_value = focus_heap[0][1]
-                            model.focus_pos = count_pos[model.focus_value][0]
+                            model.focus_pos = model.first_position(model.focus_value)
                             focus_found = True
                         else:
                             heapq.heappop(focus_heap)
@@ -1378,15 +1261,14 @@ class AIRIS(object):
                         self.knowledge[model.source_condition_path + 'post_vis_data'],
                         self.knowledge[model.source_condition_path + 'post_aux_data'])
 
-                    focus_heap = copy.deepcopy(model.vis_count_heap)
-                    count_pos = copy.deepcopy(model.vis_count_pos)
+                    focus_heap = list(model.vis_count_heap)
                     focus_found = False
 
                     if self.focus_global_set:
                         while focus_heap and not focus_found:
                             if focus_heap[0][1] in self.focus_global_set:
                                 model.focus_value = focus_heap[0][1]
-                                model.focus_pos = count_pos[model.focus_value][0]
+                                model.focus_pos = model.first_position(model.focus_value)
                                 focus_found = True
                             else:
                                 heapq.heappop(focus_heap)
@@ -1403,11 +1285,11 @@ class AIRIS(object):
             dest.focus_index = model.focus_index
             model = self.models[self.current_model_index]
 
-        pprint('visual prediction: ' + str(model.predicted_vis_change),
+        pprint('visual prediction: %s', model.predicted_vis_change,
             num_indents=num_indents + 1, new_line_start=True)
-        pprint('auxiliary prediction: ' + str(model.predicted_aux_change),
+        pprint('auxiliary prediction: %s', model.predicted_aux_change,
             num_indents=num_indents + 1)
-        pprint('prediction made. duration: %s' % (datetime.now() - start_time),
+        pprint('prediction made. duration: %s', datetime.now() - start_time,
             num_indents=1, new_line_start=True, draw_line=True)
 
     def find_changes(self, num_indents=0):
@@ -1423,7 +1305,7 @@ class AIRIS(object):
             num_indents=num_indents, new_line_start=True)
         start_time = datetime.now()
 
-        pprint('self.current_model_index = %d' % self.current_model_index,
+        pprint('self.current_model_index = %d', self.current_model_index,
             num_indents=num_indents + 1, new_line_start=True)
         model = self.models[self.current_model_index]  # current model
         vis_change_found = False
@@ -1455,8 +1337,8 @@ class AIRIS(object):
             num_indents=num_indents + 1, new_line_start=True)
         change_x, change_y = np.nonzero(vis_change_array)
         vis_change_found = len(change_x) > 0  # flag if any visual changes were found
-        pprint('x pos of changes from prediction:\t%s' % change_x, num_indents=num_indents + 2)
-        pprint('y pos of changes from prediction:\t%s' % change_y, num_indents=num_indents + 2)
+        pprint('x pos of changes from prediction:\t%s', change_x, num_indents=num_indents + 2)
+        pprint('y pos of changes from prediction:\t%s', change_y, num_indents=num_indents + 2)
 
         if vis_change_found:
             # Check to see if it's an absolute change
@@ -1513,12 +1395,12 @@ class AIRIS(object):
                         except KeyError:
                             predict_vis_ref = []
 
-                        pprint('checking ABS 4 '+str(predict_vis_ref), num_indents=num_indents + 1)
+                        pprint('checking ABS 4 %s', predict_vis_ref, num_indents=num_indents + 1)
 
                         if check_model.focus_pos:
                             cfx, cfy = copy.deepcopy(check_model.focus_pos)
 
-                        pprint('checking ABS 5 '+str(cfx)+'/'+str(cfy), num_indents=num_indents + 1)
+                        pprint('checking ABS 5 %s/%s', cfx, cfy, num_indents=num_indents + 1)
 
                         for cdx, cdy, prior_val, posterior_val in predict_vis_ref:
                             x, y = cfx + cdx, cfy + cdy
@@ -1531,7 +1413,7 @@ class AIRIS(object):
                         except KeyError:
                             predict_aux_ref = []
 
-                        pprint('checking ABS 6 '+str(predict_aux_ref), num_indents=num_indents + 1)
+                        pprint('checking ABS 6 %s', predict_aux_ref, num_indents=num_indents + 1)
 
                         for i, prior_val, posterior_val in predict_aux_ref:
                             check_model.update_aux_value(posterior_val, i)
@@ -1558,8 +1440,8 @@ class AIRIS(object):
                     print_vis_env(vis_change_array, title='Visual Difference:', num_indents=num_indents + 2)
                     change_x, change_y = np.nonzero(vis_prior_array)
                     vis_prior_found = len(change_x) > 0
-                    pprint('x pos of changes from prior to post:\t%s' % change_x, num_indents=num_indents + 2)
-                    pprint('y pos of changes from prior to post:\t%s' % change_y, num_indents=num_indents + 2)
+                    pprint('x pos of changes from prior to post:\t%s', change_x, num_indents=num_indents + 2)
+                    pprint('y pos of changes from prior to post:\t%s', change_y, num_indents=num_indents + 2)
 
                     # iterate over the changes in the visual environment
                     pprint('appending differences to self.vis_change_list:',
@@ -1580,7 +1462,7 @@ class AIRIS(object):
             else:
                 vis_change_found = False
 
-        pprint('Actual Visual Change List:   \t\t%s' % self.vis_change_list,
+        pprint('Actual Visual Change List:   \t\t%s', self.vis_change_list,
             num_indents=num_indents + 2)
 
         # do all the same stuff for the aux env
@@ -1598,13 +1480,13 @@ class AIRIS(object):
             num_indents=num_indents + 1, new_line_start=True)
         aux_change_index, = np.nonzero(aux_change_array)
         aux_change_found = len(aux_change_index) > 0
-        pprint('indexes of changes:\t\t%s' % aux_change_index, num_indents=num_indents + 2)
+        pprint('indexes of changes:\t\t%s', aux_change_index, num_indents=num_indents + 2)
 
         pprint('appending differences to self.aux_change_list',
             num_indents=num_indents + 1, new_line_start=True)
         pprint('key: [(index, prior_val, actual_posterior_val), ...]',
             num_indents=num_indents + 1)
-        pprint('aux_change_list = '+str(aux_change_index),
+        pprint('aux_change_list = %s', aux_change_index,
             num_indents=num_indents + 1)
 
         if aux_change_found:
@@ -1655,7 +1537,7 @@ class AIRIS(object):
                 self.aux_change_index = i
                 self.aux_change_list.append(copy.deepcopy(change_data))
 
-        pprint('Actual Auxiliary Change List:\t\t%s' % self.aux_change_list,
+        pprint('Actual Auxiliary Change List:\t\t%s', self.aux_change_list,
             num_indents=num_indents + 2)
 
         # include real values of all predicted aux changes
@@ -1700,16 +1582,13 @@ class AIRIS(object):
             if model.best_condition_dif > self.knowledge[model.best_condition_path + 'moe']:
                 self.knowledge[model.best_condition_path + 'moe'] = model.best_condition_dif
 
-        pprint('Actual + Predicted Visual Change List:   \t\t%s' % self.vis_change_list,
+        pprint('Actual + Predicted Visual Change List:   \t\t%s', self.vis_change_list,
             num_indents=num_indents + 2)
-        pprint('Actual + Predicted Auxiliary Change List:\t\t%s' % self.aux_change_list,
+        pprint('Actual + Predicted Auxiliary Change List:\t\t%s', self.aux_change_list,
             num_indents=num_indents + 2)
 
         # return if ANY changes were found
-        pprint('differences were%sfound, prediction %s. duration: %s' %
-            ((' ' if (vis_change_found or aux_change_found) else ' not '),
-            ('incorrect' if (vis_change_found or aux_change_found) else 'correct'),
-            (datetime.now() - start_time)),
+        pprint('differences were%sfound, prediction %s. duration: %s', ' ' if (vis_change_found or aux_change_found) else ' not ', 'incorrect' if (vis_change_found or aux_change_found) else 'correct', datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
 
         return vis_change_found or aux_change_found
@@ -1816,11 +1695,11 @@ class AIRIS(object):
                         self.focus_global_set.add(least_frequent_val)
 
             if condition_focus_value:
-                pprint('self.posterior_focus_value     %s' % self.posterior_focus_value, num_indents=num_indents + 2)
-                pprint('self.vis_change_index          %s' % self.vis_change_index, num_indents=num_indents + 2)
+                pprint('self.posterior_focus_value     %s', self.posterior_focus_value, num_indents=num_indents + 2)
+                pprint('self.vis_change_index          %s', self.vis_change_index, num_indents=num_indents + 2)
 
-                pprint('Focus Set: '+str(self.focus_global_set), num_indents=num_indents + 1)
-                pprint('Not Focus Set: '+str(self.not_focus_global_set), num_indents=num_indents + 1)
+                pprint('Focus Set: %s', self.focus_global_set, num_indents=num_indents + 1)
+                pprint('Not Focus Set: %s', self.not_focus_global_set, num_indents=num_indents + 1)
 
                 self.store_condition(last_action, last_output, '',
                                         condition_focus_value,
@@ -1833,7 +1712,7 @@ class AIRIS(object):
             focus_index, condition_focus_value, self.posterior_focus_value = \
             self.aux_change_list[0]
 
-            pprint('self.aux_change_list     %s' % self.aux_change_list, num_indents=num_indents + 2)
+            pprint('self.aux_change_list     %s', self.aux_change_list, num_indents=num_indents + 2)
 
             self.store_condition(last_action, last_output, 'A',
                                  condition_focus_value, focus_index=focus_index,
@@ -1841,7 +1720,7 @@ class AIRIS(object):
 
         self.goal_type = self.goal_type_default
 
-        pprint('condition created. duration: %s' % (datetime.now() - start_time),
+        pprint('condition created. duration: %s', datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
 
     def store_condition(self, action, output, A, condition_focus_value,
@@ -2043,7 +1922,7 @@ class AIRIS(object):
 
         #self.save_knowledge()
 
-        pprint('update complete. duration: %s' % (datetime.now() - start_time),
+        pprint('update complete. duration: %s', datetime.now() - start_time,
             num_indents=num_indents, new_line_start=True, draw_line=True)
 
     def compare_conditions(self, action, output, model_index, num_indents=0):
@@ -2054,100 +1933,74 @@ class AIRIS(object):
         start_time = datetime.now()
 
         model = self.models[model_index]
-        model_heap = copy.deepcopy(model.vis_count_heap)
-        vis_model = copy.deepcopy(model.vis_env)
-        aux_model = copy.deepcopy(model.aux_env)
+        model_heap = list(model.vis_count_heap)
+        vis_model = model.vis_env
+        aux_model = model.aux_env
         model.best_condition_id = None  # whip best condition just before we do a new prediction
         model.best_condition_dif = None
         condition_heap = []
         condition_count = {}
         condition_count_heap = []
         condition_count_max_value = None
-        pprint('original model focus_pos: ' + str(model.focus_pos), num_indents=num_indents + 1)
-        pprint(str(action), num_indents=num_indents + 1)
-        pprint('model_index = %s' % model_index, num_indents=num_indents + 1)
+        pprint('original model focus_pos: %s', model.focus_pos, num_indents=num_indents + 1)
+        pprint(action, num_indents=num_indents + 1)
+        pprint('model_index = %s', model_index, num_indents=num_indents + 1)
         path = str(action) + '/' + str(output)
-        pprint('path = ' + path, num_indents=num_indents + 1)
+        pprint('path = %s', path, num_indents=num_indents + 1)
         try:
             focus_list = self.knowledge[path]
         except KeyError:
             focus_list = []
 
         if focus_list:
+            # score every condition of each focus value against every position of that value at once
+            # scores: [(focus_value, condition_path, ConditionRefs, positions, differences), ...]
+            scores = []
             while model_heap:
                 _, heap_val = heapq.heappop(model_heap)
-                pprint('heap_val = ' + str(heap_val), num_indents=num_indents + 1)
+                pprint('heap_val = %s', heap_val, num_indents=num_indents + 1)
                 if str(heap_val) in focus_list:
                     model.focus_value = heap_val
-                    pprint('focus_value = ' + str(model.focus_value), num_indents=num_indents + 1)
+                    pprint('focus_value = %s', model.focus_value, num_indents=num_indents + 1)
                     condition_path = path + '/' + str(model.focus_value)
 
-                    try:
-                        for focus_x, focus_y in model.vis_count_pos[model.focus_value]:
-                            try:
-                                condition_list = self.knowledge[condition_path]
-                            except KeyError:
-                                condition_list = []
-
-                            for condition_id in condition_list:
-                                data_path = condition_path + '/' + str(condition_id) + '/'
-                                condition_dif = 0
-
-                                try:
-                                    for dx, dy, prior_val, _ in self.knowledge[data_path + 'vis_ref']:
-                                        x, y = focus_x + dx, focus_y + dy
-                                        if 0 <= x < len(vis_model) and 0 <= y < len(vis_model[0]):
-                                            if vis_model[x][y] != prior_val:
-                                                condition_dif += abs(vis_model[x][y] - prior_val)
-
-                                    try:
-                                        condition_count[model.focus_value] += 1
-                                    except KeyError:
-                                        condition_count[model.focus_value] = 1
-                                except KeyError:
-                                    pass
-
-                                try:
-                                    for i, prior_val, _ in self.knowledge[data_path + 'aux_ref']:
-                                        if i < len(aux_model):
-                                            if aux_model[i] != prior_val:
-                                                condition_dif += abs(aux_model[i] - prior_val)
-
-                                    try:
-                                        condition_count[model.focus_value] += 1
-                                    except KeyError:
-                                        condition_count[model.focus_value] = 1
-                                except KeyError:
-                                    pass
-
-                                heapq.heappush(condition_heap, (round(condition_dif, self.round_to), model.focus_value, condition_id, focus_x, focus_y, data_path))
-
-                                try:
-                                    if condition_count[model.focus_value]:
-                                        heapq.heappush(condition_count_heap, (round(condition_dif, self.round_to), model.focus_value, condition_id, focus_x, focus_y, data_path))
-                                except KeyError:
-                                    pass
-
-                    except KeyError:
-                        pass
+                    refs = self.condition_refs_for(condition_path)
+                    if refs is not None and refs.condition_ids:
+                        positions = np.array(list(model.vis_count_pos[model.focus_value]), dtype=np.int64)
+                        difs = refs.score(vis_model, aux_model, positions[:, 0], positions[:, 1], self.round_to)
+                        scores.append((model.focus_value, condition_path, refs, positions, difs))
+                        if refs.ref_list_count:
+                            condition_count[model.focus_value] = len(positions) * refs.ref_list_count
+
+            # only the conditions tied for the smallest difference are ever taken off the heaps below,
+            # so only they are put on them
+            if condition_count:
+                condition_count_max_value = max(condition_count, key=lambda key: condition_count[key])
+                for focus_value, condition_path, refs, positions, difs in scores:
+                    if focus_value == condition_count_max_value:
+                        condition_count_heap = self.tied_conditions(focus_value, condition_path, refs, positions,
+                                                                    difs, refs.counted(len(positions)))
+            if scores:
+                best_dif = min(difs.min() for _, _, _, _, difs in scores)
+                for focus_value, condition_path, refs, positions, difs in scores:
+                    condition_heap.extend(self.tied_conditions(focus_value, condition_path, refs, positions,
+                                                               difs, difs == best_dif))
+                condition_heap.sort()
 
             if condition_count_heap:
-                condition_count_max_value = max(condition_count, key=lambda key: condition_count[key])
-                condition_count_heap = [i for i in condition_count_heap if i[1] == condition_count_max_value]
-                heapq.heapify(condition_count_heap)
                 pprint('condition heap post-prune:', num_indents=num_indents + 1)
-                pprint(str(condition_count_heap), num_indents=num_indents + 1)
+                pprint(condition_count_heap, num_indents=num_indents + 1)
                 model.best_condition_dif = condition_count_heap[0][0]
-                pprint('best_condition_dif: '+str(condition_count_heap[0][0]), num_indents=num_indents + 1)
+                pprint('best_condition_dif: %s', condition_count_heap[0][0], num_indents=num_indents + 1)
                 model.focus_value = condition_count_heap[0][1]
-                pprint('focus_value: '+str(condition_count_heap[0][1]), num_indents=num_indents + 1)
+                pprint('focus_value: %s', condition_count_heap[0][1], num_indents=num_indents + 1)
                 model.focus_value_is_aux = False
                 model.best_condition_id = condition_count_heap[0][2]
-                pprint('best_condition_id: ' + str(condition_count_heap[0][2]), num_indents=num_indents + 1)
+                pprint('best_condition_id: %s', condition_count_heap[0][2], num_indents=num_indents + 1)
                 model.focus_pos = (condition_count_heap[0][3], condition_count_heap[0][4])
-                pprint('updated model focus_pos: ' + str(model.focus_pos), num_indents=num_indents + 1)
+                pprint('updated model focus_pos: %s', model.focus_pos, num_indents=num_indents + 1)
                 model.best_condition_path = condition_count_heap[0][5]
-                pprint('best_condition_path: ' + str(condition_heap[0][5]), num_indents=num_indents + 1)
+                pprint('best_condition_path: %s', condition_heap[0][5], num_indents=num_indents + 1)
                 heapq.heappop(condition_count_heap)
 
                 if condition_count_heap:
@@ -2165,7 +2018,7 @@ class AIRIS(object):
                                 else:
                                     j = 0
 
-                                pprint('i / j: ' + str(i) + '/' + str(j), num_indents=num_indents + 1)
+                                pprint('i / j: %s/%s', i, j, num_indents=num_indents + 1)
 
                                 vis_model = self.knowledge[path + 'vis_data']
                                 aux_model = self.knowledge[path + 'aux_data']
@@ -2189,15 +2042,15 @@ class AIRIS(object):
                                         if ind < len(aux_model):
                                             if aux_model[ind] != prior_val:
                                                 competing_dif[i] += abs(aux_model[ind] - prior_val)
-                                                pprint('competing_aux_dif ' + str(i), num_indents=num_indents + 1)
+                                                pprint('competing_aux_dif %s', i, num_indents=num_indents + 1)
                                         else:
                                             competing_dif[i] += prior_val
-                                            pprint('competing_aux_dif' + str(i), num_indents=num_indents + 1)
+                                            pprint('competing_aux_dif%s', i, num_indents=num_indents + 1)
                                 except KeyError:
                                     pass
 
-                            pprint('competing_dif: ' + str(competing_dif), num_indents=num_indents + 1)
-                            pprint('competing_data_path: ' + str(competing_data_path), num_indents=num_indents + 1)
+                            pprint('competing_dif: %s', competing_dif, num_indents=num_indents + 1)
+                            pprint('competing_data_path: %s', competing_data_path, num_indents=num_indents + 1)
 
                             if competing_dif[1] < competing_dif[0]:
                                 model.best_condition_dif = condition_count_heap[0][0]
@@ -2206,8 +2059,8 @@ class AIRIS(object):
                                 model.best_condition_id = condition_count_heap[0][2]
                                 model.focus_pos = (condition_count_heap[0][3], condition_count_heap[0][4])
                                 model.best_condition_path = condition_count_heap[0][5]
-                                pprint('updated model focus_pos: ' + str(model.focus_pos), num_indents=num_indents + 1)
-                                pprint('updated model best condition: ' + str(model.best_condition_id), num_indents=num_indents + 1)
+                                pprint('updated model focus_pos: %s', model.focus_pos, num_indents=num_indents + 1)
+                                pprint('updated model best condition: %s', model.best_condition_id, num_indents=num_indents + 1)
                                 heapq.heappop(condition_count_heap)
                             else:
                                 pprint('Keeping original best condition.', num_indents=num_indents + 1)
@@ -2221,16 +2074,16 @@ class AIRIS(object):
 
             elif condition_heap:
                 pprint('No condition_count_heap!', num_indents=num_indents + 1)
-                pprint(str(condition_heap), num_indents=num_indents + 1)
+                pprint(condition_heap, num_indents=num_indents + 1)
                 model.best_condition_dif = condition_heap[0][0]
-                pprint('best_condition_dif: '+str(condition_heap[0][0]), num_indents=num_indents + 1)
+                pprint('best_condition_dif: %s', condition_heap[0][0], num_indents=num_indents + 1)
                 model.focus_value = condition_heap[0][1]
-                pprint('focus_value: '+str(condition_heap[0][1]), num_indents=num_indents + 1)
+                pprint('focus_value: %s', condition_heap[0][1], num_indents=num_indents + 1)
                 model.focus_value_is_aux = False
                 model.best_condition_id = condition_heap[0][2]
-                pprint('best_condition_id: ' + str(condition_heap[0][2]), num_indents=num_indents + 1)
+                pprint('best_condition_id: %s', condition_heap[0][2], num_indents=num_indents + 1)
                 model.focus_pos = (condition_heap[0][3], condition_heap[0][4])
-                pprint('updated model focus_pos: ' + str(model.focus_pos), num_indents=num_indents + 1)
+                pprint('updated model focus_pos: %s', model.focus_pos, num_indents=num_indents + 1)
                 model.best_condition_path = condition_heap[0][5]
                 heapq.heappop(condition_heap)
 
@@ -2260,8 +2113,8 @@ class AIRIS(object):
                                 model.best_condition_id = condition_heap[0][2]
                                 model.focus_pos = (condition_heap[0][3], condition_heap[0][4])
                                 model.best_condition_path = condition_heap[0][5]
-                                pprint('updated model focus_pos: ' + str(model.focus_pos), num_indents=num_indents + 1)
-                                pprint('updated model best condition: ' + str(model.best_condition_id), num_indents=num_indents + 1)
+                                pprint('updated model focus_pos: %s', model.focus_pos, num_indents=num_indents + 1)
+                                pprint('updated model best condition: %s', model.best_condition_id, num_indents=num_indents + 1)
                                 heapq.heappop(condition_heap)
                             else:
                                 pprint('Keeping original best condition.', num_indents=num_indents + 1)
@@ -2380,12 +2233,38 @@ class AIRIS(object):
                     pass
 
 
-        pprint('model.best_condition_id = ' + str(model.best_condition_id), num_indents=num_indents + 1)
-        pprint('model.best_condition_path = ' + str(model.best_condition_path), num_indents=num_indents + 1)
-        pprint('difference found. duration: %s' % (datetime.now() - start_time),
+        pprint('model.best_condition_id = %s', model.best_condition_id, num_indents=num_indents + 1)
+        pprint('model.best_condition_path = %s', model.best_condition_path, num_indents=num_indents + 1)
+        pprint('difference found. duration: %s', datetime.now() - start_time,
             num_indents=1, new_line_start=True, draw_line=True)
 
 
+    # the compiled refs of the conditions stored under condition_path, None if there are none
+    def condition_refs_for(self, condition_path):
+        try:
+            condition_list = self.knowledge[condition_path]
+        except KeyError:
+            return None
+        refs = self.condition_refs.get(condition_path)
+        if refs is None or refs.condition_list is not condition_list:
+            refs = self.condition_refs[condition_path] = ConditionRefs(condition_list)
+        refs.refresh(self.knowledge, condition_path)
+        return refs
+
+    # heap entries, sorted, of the conditions scored in difs whose difference is the smallest of those selected
+    # entry: (difference, focus_value, condition_id, focus_x, focus_y, data_path)
+    def tied_conditions(self, focus_value, condition_path, refs, positions, difs, selected):
+        if not selected.any():
+            return []
+        best_dif = difs[selected].min()
+        tied = []
+        for p, k in zip(*np.nonzero(selected & (difs == best_dif))):
+            condition_id = refs.condition_ids[k]
+            tied.append((difs[p, k], focus_value, condition_id, int(positions[p, 0]), int(positions[p, 1]),
+                         condition_path + '/' + str(condition_id) + '/'))
+        tied.sort()
+        return tied
+
     def save_knowledge(self):
         # Save
         np.save('Knowledge.npy', self.knowledge)
@@ -15,7 +15,7 @@ class AIRIS(object):
 
         # clear logfile
         if DEBUG_WITH_LOGFILE:
-            open(DEBUG_LOGFILE_PATH, 'w').close()
+            clear_debug_log()
 
         pprint('initializing AIRIS ...', new_line_start=True, draw_line=False)
         start_time = datetime.now()
@@ -144,7 +144,7 @@ class AIRIS(object):
             if action_plan:
                 pprint('Action Plan:\n%d actions' % len(self.action_plan))
                 for goal_action, goal_output in self.action_plan:
-                    pprint(goal_action, goal_output)
+                    pprint('%s %s', goal_action, goal_output)
 
             pprint('\\--------------------------------------------------------/\n')
 
@@ -615,7 +615,7 @@ class AIRIS(object):
                 pprint('Pruning found knowledge:', num_indents=num_indents + 2)
                 for knowledge_focus in knowledge_found:
                     if knowledge_focus[0] != 'A':
-                        if float(knowledge_focus) not in model.vis_count_list:
+                        if float(knowledge_focus) not in model.vis_count:
                             pprint('focus value ' + str(knowledge_focus) + ' not in visual count', num_indents=num_indents + 3)
                             knowledge_prune.append(knowledge_focus)
 
@@ -662,7 +662,7 @@ class AIRIS(object):
                 if not model.focus_value_is_aux:
                     # (x, y) position of a model.focus_value in the
                     # list of positions for that value in the model
-                    model.focus_pos = model.vis_count_pos[float(model.focus_value)][0]
+                    model.focus_pos = model.first_position(float(model.focus_value))
                 model.focus_value = float(model.focus_value[1:]) if \
                     model.focus_value_is_aux else float(model.focus_value)
                 self.goal_focus_value = copy.deepcopy(model.focus_value)
@@ -1242,14 +1242,13 @@ class AIRIS(object):
 
             # Update focus value if previous models focus value no longer exists
             if not focus_found:
-                focus_heap = copy.deepcopy(model.vis_count_heap)
-                count_pos = copy.deepcopy(model.vis_count_pos)
+                focus_heap = list(model.vis_count_heap)
 
                 if self.focus_global_set:
                     while focus_heap and not focus_found:
                         if focus_heap[0][1] in self.focus_global_set:
                             model.focus_value = focus_heap[0][1]
-                            model.focus_pos = count_pos[model.focus_value][0]
+                            model.focus_pos = model.first_position(model.focus_value)
                             focus_found = True
                         else:
                             heapq.heappop(focus_heap)
@@ -1263,15 +1262,14 @@ class AIRIS(object):
                         self.knowledge[model.source_condition_path + 'post_vis_data'],
                         self.knowledge[model.source_condition_path + 'post_aux_data'])
 
-                    focus_heap = copy.deepcopy(model.vis_count_heap)
-                    count_pos = copy.deepcopy(model.vis_count_pos)
+                    focus_heap = list(model.vis_count_heap)
                     focus_found = False
 
                     if self.focus_global_set:
                         while focus_heap and not focus_found:
                             if focus_heap[0][1] in self.focus_global_set:
                                 model.focus_value = focus_heap[0][1]
-                                model.focus_pos = count_pos[model.focus_value][0]
+                                model.focus_pos = model.first_position(model.focus_value)
                                 focus_found = True
                             else:
                                 heapq.heappop(focus_heap)
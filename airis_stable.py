@@ -1,11 +1,18 @@
 import copy
 import numpy as np
 import heapq
-from state import State
-from copy import deepcopy
-from collections import defaultdict
+from state import State, fingerprint, board_changes, CHANGE_2D
+from knowledge_store import KnowledgeStore, Exception1D, signature_offsets
+from knowledge_journal import KnowledgeJournal
+from rule_kernels import ValueKernel, PaddedBoard, stencil
+from planner_pool import PlannerPool
+from plan_budget import PlanBudget
+from plan_search import PlanSearch
+from debug_trace import Tracer, Lazy, board_text
+from collections import defaultdict, OrderedDict
 from operator import itemgetter
 import uuid
+import math
 import time
 
 
@@ -14,6 +21,11 @@ class AIRIS(object):
     def __init__(self, input_1d, input_2d, action_space):
         self.input_1D = input_1d
         self.input_2D = input_2d
+        # The last observed board as a NumPy array, self.input_2D holds the same board as nested lists
+        self.input_array = np.array(input_2d)
+        # self.input_array and the board observed after the last action, with borders to read conditions off
+        self.input_board = PaddedBoard(self.input_array)
+        self.observed_board = self.input_board
         self.action_space = action_space
         self.given_goal_state = [[], []]
         self.best_state = 0
@@ -25,7 +37,8 @@ class AIRIS(object):
         self.action_plan = []
         self.round_to = 1
         self.last_change_1D = []
-        self.last_change_2D = []
+        # Cells changed by the last action, a state.CHANGE_2D array
+        self.last_change_2D = np.empty(0, dtype=CHANGE_2D)
         self.pos_change_2D = []
         self.goal_reached = False
         self.goal_condition = None
@@ -33,9 +46,13 @@ class AIRIS(object):
         self.observe_mode = False
         self.idx2D = None
         self.innovate = False
-        self.debug = False
+        # Debug records by channel (see debug_trace.py), all off. Setting debug turns them all on
+        self.trace = Tracer()
+        # Compare every state fingerprint against the full text of the boards it was seen with (slow, for debugging)
+        self.check_fingerprints = False
+        self.fingerprint_texts = dict()
         self.last_action = None
-        self.knowledge = dict()
+        self.knowledge = KnowledgeStore()
         self.applied_rules = set()
         self.applied_rules_loc = set()
         self.applied_exceptions = set()
@@ -45,63 +62,130 @@ class AIRIS(object):
         self.prev_action = None
         self.error_stop = False
         self.error_counter = 0
+        # Least recently used predictions, keyed by (state fingerprint, changed positions, action). Each holds the
+        # knowledge generation it was predicted at and the values whose rules it read, see valid_prediction()
+        self.prediction_cache = OrderedDict()
+        self.prediction_cache_size = 2048
+        self.prediction_cache_hits = 0
+        self.prediction_cache_misses = 0
+        # Entries dropped because the rules they read changed
+        self.prediction_cache_stale = 0
+        # Values whose rules the last predict() call read
+        self.prediction_values = frozenset()
+        # (knowledge generation and goal, goal_rules() result) of the last goal compare scored states against
+        self.goal_rule_cache = None
+        # Predictions and plans are written to ./predict_log and ./plan_log for minds_eye.py, on a background thread
+        self.log_predictions = True
+        self.log_plans = True
+        # With planner_processes > 0, make_plan predicts the successors of the state it expands and of the next
+        # planner_prefetch - 1 states of its frontier on a pool of worker processes (see planner_pool.py). Every
+        # planner_probe_every-th batch is predicted in process instead, and the pool switches itself off (setting
+        # planner_processes to 0) once its predictions turn out slower than those
+        self.planner_processes = 0
+        self.planner_prefetch = 8
+        self.planner_probe_every = 10
+        self.planner_pool = None
+        # Batches prefetched, and the seconds and predictions of the ones run on the pool and of the ones run in process
+        self.planner_batches = 0
+        self.planner_timing = [0.0, 0, 0.0, 0]
+        # Memory budget of a make_plan search (see plan_budget.py), 0 turns a limit off. plan_states_dropped and
+        # plan_states_peak are the states the last search dropped and the most it held at once
+        self.plan_max_states = 250000
+        self.plan_max_mb = 0
+        self.plan_states_dropped = 0
+        self.plan_states_dropped_total = 0
+        self.plan_states_peak = 0
+        # With plan_deadline_ms > 0 a make_plan search that runs longer stops there and plans to the best state found
+        # so far. Its frontier is kept in plan_search and the next call carries on with it (see plan_search.py)
+        self.plan_deadline_ms = 0
+        self.plan_search = None
+        # Saves between full knowledge snapshots, the saves in between only append the edited records to a journal
+        self.knowledge_compact_every = 500
+        self.journal = None
+
+    # True while any trace channel takes debug records. Setting it turns all of them on, printed to the console, or off
+    @property
+    def debug(self):
+        return self.trace.active()
+
+    @debug.setter
+    def debug(self, value):
+        if value:
+            self.trace.enable()
+        else:
+            self.trace.disable()
 
     # This function is used to communicate back and forth with an environment. It is called twice by the environment.
     # Once before an action is performed to get the current environment and return the action to perform back to the environment
     # And once after the action is taken to process the changes that occurred
+    # input_2d can be nested lists or a NumPy array
     def capture_input(self, input_1d, input_2d, action, state, prior):
 
         # If this is the first call to the function from the environment
         if prior:
             starttime = time.time()
-            if self.debug: print('\nCURRENT TIME', starttime, '\n')
+            if self.trace.capture: self.trace.debug('capture', '\nCURRENT TIME', starttime, '\n')
             self.input_1D = input_1d.copy()
-            self.input_2D = deepcopy(input_2d)
+            self.input_array = np.array(input_2d)
+            self.input_2D = self.input_array.tolist()
+            self.input_board = PaddedBoard(self.input_array)
 
             # This creates a dict of all the positions of each value for faster reference than searching the input
             self.idx2D = defaultdict(list)
-            for pos, val in np.ndenumerate(self.input_2D):
+            for pos, val in np.ndenumerate(self.input_array):
                 self.idx2D[val].append(pos)
 
+            # If a search ran out of time, carry on with it from the state the partial plan reached
+            if self.plan_search is not None and not self.observe_mode:
+                base_state = State(self.input_1D, self.input_array, self.idx2D, None, 0, 0, self.pos_change_2D, self.prev_action)
+                self.action_plan = []
+                states = self.plan_search.rebase(self.states, base_state)
+                if states is None:
+                    if self.trace.capture: self.trace.debug('capture', 'partial plan state not reached, starting a new search')
+                    self.plan_search = None
+                    states = [base_state]
+                self.states = states
+
             # If there is no action plan to perform or if its in observation mode, initialize the state graph
-            if not self.action_plan or self.observe_mode:
-                if self.debug: print('base state prev action', self.prev_action)
-                self.states = [State(self.input_1D, self.input_2D, self.idx2D, None, 0, 0, self.pos_change_2D, self.prev_action)]
+            elif not self.action_plan or self.observe_mode:
+                if self.trace.capture: self.trace.debug('capture', 'base state prev action', self.prev_action)
+                self.plan_search = None
+                self.states = [State(self.input_1D, self.input_array, self.idx2D, None, 0, 0, self.pos_change_2D, self.prev_action)]
 
             if self.given_goal_state and not self.observe_mode:
                 # If there is no plan, make one, then return the first action
                 if not self.action_plan:
                     self.make_plan(self.given_goal_state, False)
                     if self.action_plan:
-                        if self.debug: print('planned')
-                        if self.debug: print('capture input prior time:', round(time.time() - starttime, 10))
+                        if self.trace.capture: self.trace.debug('capture', 'planned')
+                        if self.trace.capture: self.trace.debug('capture', 'capture input prior time:', round(time.time() - starttime, 10))
                         return self.action_plan.pop()
 
                 # If there is a plan, return the next action
                 else:
-                    if self.debug: print('capture input prior time:', round(time.time() - starttime, 10))
+                    if self.trace.capture: self.trace.debug('capture', 'capture input prior time:', round(time.time() - starttime, 10))
 
                     return self.action_plan.pop()
 
             else:
                 # A catch for a bug in the puzzle game where it can't handle more than one arrow key pressed at the same time
                 if action == 'nothing' and self.time_step != 0:
-                    if self.debug: print('Nothing event!')
+                    if self.trace.capture: self.trace.debug('capture', 'Nothing event!')
                     raise IndexError
                 new_state, predict_rule_2d, predict_rule_1d, uncertainty, exception_uncertainty, exceptions, no_rule_found = self.predict(action, 0, self.time_step)
-                if self.debug: print('predict_rule_2d', predict_rule_2d)
-                if self.debug: print('predict_rule_1d', predict_rule_1d)
-                if self.debug: print('uncertainty', uncertainty)
-                if self.debug: print('exception uncertainty', exception_uncertainty)
-                if self.debug: print('exceptions', exceptions)
+                if self.trace.capture: self.trace.debug('capture', 'predict_rule_2d', predict_rule_2d)
+                if self.trace.capture: self.trace.debug('capture', 'predict_rule_1d', predict_rule_1d)
+                if self.trace.capture: self.trace.debug('capture', 'uncertainty', uncertainty)
+                if self.trace.capture: self.trace.debug('capture', 'exception uncertainty', exception_uncertainty)
+                if self.trace.capture: self.trace.debug('capture', 'exceptions', exceptions)
                 self.states.append(new_state)
-                if self.debug: print('Observed Compare: ', self.compare(self.states[1], self.given_goal_state, False, 1))
+                if self.trace.capture: self.trace.debug('capture', 'Observed Compare: ', self.compare(self.states[1], self.given_goal_state, False, 1))
                 return action, 1
 
         # If this is the second call to the function from the environment
         else:
             starttime = time.time()
-            self.last_change_2D = []
+            self.last_change_2D = np.empty(0, dtype=CHANGE_2D)
             self.last_change_1D = []
             clear_plan = False
             self.last_action = action
@@ -112,18 +196,20 @@ class AIRIS(object):
             self.applied_exceptions_loc = set()
             except_1d_create = False
 
-            # Compare the environment state to the predicted state
-            holddif = np.subtract(input_2d, self.states[state].input_2D)
-            x2d, y2d = np.nonzero(holddif)
+            # The board is diffed as an array, the rules are learned from nested lists
+            observed = np.asarray(input_2d)
+            self.observed_board = PaddedBoard(observed)
+            if isinstance(input_2d, np.ndarray):
+                input_2d = input_2d.tolist()
 
-            holddif = np.subtract(input_1d, self.states[state].input_1D)
-            hd = np.nonzero(holddif)
+            # Compare the environment state to the predicted state
+            prediction_errors = board_changes(self.states[state].array(), observed, self.round_to)
 
             # If there is a discrepancy between the 2D environment and the 2D prediction
-            if len(x2d) or len(hd[0]):
-                for difi, difx in enumerate(x2d):
-                    key = str(difx) + ':' + str(y2d[difi])
-                    if self.debug: print('prediction error key', key)
+            if len(prediction_errors):
+                for difx, dify in zip(prediction_errors['x'].tolist(), prediction_errors['y'].tolist()):
+                    key = str(difx) + ':' + str(dify)
+                    if self.trace.capture: self.trace.debug('capture', 'prediction error key', key)
                     rule_data_exists = True
                     # See if there is an existing rule that was applied to the prediction
                     try:
@@ -139,15 +225,16 @@ class AIRIS(object):
                     # If there is an existing rule, update the rule with a new exception
                     if rule_data_exists:
                         try:
-                            if self.debug: print('error rule_data', rule_data)
-                            if self.debug: print('pre creating exception')
+                            if self.trace.capture: self.trace.debug('capture', 'error rule_data', rule_data)
+                            if self.trace.capture: self.trace.debug('capture', 'pre creating exception')
                             new_except = self.update_rule(rule_data, False, True, key, input_2d, input_1d, state, None, None, None, None)
-                            self.applied_exceptions.add(new_except[0])
-                            self.applied_exceptions_loc.add((new_except[1], difx, y2d[difi]))
-                            if self.debug: print('post creating exception')
-                            clear_plan = True
+                            if new_except is not None:
+                                self.applied_exceptions.add(new_except[0])
+                                self.applied_exceptions_loc.add((new_except[1], difx, dify))
+                                if self.trace.capture: self.trace.debug('capture', 'post creating exception')
+                                clear_plan = True
                         except IndexError:
-                            if self.debug: print('passing')
+                            if self.trace.capture: self.trace.debug('capture', 'passing')
                             pass
 
             # Do the same as above for the 1D data
@@ -160,15 +247,16 @@ class AIRIS(object):
                             loc_x = int(loc_key[0])
                             loc_y = int(loc_key[1])
                             if rule_data[7]:
-                                if self.debug: print(rule_data[7])
+                                if self.trace.capture: self.trace.debug('capture', rule_data[7])
                                 try:
                                     if di in rule_data[7].keys() and input_1d[di] - self.input_1D[di] != rule_data[7][di][0][2]:
                                         new_except = self.update_rule(rule_data, False, True, key, input_2d, input_1d, state, None, None, None, None)
-                                        self.applied_exceptions.add(new_except[0])
-                                        self.applied_exceptions_loc.add((new_except[1], loc_x, loc_y))
-                                        if self.debug: print('created 1d exception')
-                                        clear_plan = True
-                                        except_1d_create = True
+                                        if new_except is not None:
+                                            self.applied_exceptions.add(new_except[0])
+                                            self.applied_exceptions_loc.add((new_except[1], loc_x, loc_y))
+                                            if self.trace.capture: self.trace.debug('capture', 'created 1d exception')
+                                            clear_plan = True
+                                            except_1d_create = True
                                 except IndexError:
                                     pass
                     except KeyError:
@@ -181,48 +269,38 @@ class AIRIS(object):
                 loc_y = int(key[1])
                 if self.input_2D[loc_x][loc_y] == input_2d[loc_x][loc_y]:
                     exception_data = self.states[state].applied_exceptions[loc_key]
-                    if self.debug: print('pre updating exception')
+                    if self.trace.capture: self.trace.debug('capture', 'pre updating exception')
                     new_except = self.update_rule(exception_data, False, True, loc_key, input_2d, input_1d, state, None, None, None, None)
-                    self.applied_exceptions.add(new_except[0])
-                    self.applied_exceptions_loc.add((new_except[1], loc_x, loc_y))
-                    if self.debug: print('post updating exception')
+                    if new_except is not None:
+                        self.applied_exceptions.add(new_except[0])
+                        self.applied_exceptions_loc.add((new_except[1], loc_x, loc_y))
+                        if self.trace.capture: self.trace.debug('capture', 'post updating exception')
 
-            if input_2d:
+            if len(input_2d):
                 # Compare the previous environment state to the current environment state
-                holddif = np.subtract(input_2d, self.input_2D)
-                x2d, y2d = np.nonzero(holddif)
-
-                if len(x2d):
-                    self.pos_change_2D = []
-
-                for difi, difx in enumerate(x2d):
-                    self.pos_change_2D.append((difx, y2d[difi]))
-
-                holddif = np.subtract(input_1d, self.input_1D)
-                hd = np.nonzero(holddif)
+                self.last_change_2D = board_changes(self.input_array, observed, self.round_to)
 
-                if len(x2d) or len(hd[0]):
-                    for difi, difx in enumerate(x2d):
-                        self.last_change_2D.append([difx, y2d[difi], self.input_2D[difx][y2d[difi]], round(input_2d[difx][y2d[difi]] - self.input_2D[difx][y2d[difi]], self.round_to), input_2d[difx][y2d[difi]]])
+                if len(self.last_change_2D):
+                    self.pos_change_2D = list(zip(self.last_change_2D['x'].tolist(), self.last_change_2D['y'].tolist()))
 
-                    for di, data in enumerate(input_1d):
-                        if self.input_1D[di] != data:
-                            self.last_change_1D.append([di, self.input_1D[di], round(data - self.input_1D[di], self.round_to), data])
+                for di, data in enumerate(input_1d):
+                    if self.input_1D[di] != data:
+                        self.last_change_1D.append([di, self.input_1D[di], round(data - self.input_1D[di], self.round_to), data])
 
-            if self.debug: print('last change 2D', self.last_change_2D)
-            if self.debug: print('last change 1D', self.last_change_1D)
+            if self.trace.capture: self.trace.debug('capture', 'last change 2D', self.last_change_2D)
+            if self.trace.capture: self.trace.debug('capture', 'last change 1D', self.last_change_1D)
             # If there was a change, create a rule (discarding the new rule if the rule already exists)
-            for cox, coy, cod, cord, coad in self.last_change_2D:
+            for cox, coy, cod, cord, coad in self.last_change_2D.tolist():
                 rule_id = str(uuid.uuid4())[:6]
-                if input_2d[cox][coy] != self.states[state].input_2D[cox][coy]:
+                if input_2d[cox][coy] != self.states[state].get(cox, coy):
                     clear_plan = True
 
                 new_rule = self.create_rule(action, cox, coy, cod, cord, coad, rule_id, state, self.states[state].prev_state, self.input_1D, input_1d, self.input_2D, input_2d, self.time_step)
                 self.applied_rules.add(new_rule)
                 self.applied_rules_loc.add((new_rule, cox, coy))
-                if self.debug: print('Attempted to create rule', new_rule)
+                if self.trace.capture: self.trace.debug('capture', 'Attempted to create rule', new_rule)
 
-                if self.debug: print('last change 2D item', cox, coy, cod, cord, coad)
+                if self.trace.capture: self.trace.debug('capture', 'last change 2D item', cox, coy, cod, cord, coad)
 
             # If there was a rule applied to a location but no change occurred there, then create a "No change" rule
             for loc_key in self.states[state].applied_rules.keys():
@@ -233,11 +311,11 @@ class AIRIS(object):
                 loc_y = int(key[1])
                 if rule_data[1] == 'None' and self.input_2D[loc_x][loc_y] - input_2d[loc_x][loc_y] == 0:
                     new_rule = self.create_rule(action, loc_x, loc_y, self.input_2D[loc_x][loc_y], 0, input_2d[loc_x][loc_y], rule_id, state, self.states[state].prev_state, self.input_1D, input_1d, self.input_2D, input_2d, self.time_step)
-                    if self.debug: print('No change rule created', new_rule, rule_id)
+                    if self.trace.capture: self.trace.debug('capture', 'No change rule created', new_rule, rule_id)
 
-            if self.debug: print('self.applied_rules: ', self.applied_rules)
-            if self.debug: print('self.applied_exceptions: ', self.applied_exceptions)
-            if self.debug: print('self.prev_applied_rules: ', self.prev_applied_rules)
+            if self.trace.capture: self.trace.debug('capture', 'self.applied_rules: ', self.applied_rules)
+            if self.trace.capture: self.trace.debug('capture', 'self.applied_exceptions: ', self.applied_exceptions)
+            if self.trace.capture: self.trace.debug('capture', 'self.prev_applied_rules: ', self.prev_applied_rules)
             # Update all new rules with relevant data from other new rules
             self.update_rule(None, True, False, None, input_2d, None, None, self.applied_rules, None, self.prev_applied_rules, self.applied_rules_loc)
             # Update all new exceptions with relevant data from other new exceptions
@@ -251,77 +329,82 @@ class AIRIS(object):
 
             # If this was the last action in the plan, then add the previous state to state_history
             if not self.action_plan:
-                if (str(self.input_1D), str(self.input_2D), action) not in self.state_history:
-                    if self.debug: print('adding this state with', action)
-                    if self.debug: print('full state history addition', ((str(self.input_1D), str(self.input_2D)), action))
-                    if self.debug: print('Added to state history', self.time_step, action, self.input_1D, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
-                    if self.debug:
-                        format_state = deepcopy(self.input_2D)
-
-                        t_format = np.array(format_state).T
-
-                        for r, x in enumerate(t_format):
-                            x = ["%.0f" % i for i in x]
-                            for i, item in enumerate(x):
-                                if item == '0':
-                                    x[i] = '  '
-                                elif int(item) < 10:
-                                    x[i] = ' ' + x[i]
-                            if self.debug: print(x, r)
-                        if self.debug: print('')
-                        if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
-
-                self.state_history.add(((str(self.input_1D), str(self.input_2D)), action))
-                if self.debug: print('state history length ', len(self.state_history))
+                if (self.board_fingerprint(self.input_1D, self.input_2D), action) not in self.state_history:
+                    if self.trace.capture: self.trace.debug('capture', 'adding this state with', action)
+                    if self.trace.capture: self.trace.debug('capture', 'full state history addition', ((str(self.input_1D), str(self.input_2D)), action))
+                    if self.trace.capture: self.trace.debug('capture', 'Added to state history', self.time_step, action, self.input_1D, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
+                    if self.trace.capture: self.trace.debug('capture', Lazy(board_text, self.input_2D))
+
+                self.state_history.add((self.board_fingerprint(self.input_1D, self.input_2D), action))
+                if self.trace.capture: self.trace.debug('capture', 'state history length ', len(self.state_history))
 
             # If there was an unxpected change during plan execution, abandon the plan
             if clear_plan:
                 self.action_plan = []
+                self.plan_search = None
+            elif self.plan_search is not None:
+                self.plan_search.node = state
 
-            if self.debug: print('Actual state', self.time_step, action, input_1d, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
-            if self.debug:
-                format_state = deepcopy(input_2d)
-
-                t_format = np.array(format_state).T
+            if self.trace.capture: self.trace.debug('capture', 'Actual state', self.time_step, action, input_1d, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
+            if self.trace.capture: self.trace.debug('capture', Lazy(board_text, input_2d))
 
-                for r, x in enumerate(t_format):
-                    x = ["%.0f" % i for i in x]
-                    for i, item in enumerate(x):
-                        if item == '0':
-                            x[i] = '  '
-                        elif int(item) < 10:
-                            x[i] = ' ' + x[i]
-                    if self.debug: print(x, r)
-                if self.debug: print('')
-                if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
-
-            if self.debug: print('++++++++++ capture input post time', round(time.time() - starttime, 10))
+            if self.trace.capture: self.trace.debug('capture', '++++++++++ capture input post time', round(time.time() - starttime, 10))
             self.time_step += 1
             self.prev_action = action
 
-    def make_plan(self, given_goal, generated):
+    # With deadline_ms (plan_deadline_ms by default) the search stops after that many milliseconds and plans to the
+    # state partial_plan_state() picks. Its frontier is kept in plan_search for the next call
+    def make_plan(self, given_goal, generated, deadline_ms=None):
         starttime = time.time()
+        if deadline_ms is None:
+            deadline_ms = self.plan_deadline_ms
+        deadline = None
+        if deadline_ms:
+            deadline = time.perf_counter() + deadline_ms / 1000
+        resume = self.plan_search
+        self.plan_search = None
+        if resume is not None and resume.goal != str(given_goal):
+            resume = None
         self.goal_reached = True
 
         self.current_state = 0
         self.best_state = 0
         dupes = 0
+        budget = PlanBudget(self.plan_max_states, self.plan_max_mb)
+        for index, state in enumerate(self.states):
+            budget.add(index, state)
         compare_diff, best_action, self.goal_reached = self.compare(self.states[0], given_goal, generated, 0)
-        if self.debug: print('error goal reached', compare_diff, best_action, self.goal_reached)
+        if self.trace.plan: self.trace.debug('plan', 'error goal reached', compare_diff, best_action, self.goal_reached)
         if self.goal_reached:
             self.best_action = best_action
             goal_state, predict_rules_2d, predict_rules_1d, _, _, _, no_rule_found = self.predict(self.best_action, self.best_state, self.states[self.best_state].step + 1)
-            if (self.states[self.best_state].hash(), self.best_action) not in self.state_history and not goal_state.anti_goal:
+            if (self.state_fingerprint(self.states[self.best_state]), self.best_action) not in self.state_history and not goal_state.anti_goal:
                 self.states.append(goal_state)
+                budget.add(len(self.states) - 1, goal_state)
                 self.best_state = len(self.states) - 1
-                if self.debug: print('Goal action from base state not in history')
+                if self.trace.plan: self.trace.debug('plan', 'Goal action from base state not in history')
             else:
                 self.goal_reached = False
         state_heap = [(0, self.current_state, 0)]
         confidence_heap = []
-        state_set = {(self.states[0].hash(), None)}
+        state_set = {(self.state_fingerprint(self.states[0]), None)}
         depth = 0
+        if resume is not None:
+            if self.trace.plan: self.trace.debug('plan', 'resuming search', len(self.states), len(resume.state_heap), len(resume.confidence_heap))
+            state_heap = resume.state_heap
+            confidence_heap = resume.confidence_heap
+            depth = resume.depth
+            for state in self.states[1:]:
+                if state is not None:
+                    state_set.add(self.state_fingerprint(state))
+        expansions = 0
         while not self.goal_reached:
+            if deadline is not None and expansions and state_heap and depth < self.plan_depth and time.perf_counter() >= deadline:
+                self.plan_search = PlanSearch(str(given_goal), state_heap, confidence_heap, depth)
+                self.best_state = self.partial_plan_state(state_heap)
+                if self.trace.plan: self.trace.debug('plan', 'Plan deadline reached', deadline_ms, 'partial plan to', self.best_state)
+                break
+            expansions += 1
             depth += 1
 
             if state_heap and depth <= self.plan_depth:
@@ -329,7 +412,7 @@ class AIRIS(object):
             else:
                 if depth > self.plan_depth:
                     self.plan_depth += 1000
-                    if self.debug: print('Plan limit reached', self.plan_depth)
+                    if self.trace.plan: self.trace.debug('plan', 'Plan limit reached', self.plan_depth)
                     far = sorted(confidence_heap, key=itemgetter(1))
                     find_state = -1
                     while self.states[far[find_state][1]].anti_goal:
@@ -337,60 +420,36 @@ class AIRIS(object):
                     self.best_state = far[find_state][1]
 
 
-                    if self.debug: print('Trying furthest state')
-                    format_state = deepcopy(self.states[self.states[self.best_state].prev_state].input_2D)
-
-                    t_format = np.array(format_state).T
-
-                    for r, x in enumerate(t_format):
-                        x = ["%.0f" % i for i in x]
-                        for i, item in enumerate(x):
-                            if item == '0':
-                                x[i] = '  '
-                            elif int(item) < 10:
-                                x[i] = ' ' + x[i]
-                        if self.debug: print(x, r)
-                    if self.debug: print('')
-                    if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
+                    if self.trace.plan: self.trace.debug('plan', 'Trying furthest state')
+                    if self.trace.plan: self.trace.debug('plan', Lazy(board_text, self.states[self.states[self.best_state].prev_state].input_2D))
                 else:
-                    if self.debug: print('no more states', len(confidence_heap), depth, self.plan_depth)
+                    if self.trace.plan: self.trace.debug('plan', 'no more states', len(confidence_heap), depth, self.plan_depth)
                     if confidence_heap:
-                        if self.debug: print('confidence heap ', confidence_heap)
+                        if self.trace.plan: self.trace.debug('plan', 'confidence heap ', confidence_heap)
                         self.best_state = heapq.heappop(confidence_heap)[1]
-                        while confidence_heap and (self.states[self.states[self.best_state].prev_state].hash(), self.states[self.best_state].action) in self.state_history:
-                            if self.debug: print('confidence heap ', confidence_heap)
-                            if self.debug: print('in history ', self.best_state, self.states[self.best_state].prev_state, self.states[self.best_state].action)
-                            if self.debug:
-                                format_state = deepcopy(self.states[self.states[self.best_state].prev_state].input_2D)
-
-                                t_format = np.array(format_state).T
-
-                                for r, x in enumerate(t_format):
-                                    x = ["%.0f" % i for i in x]
-                                    for i, item in enumerate(x):
-                                        if item == '0':
-                                            x[i] = '  '
-                                        elif int(item) < 10:
-                                            x[i] = ' ' + x[i]
-                                    if self.debug: print(x, r)
-                                if self.debug: print('')
-                                if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
+                        while confidence_heap and (self.state_fingerprint(self.states[self.states[self.best_state].prev_state]), self.states[self.best_state].action) in self.state_history:
+                            if self.trace.plan: self.trace.debug('plan', 'confidence heap ', confidence_heap)
+                            if self.trace.plan: self.trace.debug('plan', 'in history ', self.best_state, self.states[self.best_state].prev_state, self.states[self.best_state].action)
+                            if self.trace.plan: self.trace.debug('plan', Lazy(board_text, self.states[self.states[self.best_state].prev_state].input_2D))
 
                             self.best_state = heapq.heappop(confidence_heap)[1]
                         if not confidence_heap:
-                            if (self.states[self.states[self.best_state].prev_state].hash(), self.states[self.best_state].action) in self.state_history:
-                                if self.debug: print('All unknowns already in history. Resetting history')
+                            if (self.state_fingerprint(self.states[self.states[self.best_state].prev_state]), self.states[self.best_state].action) in self.state_history:
+                                if self.trace.plan: self.trace.debug('plan', 'All unknowns already in history. Resetting history')
                                 self.state_history = set()
 
                             self.plan_depth += 10
                     else:
-                        if self.debug: print('no more confidence heap. Increasing plan depth')
+                        if self.trace.plan: self.trace.debug('plan', 'no more confidence heap. Increasing plan depth')
                         self.plan_depth += 1
                 break
 
+            if self.planner_processes:
+                self.prefetch_predictions([self.current_state] + [entry[1] for entry in heapq.nsmallest(self.planner_prefetch - 1, state_heap)])
+
             for act in self.action_space:
                 new_state, predict_rules_2d, predict_rules_1d, _, _, _, no_rule_found = self.predict(act, self.current_state, self.states[self.current_state].step + 1)
-                check_hash = new_state.hash()
+                check_hash = self.state_fingerprint(new_state)
                 confidence = 0
                 total_predictions = len(predict_rules_2d.keys())
 
@@ -407,14 +466,15 @@ class AIRIS(object):
                     confidence = (predict_sum + exception_sum) / (total_predictions + total_exceptions)
 
                 new_state.confidence = confidence
-                if self.debug: print('Confidence of prediction  = ', confidence)
+                if self.trace.plan: self.trace.debug('plan', 'Confidence of prediction  = ', confidence)
 
                 compare_diff, best_action, _ = self.compare(new_state, given_goal, generated, len(self.states) - 1)
 
                 if check_hash not in state_set:
-                    if self.debug: print('not a duplicate state')
+                    if self.trace.plan: self.trace.debug('plan', 'not a duplicate state')
                     state_set.add(check_hash)
                     self.states.append(new_state)
+                    budget.add(len(self.states) - 1, new_state)
                     self.best_state = len(self.states) - 1
 
                     if compare_diff is not None:
@@ -422,144 +482,156 @@ class AIRIS(object):
                             self.goal_reached = True
 
                     if self.goal_reached and not new_state.anti_goal:
-                        if self.debug: print('GOAL REACHED')
+                        if self.trace.plan: self.trace.debug('plan', 'GOAL REACHED')
                         self.best_state = len(self.states) - 1
                         self.best_action = best_action
                         goal_state, predict_rules_2d, predict_rules_1d, _, _, _, no_rule_found = self.predict(self.best_action, self.best_state, self.states[self.best_state].step + 1)
 
-                        if (self.states[self.best_state].hash(), self.best_action) not in self.state_history and not goal_state.anti_goal:
+                        if (self.state_fingerprint(self.states[self.best_state]), self.best_action) not in self.state_history and not goal_state.anti_goal:
                             self.states.append(goal_state)
+                            budget.add(len(self.states) - 1, goal_state)
                             self.best_state = len(self.states) - 1
-                            if self.debug: print('Goal action not in history, breaking', self.best_state, self.best_action, self.states[self.best_state].action)
+                            if self.trace.plan: self.trace.debug('plan', 'Goal action not in history, breaking', self.best_state, self.best_action, self.states[self.best_state].action)
                             break
                         else:
-                            if self.debug: print('Goal action in history, continuing to plan')
+                            if self.trace.plan: self.trace.debug('plan', 'Goal action in history, continuing to plan')
                             if not new_state.anti_goal or confidence != 1:
                                 if confidence == 1 and not new_state.anti_goal:
                                     heapq.heappush(state_heap, (new_state.step, len(self.states) - 1, new_state.step))
-                                    if self.debug: print('added to state heap 1')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to state heap 1')
                                 if confidence == 1 and no_rule_found:
                                     heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
-                                    if self.debug: print('no rule added to confidence heap')
+                                    if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                                 elif confidence != 1:
                                     heapq.heappush(confidence_heap, (confidence, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 1')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 1')
 
                             else:
                                 if confidence == 1 and no_rule_found:
                                     heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
 
-                                    if self.debug: print('no rule added to confidence heap')
+                                    if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                                 elif confidence != 1:
                                     heapq.heappush(confidence_heap, (confidence + 1000, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 2')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 2')
 
                             self.goal_reached = False
                     else:
                         if self.goal_reached:
                             self.goal_reached = False
-                            if self.debug: print('goal reached in history')
-                        if self.debug: print('State not yet predicted, adding')
-                        if self.debug: print('heap conditions', new_state.anti_goal, confidence, compare_diff, no_rule_found)
+                            if self.trace.plan: self.trace.debug('plan', 'goal reached in history')
+                        if self.trace.plan: self.trace.debug('plan', 'State not yet predicted, adding')
+                        if self.trace.plan: self.trace.debug('plan', 'heap conditions', new_state.anti_goal, confidence, compare_diff, no_rule_found)
                         if not new_state.anti_goal or confidence != 1:
                             if confidence == 1 and not new_state.anti_goal:
                                 if compare_diff is not None:
                                     heapq.heappush(state_heap, (compare_diff + new_state.step, len(self.states) - 1, new_state.step))
-                                    if self.debug: print('added to state heap 3')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to state heap 3')
                                 else:
                                     heapq.heappush(state_heap, (new_state.step, len(self.states) - 1, new_state.step))
-                                    if self.debug: print('added to state heap 4')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to state heap 4')
                             if confidence == 1 and no_rule_found:
                                 if compare_diff is not None:
                                     heapq.heappush(confidence_heap, (0.99 + compare_diff + 1, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 5')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 5')
                                 else:
                                     heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 6')
-                                if self.debug: print('no rule added to confidence heap')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 6')
+                                if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                             elif confidence != 1:
                                 if compare_diff is not None:
                                     heapq.heappush(confidence_heap, (confidence + compare_diff, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 7')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 7')
                                 else:
                                     heapq.heappush(confidence_heap, (confidence, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 8')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 8')
 
                         else:
                             if confidence == 1 and no_rule_found:
                                 if compare_diff is not None:
                                     heapq.heappush(confidence_heap, (0.99 + compare_diff + 1, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 9')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 9')
                                 else:
                                     heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 10')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 10')
 
-                                if self.debug: print('no rule added to confidence heap')
+                                if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                             elif confidence == 1 and new_state.anti_goal:
                                 if compare_diff is not None:
                                     heapq.heappush(confidence_heap, (confidence + 6000 + compare_diff, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 13')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 13')
                                 else:
                                     heapq.heappush(confidence_heap, (confidence + 6000, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 14')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 14')
                             elif confidence != 1:
                                 if compare_diff is not None:
                                     heapq.heappush(confidence_heap, (confidence + 1000 + compare_diff, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 15')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 15')
                                 else:
                                     heapq.heappush(confidence_heap, (confidence + 1000, len(self.states) - 1))
-                                    if self.debug: print('added to confidence heap 16')
+                                    if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 16')
 
                 else:
                     dupes += 1
-                    if self.debug: print('State already predicted', new_state.action, self.goal_reached)
+                    if self.trace.plan: self.trace.debug('plan', 'State already predicted', new_state.action, self.goal_reached)
                     self.states.append(new_state)
-                    if self.debug: print('heap conditions', new_state.anti_goal, confidence, compare_diff)
+                    budget.add(len(self.states) - 1, new_state, True)
+                    if self.trace.plan: self.trace.debug('plan', 'heap conditions', new_state.anti_goal, confidence, compare_diff)
                     if not new_state.anti_goal or confidence != 1:
                         if confidence == 1 and no_rule_found:
                             if compare_diff is not None:
                                 heapq.heappush(confidence_heap, (0.99 + compare_diff + 1, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 17')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 17')
                             else:
                                 heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 18')
-                            if self.debug: print('no rule added to confidence heap')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 18')
+                            if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                         elif confidence != 1:
                             if compare_diff is not None:
                                 heapq.heappush(confidence_heap, (confidence + compare_diff, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 19')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 19')
                             else:
                                 heapq.heappush(confidence_heap, (confidence, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 20')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 20')
 
                     else:
                         if confidence == 1 and no_rule_found:
                             if compare_diff is not None:
                                 heapq.heappush(confidence_heap, (0.99 + compare_diff + 1, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 21')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 21')
                             else:
                                 heapq.heappush(confidence_heap, (0.99, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 22')
-                            if self.debug: print('no rule added to confidence heap')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 22')
+                            if self.trace.plan: self.trace.debug('plan', 'no rule added to confidence heap')
                         if confidence == 1 and new_state.anti_goal:
                             if compare_diff is not None:
                                 heapq.heappush(confidence_heap, (confidence + 6000 + compare_diff, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 23')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 23')
                             else:
                                 heapq.heappush(confidence_heap, (confidence + 6000, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 24')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 24')
                         elif confidence != 1:
                             if compare_diff is not None:
                                 heapq.heappush(confidence_heap, (confidence + 1000 + compare_diff, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 25')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 25')
                             else:
                                 heapq.heappush(confidence_heap, (confidence + 1000, len(self.states) - 1))
-                                if self.debug: print('added to confidence heap 26')
+                                if self.trace.plan: self.trace.debug('plan', 'added to confidence heap 26')
 
-            if self.debug: print('planning debug - state heap', len(state_heap), 'conf heap', len(confidence_heap), 'goal reached', self.goal_reached)
+            if not self.goal_reached and budget.over():
+                budget.trim(self.states, state_heap, confidence_heap, {0, self.current_state, self.best_state})
+                if self.trace.plan: self.trace.debug('plan', 'planning memory budget reached, states held / dropped:', budget.live, budget.dropped)
+
+            if self.trace.plan: self.trace.debug('plan', 'planning debug - state heap', len(state_heap), 'conf heap', len(confidence_heap), 'goal reached', self.goal_reached)
+
+        # The rest of a search that ran out of time may not lead anywhere from the state the AI is in now
+        if resume is not None and self.best_state == 0 and not self.goal_reached and self.plan_search is None:
+            if self.trace.plan: self.trace.debug('plan', 'resumed search found nothing, starting a new search')
+            self.states = [self.states[0]]
+            return self.make_plan(given_goal, generated, deadline_ms)
 
         if self.best_state != 0 or (self.goal_reached and self.best_state == 0):
-            if self.debug: print('best state', self.best_state)
+            if self.trace.plan: self.trace.debug('plan', 'best state', self.best_state)
             self.action_plan = [(self.states[self.best_state].action, self.best_state)]
             prev_state = self.states[self.best_state].prev_state
             current_act = None
@@ -572,38 +644,43 @@ class AIRIS(object):
                 if prev_state > 0:
                     current_act = self.states[prev_state].action
 
-            if self.debug: print('Action Plan: ', self.action_plan)
+            if self.trace.plan: self.trace.debug('plan', 'Action Plan: ', self.action_plan)
 
             for plan in self.action_plan:
-                with open('./plan_log/' + str(self.time_step) + '.txt', 'a') as f:
-                    f.write(str(self.states[plan[1]].input_2D) + '\n')
+                if self.log_plans:
+                    self.trace.write('./plan_log/' + str(self.time_step) + '.txt', self.states[plan[1]].input_2D)
 
-                if self.debug: print('plan state', plan[1], self.states[plan[1]].action, self.states[plan[1]].applied_rule_ids, self.states[plan[1]].compare, self.states[plan[1]].anti_goal, self.states[plan[1]].input_1D, self.states[plan[1]].step, self.plan_depth, self.states[plan[1]].confidence, self.states[plan[1]].last_pos_change_2d, '+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+')
-                if self.debug:
-                    format_state = deepcopy(self.states[plan[1]].input_2D)
+                if self.trace.plan: self.trace.debug('plan', 'plan state', plan[1], self.states[plan[1]].action, self.states[plan[1]].applied_rule_ids, self.states[plan[1]].compare, self.states[plan[1]].anti_goal, self.states[plan[1]].input_1D, self.states[plan[1]].step, self.plan_depth, self.states[plan[1]].confidence, self.states[plan[1]].last_pos_change_2d, '+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+')
+                if self.trace.plan: self.trace.debug('plan', Lazy(board_text, self.states[plan[1]].input_2D))
 
-                    t_format = np.array(format_state).T
+        if self.trace.plan: self.trace.debug('plan', '++++++++++ make plan time:', round(time.time() - starttime, 10))
+        self.plan_states_dropped = budget.dropped
+        self.plan_states_dropped_total += budget.dropped
+        self.plan_states_peak = budget.peak
+        if self.trace.plan: self.trace.debug('plan', '---------- make plan states / dupes / dropped:', len(self.states), dupes, budget.dropped)
 
-                    for r, x in enumerate(t_format):
-                        x = ["%.0f" % i for i in x]
-                        for i, item in enumerate(x):
-                            if item == '0':
-                                x[i] = '  '
-                            elif int(item) < 10:
-                                x[i] = ' ' + x[i]
-                        if self.debug: print(x, r)
-                    if self.debug: print('')
-                    if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
-
-        if self.debug: print('++++++++++ make plan time:', round(time.time() - starttime, 10))
-        if self.debug: print('---------- make plan states / dupes:', len(self.states), dupes)
+    # The state a search that ran out of time plans to: the next state it would have expanded. The AI only takes the
+    # first step towards it before the search carries on, and heading for the top of confidence_heap instead explored
+    # away from the goal (1 level solved in 300 steps with a 20 ms deadline, against 3)
+    def partial_plan_state(self, state_heap):
+        return state_heap[0][1]
 
     def predict(self, act, base_state, step):
         starttime = time.time()
+        cache_key = self.prediction_cache_key(act, base_state)
+        cached = self.valid_prediction(cache_key)
+        if cached is not None:
+            self.prediction_cache.move_to_end(cache_key)
+            self.prediction_cache_hits += 1
+            if self.trace.predict: self.trace.debug('predict', 'prediction cache hit', act, base_state, self.prediction_cache_hits, self.prediction_cache_misses)
+            self.prediction_values = cached[1]
+            return self.cached_prediction(cached[2], act, base_state)
+        self.prediction_cache_misses += 1
+
         if self.states[base_state].action is None:
-            predict_state = State(self.states[base_state].input_1D, self.states[base_state].input_2D, self.states[base_state].input_2D_idx, act, base_state, self.states[base_state].step + 1, self.states[base_state].last_pos_change_2d, self.states[base_state].prev_action)
+            predict_state = self.states[base_state].branch(act, base_state, self.states[base_state].step + 1, self.states[base_state].last_pos_change_2d, self.states[base_state].prev_action)
         else:
-            predict_state = State(self.states[base_state].input_1D, self.states[base_state].input_2D, self.states[base_state].input_2D_idx, act, base_state, self.states[base_state].step + 1, self.states[base_state].last_pos_change_2d, self.states[base_state].action)
+            predict_state = self.states[base_state].branch(act, base_state, self.states[base_state].step + 1, self.states[base_state].last_pos_change_2d, self.states[base_state].action)
         state_pos_change_2D = self.states[base_state].last_pos_change_2d
         predict_heap_2d = []
         predict_rule_2d = dict()
@@ -612,344 +689,115 @@ class AIRIS(object):
         act_found = False
         no_rule_found = False
         no_rule_count = 0
+        exception_heap = []
+        # Values whose rules the prediction read, the prediction is only stale once one of them changes
+        values = set()
 
-        if len(predict_state.input_2D) > 0:
+        if predict_state.shape[0] > 0:
             check_pos = []
             orig_pos = set()
             check_set = set()
             if state_pos_change_2D:
-                if self.debug: print('checking last changed positions')
+                if self.trace.predict: self.trace.debug('predict', 'checking last changed positions')
                 check_pos = copy.deepcopy(state_pos_change_2D)
                 orig_pos = set(copy.deepcopy(state_pos_change_2D))
                 check_set = set(copy.deepcopy(state_pos_change_2D))
             else:
-                if self.debug: print('checking all positions')
-                for x, vx in enumerate(predict_state.input_2D):
-                    for y, vy in enumerate(predict_state.input_2D[x]):
+                if self.trace.predict: self.trace.debug('predict', 'checking all positions')
+                width, height = predict_state.shape[:2]
+                for x in range(width):
+                    for y in range(height):
                         check_pos.append((x, y))
                 orig_pos = set(copy.deepcopy(check_pos))
                 check_set = set(copy.deepcopy(check_pos))
 
+            board = PaddedBoard(predict_state.array())
+            prepared = dict()
+            scored = dict()
+            self.score_positions(board, check_pos, act, predict_state.input_1D, self.states[base_state].input_1D, prepared, scored)
+
             heapq.heapify(check_pos)
 
             while len(check_pos):
                 pos = heapq.heappop(check_pos)
-                if self.debug: print(pos[0], pos[1])
-                try:
-                    val = predict_state.input_2D[pos[0]][pos[1]]
-                except IndexError:
+                if self.trace.predict: self.trace.debug('predict', pos[0], pos[1])
+                if not board.inside(pos[0], pos[1]):
                     continue
-                rules = []
+                val = predict_state.get(pos[0], pos[1])
+                values.add(val)
+                value_rules = self.knowledge.value_rules(val)
 
-                try:
-                    rules = self.knowledge['2d/' + str(val)]
-                except KeyError:
-                    pass
-
-                if len(rules) > 0:
-                    if self.debug: print('\npos', pos, val)
+                if value_rules is not None and value_rules.groups:
+                    if self.trace.predict: self.trace.debug('predict', '\npos', pos, val)
                     dix = pos[0]
                     diy = pos[1]
+                    pos_key = str(dix) + ':' + str(diy)
 
-                    for ri, rule in enumerate(rules):
-                        match = 0
-                        uncertainty = 0
-                        abs_pos = False
-                        match_count = 0
-                        condition_group = self.knowledge['2d/' + str(val) + '/' + str(rule)]
-                        exception_heap = []
-                        if self.debug: print('checking rule ', rule)
+                    if pos not in scored:
+                        self.score_positions(board, [pos], act, predict_state.input_1D, self.states[base_state].input_1D, prepared, scored)
+                    kernel, usable, change_types, rule_1d_predictions, _ = prepared[val]
+                    match_row, uncertainty_row, inside_row, exception_row, exception_uncertainty_row = scored[pos]
 
-                        if self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/combined']:
-                            if self.debug: print('rule combined, skipping')
-                            continue
-
-                        try:
-                            if str(dix) + ':' + str(diy) in self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/apos'].keys():
-                                abs_pos = True
-                                if self.debug: print('abs pos found')
-                            else:
-                                if len(self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/apos'].keys()) != 0:
-                                    match_count += 1
-                                    if self.debug: print('abs pos not found')
-                                    continue
-                        except KeyError:
-                            pass
+                    # Groups without the action were always skipped, so only the usable ones are looked at
+                    for gi in usable:
+                        group = value_rules.groups[gi]
+                        rule = group.id
+                        abs_pos = False
+                        condition_group = group.index
+                        if self.trace.predict: self.trace.debug('predict', 'checking rule ', rule)
 
-                        try:
-                            rel_condition_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/inclusions/rel']
-                            for ci, condition in enumerate(rel_condition_data):
-                                crx, cry, cod, cor = condition
-                                if predict_state.input_2D[dix + crx][diy + cry] == cod:
-                                    pass
-                        except IndexError:
+                        if group.combined:
+                            if self.trace.predict: self.trace.debug('predict', 'rule combined, skipping')
                             continue
 
-                        try:
-                            act_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/act'][act]
-                            if act_data[0] / act_data[1] == 1:
-                                match += 1
-                                match_count += 1
-                                if self.debug: print('act found', match, match_count)
-                                act_found = True
+                        if pos_key in group.apos:
+                            abs_pos = True
+                            if self.trace.predict: self.trace.debug('predict', 'abs pos found')
+                        else:
+                            if len(group.apos) != 0:
+                                if self.trace.predict: self.trace.debug('predict', 'abs pos not found')
+                                continue
 
-                        except KeyError:
-                            if len(self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/act'].keys()) == 0:
-                                match += 1
-                            match_count += 1
-                            if self.debug: print('act not found', match, match_count)
+                        # A condition off the board rules out the whole rule at this position
+                        if not inside_row[gi]:
                             continue
 
-                        rel_heap = []
-                        rel_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/rel']
-                        for rel_key in self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/rel'].keys():
-                            heapq.heappush(rel_heap, (-(rel_data[rel_key][0] / rel_data[rel_key][1]), rel_key))
-
-                        change_type = ('rel', rel_heap[0][1])
-
-                        if change_type[1] == 0:
-                            match = match_count
-
-                        hold_rel = dict()
-
-                        rel_condition_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/inclusions/rel']
-
-                        for ci, condition in enumerate(rel_condition_data):
-                            crx, cry, cod, cor = condition
-                            try:
-                                if hold_rel[str(dix + crx) + ':' + str(diy + cry)]:
-                                    pass
-                            except KeyError:
-                                hold_rel[str(dix + crx) + ':' + str(diy + cry)] = []
-
-                            try:
-                                if self.debug: print('rule', rule, 'condition group', condition_group)
-                                if self.debug: print('rel condition data', rel_condition_data)
-                                if self.debug: print('CRX', crx, 'CRY', cry, 'COD', cod, 'ACTUAL', predict_state.input_2D[dix + crx][diy + cry])
-                                if predict_state.input_2D[dix + crx][diy + cry] == cod:
-                                    heapq.heappush(hold_rel[str(dix + crx) + ':' + str(diy + cry)], -1)
-                                else:
-                                    if cod != 0 and predict_state.input_2D[dix + crx][diy + cry] != 0:
-                                        if cod < predict_state.input_2D[dix + crx][diy + cry]:
-                                            heapq.heappush(hold_rel[str(dix + crx) + ':' + str(diy + cry)], -(cod / predict_state.input_2D[dix + crx][diy + cry]))
-                                        else:
-                                            heapq.heappush(hold_rel[str(dix + crx) + ':' + str(diy + cry)], -(predict_state.input_2D[dix + crx][diy + cry] / cod))
-                                    else:
-                                        heapq.heappush(hold_rel[str(dix + crx) + ':' + str(diy + cry)], 0)
-
-                            except IndexError:
-                                heapq.heappush(hold_rel[str(dix + crx) + ':' + str(diy + cry)], 0)
-
-                        for key in hold_rel.keys():
-                            if -(hold_rel[key][0]) != 1:
-                                match += -(hold_rel[key][0])
-                                if hold_rel[key][0] != 0:
-                                    uncertainty += -(hold_rel[key][0])
-                                else:
-                                    uncertainty += 1
-                            else:
-                                match += 1
-                            match_count += 1
-                            if self.debug: print('hold rel', match, match_count)
-
-                        predict_rule_1d = dict()
-                        try:
-                            rule_1d_data = self.knowledge['1d/' + rule]
-                            for di in rule_1d_data:
-                                predict_rule_1d[di] = []
-                                di_heap = []
-                                condition_group_1d = self.knowledge['1d/' + str(di) + '/' + str(rule)]
-                                oval_data = self.knowledge['1d/' + str(di) + '/' + str(condition_group_1d) + '/oval']
-                                oval = predict_state.input_1D[di]
-                                try:
-                                    check = oval_data[oval]
-                                    match += 1
-                                    match_count += 1
-                                    if self.debug: print('1d found', match, match_count)
-                                except KeyError:
-                                    for key in oval_data.keys():
-                                        if key != 0 and oval != 0:
-                                            if key > 0 and oval > 0:
-                                                if key < oval:
-                                                    heapq.heappush(di_heap, (-(key / oval), key))
-                                                else:
-                                                    heapq.heappush(di_heap, (-(oval / key), key))
-                                            elif key < 0 and oval < 0:
-                                                if key > oval:
-                                                    heapq.heappush(di_heap, (-(-key / -oval), key))
-                                                else:
-                                                    heapq.heappush(di_heap, (-(-oval / -key), key))
-                                            else:
-                                                if oval < 0:
-                                                    hold_val = -oval + key
-                                                    heapq.heappush(di_heap, (-(key / hold_val), key))
-                                                else:
-                                                    hold_val = -key + oval
-                                                    heapq.heappush(di_heap, (-(oval / hold_val), key))
-                                        else:
-                                            heapq.heappush(di_heap, (0, key))
-
-                                    if di_heap:
-                                        if -(di_heap[0][0]) != 1:
-                                            match += -(di_heap[0][0])
-                                            if di_heap[0][0] != 0:
-                                                uncertainty += -(di_heap[0][0])
-                                            else:
-                                                uncertainty += 1
-                                        else:
-                                            match += 1
-                                        match_count += 1
-                                        if self.debug: print('other 1d', di_heap[0][1], match, match_count)
-
-                                rel_1d_data = self.knowledge['1d/' + str(di) + '/' + str(condition_group_1d) + '/rel']
-                                for rel_key in rel_1d_data.keys():
-                                    heapq.heappush(predict_rule_1d[di], (-(rel_1d_data[rel_key][0] / rel_1d_data[rel_key][1]), 'rel', rel_key, condition_group_1d, self.states[base_state].input_1D[di]))
-
-                        except KeyError:
-                            pass
+                        change_type = change_types[gi]
+                        predict_rule_1d = rule_1d_predictions[gi]
+                        uncertainty = uncertainty_row[gi]
 
                         exception_heap = []
-                        group_exists = True
-                        try:
-                            exception_groups = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/exceptions']
-                        except KeyError:
-                            group_exists = False
-
-                        if group_exists:
-                            for exception_group in exception_groups:
-                                exception_match = 0
-                                exception_match_count = 0
-                                exception_uncertainty = 0
-
-                                exception_act_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/exceptions/' + str(exception_group) + '/act']
-
-                                try:
-                                    if exception_act_data[act][0] / exception_act_data[act][1] == 1:
-                                        exception_match += 1
-                                        exception_match_count += 1
-                                        if self.debug: print('ex act found', exception_match, exception_match_count)
-                                except KeyError:
-                                    if len(exception_act_data.keys()) == 0:
-                                        exception_match += 1
-                                    exception_match_count += 1
-                                    if self.debug: print('ex act not found', exception_match, exception_match_count)
-
-                                hold_except_rel = dict()
-                                exception_rel_condition_data = self.knowledge['2d/' + str(val) + '/' + str(condition_group) + '/exceptions/' + str(exception_group) + '/rel']
-
-                                for ci, condition in enumerate(exception_rel_condition_data):
-                                    crx, cry, cod, cor = condition
-
-                                    try:
-                                        if hold_except_rel[str(dix + crx) + ':' + str(diy + cry)]:
-                                            pass
-                                    except KeyError:
-                                        hold_except_rel[str(dix + crx) + ':' + str(diy + cry)] = []
-
-                                    try:
-                                        if predict_state.input_2D[dix + crx][diy + cry] == cod:
-                                            heapq.heappush(hold_except_rel[str(dix + crx) + ':' + str(diy + cry)], -1)
-                                        else:
-                                            if cod != 0 and predict_state.input_2D[dix + crx][diy + cry] != 0:
-                                                if cod < predict_state.input_2D[dix + crx][diy + cry]:
-                                                    heapq.heappush(hold_except_rel[str(dix + crx) + ':' + str(diy + cry)], -(cod / predict_state.input_2D[dix + crx][diy + cry]))
-                                                else:
-                                                    heapq.heappush(hold_except_rel[str(dix + crx) + ':' + str(diy + cry)], -(predict_state.input_2D[dix + crx][diy + cry] / cod))
-                                            else:
-                                                heapq.heappush(hold_except_rel[str(dix + crx) + ':' + str(diy + cry)], 0)
-                                    except IndexError:
-                                        heapq.heappush(hold_except_rel[str(dix + crx) + ':' + str(diy + cry)], 0)
-
-                                for key in hold_except_rel.keys():
-                                    if -(hold_except_rel[key][0]) != 1:
-                                        exception_match += -(hold_except_rel[key][0])
-                                        if hold_except_rel[key][0] != 0:
-                                            exception_uncertainty += -(hold_except_rel[key][0])
-                                        else:
-                                            exception_uncertainty += 1
-                                    else:
-                                        exception_match += 1
-                                    exception_match_count += 1
-                                    if self.debug: print('ex hold_rel', exception_match, exception_match_count)
-
-                                try:
-                                    rule_1d_data = self.knowledge['1d/' + rule]
-                                    for di in rule_1d_data:
-                                        di_heap = []
-                                        condition_group_1d = self.knowledge['1d/' + str(di) + '/' + str(rule)]
-                                        oval_data = self.knowledge['1d/' + str(di) + '/' + str(condition_group_1d) + '/exceptions/' + str(exception_group) + '/oval']
-                                        oval = predict_state.input_1D[di]
-                                        try:
-                                            check = oval_data[oval]
-                                            exception_match += 1
-                                            exception_match_count += 1
-                                            if self.debug: print('ex 1d found', exception_match, exception_match_count)
-                                        except KeyError:
-                                            for key in oval_data.keys():
-                                                if key != 0 and oval != 0:
-                                                    if key > 0 and oval > 0:
-                                                        if key < oval:
-                                                            heapq.heappush(di_heap, (-(key / oval), key))
-                                                        else:
-                                                            heapq.heappush(di_heap, (-(oval / key), key))
-                                                    elif key < 0 and oval < 0:
-                                                        if key > oval:
-                                                            heapq.heappush(di_heap, (-(-key / -oval), key))
-                                                        else:
-                                                            heapq.heappush(di_heap, (-(-oval / -key), key))
-                                                    else:
-                                                        if oval < 0:
-                                                            hold_val = -oval + key
-                                                            heapq.heappush(di_heap, (-(key / hold_val), key))
-                                                        else:
-                                                            hold_val = -key + oval
-                                                            heapq.heappush(di_heap, (-(oval / hold_val), key))
-                                                else:
-                                                    heapq.heappush(di_heap, (0, key))
-
-                                            if di_heap:
-                                                if -(di_heap[0][0]) != 1:
-                                                    exception_match += -(di_heap[0][0])
-                                                    if di_heap[0][0] != 0:
-                                                        exception_uncertainty += -(di_heap[0][0])
-                                                    else:
-                                                        exception_uncertainty += 1
-                                                else:
-                                                    exception_match += 1
-                                                exception_match_count += 1
-                                                if self.debug: print('ex 1d other', di_heap[0][1], exception_match, exception_match_count, 'oval data', self.knowledge['1d/' + str(di) + '/' + str(condition_group_1d) + '/exceptions/' + str(exception_group) + '/oval'])
-
-                                except KeyError:
-                                    pass
-
-                                if self.debug: print('Exception Data: ', rule, exception_group, -(exception_match / exception_match_count))
-                                heapq.heappush(exception_heap, (-(exception_match / exception_match_count), rule, condition_group, exception_group, str(dix) + ':' + str(diy), exception_uncertainty, predict_rule_1d, dix, diy, val))
+                        start, end = kernel.exception_ranges[gi]
+                        for ei in range(start, end):
+                            exception_group = kernel.exceptions[ei].id
+                            if self.trace.predict: self.trace.debug('predict', 'Exception Data: ', rule, exception_group, exception_row[ei])
+                            heapq.heappush(exception_heap, (exception_row[ei], rule, condition_group, exception_group, pos_key, exception_uncertainty_row[ei], predict_rule_1d, dix, diy, val))
 
                         if exception_heap:
-                            heapq.heappush(predict_heap_2d, (-(match / match_count), rule, condition_group, change_type, abs_pos, str(dix) + ':' + str(diy), uncertainty, predict_rule_1d, dix, diy, exception_heap[0], val))
+                            heapq.heappush(predict_heap_2d, (match_row[gi], rule, condition_group, change_type, abs_pos, pos_key, uncertainty, predict_rule_1d, dix, diy, exception_heap[0], val))
                         elif change_type[1] == 0:
-                            heapq.heappush(predict_heap_2d, (-(match / match_count), rule, condition_group, change_type, abs_pos, str(dix) + ':' + str(diy), uncertainty, predict_rule_1d, dix, diy, [0], val))
+                            heapq.heappush(predict_heap_2d, (match_row[gi], rule, condition_group, change_type, abs_pos, pos_key, uncertainty, predict_rule_1d, dix, diy, [0], val))
                         else:
-                            heapq.heappush(predict_heap_2d, (-(match / match_count), rule, condition_group, change_type, abs_pos, str(dix) + ':' + str(diy), uncertainty, predict_rule_1d, dix, diy, [1], val))
-                        if self.debug: print('Rule ID', rule)
+                            heapq.heappush(predict_heap_2d, (match_row[gi], rule, condition_group, change_type, abs_pos, pos_key, uncertainty, predict_rule_1d, dix, diy, [1], val))
+                        if self.trace.predict: self.trace.debug('predict', 'Rule ID', rule)
                         try:
-                            if self.debug: print('exception match', exception_heap[0][0], str(dix) + ':' + str(diy))
+                            if self.trace.predict: self.trace.debug('predict', 'exception match', exception_heap[0][0], pos_key)
                         except IndexError:
-                            if self.debug: print('exception match', 'NONE', str(dix) + ':' + str(diy))
-                        if self.debug: print('prediction match', -(match / match_count), str(dix) + ':' + str(diy))
+                            if self.trace.predict: self.trace.debug('predict', 'exception match', 'NONE', pos_key)
+                        if self.trace.predict: self.trace.debug('predict', 'prediction match', match_row[gi], pos_key)
 
                     if not predict_heap_2d:
-                        if self.debug: print('no applicable rules found')
-                        heapq.heappush(predict_heap_2d, (-0.01, 'None', None, None, None, str(dix) + ':' + str(diy), 0, None, dix, diy, [0], val))
+                        if self.trace.predict: self.trace.debug('predict', 'no applicable rules found')
+                        heapq.heappush(predict_heap_2d, (-0.01, 'None', None, None, None, pos_key, 0, None, dix, diy, [0], val))
 
                     try:
-                        if self.debug: print('best pre-check exception match', predict_heap_2d[0][10][0], str(dix) + ':' + str(diy), predict_heap_2d[0][1])
-                        if self.debug: print('best pre-check prediction match', predict_heap_2d[0][0], str(dix) + ':' + str(diy), predict_heap_2d[0][1])
+                        if self.trace.predict: self.trace.debug('predict', 'best pre-check exception match', predict_heap_2d[0][10][0], pos_key, predict_heap_2d[0][1])
+                        if self.trace.predict: self.trace.debug('predict', 'best pre-check prediction match', predict_heap_2d[0][0], pos_key, predict_heap_2d[0][1])
 
                         best_result_2d = None
 
                         while predict_heap_2d[0][3] is not None and predict_heap_2d[0][3][1] == 0:
-                            if self.debug: print('best result is a no change rule')
+                            if self.trace.predict: self.trace.debug('predict', 'best result is a no change rule')
                             best_result_2d = [predict_heap_2d[0]]
                             best_predict = predict_heap_2d[0][0]
                             best_except = predict_heap_2d[0][10][0]
@@ -958,11 +806,11 @@ class AIRIS(object):
                                 break
 
                         if predict_heap_2d:
-                            if self.debug: print('predict_heap_2d[0][10]', predict_heap_2d[0][10])
+                            if self.trace.predict: self.trace.debug('predict', 'predict_heap_2d[0][10]', predict_heap_2d[0][10])
                             if predict_heap_2d[0][10][0] != 1:
-                                if self.debug: print('exception found', predict_heap_2d[0][10])
+                                if self.trace.predict: self.trace.debug('predict', 'exception found', predict_heap_2d[0][10])
                             else:
-                                if self.debug: print('no exceptions')
+                                if self.trace.predict: self.trace.debug('predict', 'no exceptions')
                                 best_result_2d = [predict_heap_2d[0]]
                                 best_predict = predict_heap_2d[0][0]
                                 best_except = predict_heap_2d[0][10][0]
@@ -986,38 +834,33 @@ class AIRIS(object):
                             except IndexError:
                                 pass
 
-                        if self.debug: print('best post-check exception match', best_result_2d[0][10][0], str(dix) + ':' + str(diy), best_result_2d[0][1])
-                        if self.debug: print('best post-check prediction match', best_result_2d[0][0], str(dix) + ':' + str(diy), best_result_2d[0][1])
+                        if self.trace.predict: self.trace.debug('predict', 'best post-check exception match', best_result_2d[0][10][0], pos_key, best_result_2d[0][1])
+                        if self.trace.predict: self.trace.debug('predict', 'best post-check prediction match', best_result_2d[0][0], pos_key, best_result_2d[0][1])
 
                         if best_result_2d[0][3] is not None and best_result_2d[0][3][1] == 0:
                             no_rule_count += 1
 
                         if best_result_2d[0][0] >= best_result_2d[0][10][0]:
-                            exceptions[str(dix) + ':' + str(diy)] = best_result_2d[0][10]
+                            exceptions[pos_key] = best_result_2d[0][10]
                         else:
-                            predict_rule_2d[str(dix) + ':' + str(diy)] = best_result_2d[0]
-                        if self.debug: print('check_pos check', (dix, diy) in orig_pos, best_result_2d[0][2], best_result_2d[0][10][0])
+                            predict_rule_2d[pos_key] = best_result_2d[0]
+                        if self.trace.predict: self.trace.debug('predict', 'check_pos check', (dix, diy) in orig_pos, best_result_2d[0][2], best_result_2d[0][10][0])
                         if (dix, diy) in orig_pos and best_result_2d[0][2] is not None and best_result_2d[0][10][0] != 0:
-                            rel_set_data = self.knowledge['2d/' + str(val) + '/' + str(best_result_2d[0][2]) + '/inclusions/rel_set']
+                            rel_set_data = value_rules.groups[best_result_2d[0][2]].inclusion_set
                             for cond in rel_set_data:
                                 crx, cry, cod, cor = cond
-                                if (dix + crx, diy + cry) not in check_set:
-                                    if dix + crx >= 0 and diy + cry >= 0:
-                                        try:
-                                            check = predict_state.input_2D[dix + crx][diy + cry]
-                                            if self.debug: print('check_pos 1 add ', str((dix + crx, diy + cry)))
-                                            check_pos.append((dix + crx, diy + cry))
-                                            check_set.add((dix + crx, diy + cry))
-                                        except IndexError:
-                                            pass
+                                if (dix + crx, diy + cry) not in check_set and board.inside(dix + crx, diy + cry):
+                                    if self.trace.predict: self.trace.debug('predict', 'check_pos 1 add ', str((dix + crx, diy + cry)))
+                                    check_pos.append((dix + crx, diy + cry))
+                                    check_set.add((dix + crx, diy + cry))
                     except IndexError:
                         pass
 
                     predict_heap_2d = []
 
-                if self.debug: print('check pos', check_pos)
-                if self.debug: print('check set', check_set)
-                if self.debug: print('orig pos', orig_pos)
+                if self.trace.predict: self.trace.debug('predict', 'check pos', check_pos)
+                if self.trace.predict: self.trace.debug('predict', 'check set', check_set)
+                if self.trace.predict: self.trace.debug('predict', 'orig pos', orig_pos)
 
         uncertainty = 0
         exception_uncertainty = 0
@@ -1037,7 +880,7 @@ class AIRIS(object):
 
             if predict_rule_2d[loc_key][3] is not None:
                 if predict_rule_2d[loc_key][3][0] == 'rel':
-                    predict_state.input_2D[loc_x][loc_y] += predict_rule_2d[loc_key][3][1]
+                    predict_state.set(loc_x, loc_y, predict_state.get(loc_x, loc_y) + predict_rule_2d[loc_key][3][1])
 
             predict_state.applied_rules[loc_key] = predict_rule_2d[loc_key]
             if predict_rule_2d[loc_key][1] != 'None' and predict_rule_2d[loc_key][3] is not None and predict_rule_2d[loc_key][10][0] != 0:
@@ -1048,11 +891,11 @@ class AIRIS(object):
             if predict_rule_2d[loc_key][3] is not None:
                 if not used_rules_1d and predict_rule_2d[loc_key][1] != 'None':
                     used_rules_1d.add(predict_rule_2d[loc_key][1])
-                    for mrule in self.knowledge['2d/' + str(predict_rule_2d[loc_key][11]) + '/' + str(predict_rule_2d[loc_key][2]) + '/mrules'].keys():
+                    for mrule in self.knowledge.values[predict_rule_2d[loc_key][11]].groups[predict_rule_2d[loc_key][2]].mrules.keys():
                         mrules_1d.add(mrule)
                     predict_1d = predict_rule_2d[loc_key][7]
-                    if self.debug: print('applied 1d rule', predict_rule_2d[loc_key][1])
-                    if self.debug: print('predict_1d', predict_1d)
+                    if self.trace.predict: self.trace.debug('predict', 'applied 1d rule', predict_rule_2d[loc_key][1])
+                    if self.trace.predict: self.trace.debug('predict', 'predict_1d', predict_1d)
                     for di_key in predict_1d.keys():
                         try:
                             if predict_1d[di_key][0][1] == 'rel':
@@ -1062,13 +905,13 @@ class AIRIS(object):
                         except IndexError:
                             pass
                 elif predict_rule_2d[loc_key][1] not in used_rules_1d and predict_rule_2d[loc_key][1] != 'None':
-                    if self.debug: print('used rules 1d', used_rules_1d)
-                    if self.debug: print('mrules 1d', mrules_1d)
+                    if self.trace.predict: self.trace.debug('predict', 'used rules 1d', used_rules_1d)
+                    if self.trace.predict: self.trace.debug('predict', 'mrules 1d', mrules_1d)
                     if predict_rule_2d[loc_key][1] not in mrules_1d:
                         used_rules_1d.add(predict_rule_2d[loc_key][1])
                         predict_1d = predict_rule_2d[loc_key][7]
-                        if self.debug: print('applied 1d rule', predict_rule_2d[loc_key][1])
-                        if self.debug: print('predict_1d', predict_1d)
+                        if self.trace.predict: self.trace.debug('predict', 'applied 1d rule', predict_rule_2d[loc_key][1])
+                        if self.trace.predict: self.trace.debug('predict', 'predict_1d', predict_1d)
                         for di_key in predict_1d.keys():
                             try:
                                 if predict_1d[di_key][0][1] == 'rel':
@@ -1077,195 +920,324 @@ class AIRIS(object):
                                         predict_state.anti_goal = True
                             except IndexError:
                                 pass
-                    for mrule in self.knowledge['2d/' + str(predict_rule_2d[loc_key][11]) + '/' + str(predict_rule_2d[loc_key][2]) + '/mrules'].keys():
+                    for mrule in self.knowledge.values[predict_rule_2d[loc_key][11]].groups[predict_rule_2d[loc_key][2]].mrules.keys():
                         mrules_1d.add(mrule)
 
-        if self.debug: print('final used rules 1d', used_rules_1d)
-        if self.debug: print('final mrules 1d', mrules_1d)
+        if self.trace.predict: self.trace.debug('predict', 'final used rules 1d', used_rules_1d)
+        if self.trace.predict: self.trace.debug('predict', 'final mrules 1d', mrules_1d)
 
         for loc_key in exceptions.keys():
             exception_uncertainty += exceptions[loc_key][5]
             predict_state.applied_exceptions[loc_key] = exceptions[loc_key]
             predict_state.applied_exception_ids.add(exceptions[loc_key][3])
 
-        predict_state.heap()
-
-        with open('./predict_log/' + str(self.time_step) + '.txt', 'a') as f:
-            f.write(str(predict_state.input_2D) + '\n')
 
-        if self.debug: print('Predict state', len(self.states), act, predict_state.input_1D, 'prev state', predict_state.prev_state, predict_state.prev_action, predict_state.anti_goal, predict_state.bad_rules, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
-        if self.debug:
-            format_state = deepcopy(predict_state.input_2D)
+        if self.log_predictions:
+            self.trace.write('./predict_log/' + str(self.time_step) + '.txt', predict_state.input_2D)
 
-            t_format = np.array(format_state).T
+        if self.trace.predict: self.trace.debug('predict', 'Predict state', len(self.states), act, predict_state.input_1D, 'prev state', predict_state.prev_state, predict_state.prev_action, predict_state.anti_goal, predict_state.bad_rules, '+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
+        if self.trace.predict: self.trace.debug('predict', Lazy(board_text, predict_state.input_2D))
 
-            for r, x in enumerate(t_format):
-                x = ["%.0f" % i for i in x]
-                for i, item in enumerate(x):
-                    if item == '0':
-                        x[i] = '  '
-                    elif int(item) < 10:
-                        x[i] = ' ' + x[i]
-                if self.debug: print(x, r)
-            if self.debug: print('')
-            if self.debug: print("[' 0', ' 1', ' 2', ' 3', ' 4', ' 5', ' 6', ' 7', ' 8', ' 9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19']")
-
-        if self.debug: print('predicted state last changes', predict_state.last_pos_change_2d)
-        if self.debug: print('predicted changes 2d:', predict_state.change_2D)
-        if self.debug: print('predicted changes 1d:', predict_state.change_1D)
+        if self.trace.predict: self.trace.debug('predict', 'predicted state last changes', predict_state.last_pos_change_2d)
+        if self.trace.predict: self.trace.debug('predict', 'predicted changes 2d:', predict_state.change_2D)
+        if self.trace.predict: self.trace.debug('predict', 'predicted changes 1d:', predict_state.change_1D)
         for key in predict_rule_2d.keys():
-            if self.debug: print('predict rule 2d', key, predict_rule_2d[key])
-            if self.debug: print('exception heap', exception_heap, '\n')
+            if self.trace.predict: self.trace.debug('predict', 'predict rule 2d', key, predict_rule_2d[key])
+            if self.trace.predict: self.trace.debug('predict', 'exception heap', exception_heap, '\n')
         for di in predict_rule_1d.keys():
-            if self.debug: print('predict rule 1d', di, predict_rule_1d[di], '\n')
+            if self.trace.predict: self.trace.debug('predict', 'predict rule 1d', di, predict_rule_1d[di], '\n')
 
-        if self.debug: print('++++++++++ predict', act, 'time:', round(time.time() - starttime, 10))
+        if self.trace.predict: self.trace.debug('predict', '++++++++++ predict', act, 'time:', round(time.time() - starttime, 10))
 
-        if self.debug: print('no rule check', len(predict_rule_2d.keys()), len(exceptions.keys()), no_rule_count)
+        if self.trace.predict: self.trace.debug('predict', 'no rule check', len(predict_rule_2d.keys()), len(exceptions.keys()), no_rule_count)
         if len(predict_rule_2d.keys()) + len(exceptions.keys()) == no_rule_count:
-            if self.debug: print('no_rule_found = True')
+            if self.trace.predict: self.trace.debug('predict', 'no_rule_found = True')
             no_rule_found = True
 
+        self.prediction_values = frozenset(values)
+        self.cache_prediction(cache_key, act, base_state, predict_state, predict_rule_2d, predict_rule_1d, uncertainty, exception_uncertainty, exceptions, no_rule_found, self.prediction_values)
+
         return predict_state, predict_rule_2d, predict_rule_1d, uncertainty, exception_uncertainty, exceptions, no_rule_found
 
+    # The changed positions are heapified before they are checked, so their order doesn't matter.
+    # The key leaves the knowledge out: an entry records the generation it was predicted at and the values whose rules
+    # it read, and valid_prediction() only drops it once the rules of one of those values change. Learning from a
+    # surprise mostly edits the rules of one or two values, so the search that replans after it still finds the
+    # predictions of the previous search that didn't involve them, and only predicts again where the edits matter
+    def prediction_cache_key(self, act, base_state):
+        return self.state_fingerprint(self.states[base_state]), tuple(sorted(self.states[base_state].last_pos_change_2d or ())), act
+
+    # The cached prediction of cache_key, None if there is none or the rules it read changed since
+    def valid_prediction(self, cache_key):
+        cached = self.prediction_cache.get(cache_key)
+        if cached is None:
+            return None
+        if not self.knowledge.unchanged_since(cached[0], cached[1]):
+            del self.prediction_cache[cache_key]
+            self.prediction_cache_stale += 1
+            return None
+        return cached
+
+    def cache_prediction(self, cache_key, act, base_state, predict_state, predict_rule_2d, predict_rule_1d, uncertainty, exception_uncertainty, exceptions, no_rule_found, values):
+        self.prediction_cache[cache_key] = self.knowledge.generation, values, ((predict_state.branch(act, base_state, predict_state.step, list(predict_state.last_pos_change_2d), predict_state.prev_action),
+                                             dict(predict_state.applied_rules), dict(predict_state.applied_exceptions), set(predict_state.applied_rule_ids), set(predict_state.applied_exception_ids),
+                                             predict_state.anti_goal, predict_state.no_change),
+                                            dict(predict_rule_2d), predict_rule_1d, uncertainty, exception_uncertainty, dict(exceptions), no_rule_found)
+        if len(self.prediction_cache) > self.prediction_cache_size:
+            self.prediction_cache.popitem(last=False)
+
+    # Predicts every action from each of the given states on the planner pool and caches the results, so the
+    # predict() calls make_plan makes for them are cache hits
+    def prefetch_predictions(self, states):
+        if self.planner_pool is None:
+            self.planner_pool = PlannerPool(self.planner_processes)
+
+        keys = []
+        tasks = []
+        for base_state in states:
+            # Only the fields predict reads from the base state are sent to the workers
+            base = self.states[base_state]
+            trimmed = base.branch(base.action, base.prev_state, base.step, base.last_pos_change_2d, base.prev_action)
+            for act in self.action_space:
+                cache_key = self.prediction_cache_key(act, base_state)
+                if self.valid_prediction(cache_key) is None and cache_key not in keys:
+                    keys.append(cache_key)
+                    tasks.append((base_state, trimmed, act))
+        if not tasks:
+            return
+
+        self.planner_batches += 1
+        probe = (self.planner_batches - 1) % self.planner_probe_every == 0
+        start = time.perf_counter()
+        if probe:
+            for base_state, _, act in tasks:
+                self.predict(act, base_state, self.states[base_state].step + 1)
+        else:
+            for cache_key, (base_state, _, act), result in zip(keys, tasks, self.planner_pool.predict(self.knowledge, self.action_space, tasks)):
+                self.cache_prediction(cache_key, act, base_state, *result)
+
+        timing = self.planner_timing
+        if probe:
+            timing[2] += time.perf_counter() - start
+            timing[3] += len(tasks)
+            if timing[1] and timing[0] / timing[1] > timing[2] / timing[3]:
+                if self.trace.plan: self.trace.debug('plan', 'planner pool slower than predicting in process, switching it off', timing)
+                self.close_planner_pool()
+                self.planner_processes = 0
+        else:
+            timing[0] += time.perf_counter() - start
+            timing[1] += len(tasks)
+
+    def close_planner_pool(self):
+        if self.planner_pool is not None:
+            self.planner_pool.close()
+            self.planner_pool = None
+        self.planner_batches = 0
+        self.planner_timing = [0.0, 0, 0.0, 0]
+
+    # Fingerprint of a state, the key of state_set, state_history and the prediction cache
+    def state_fingerprint(self, state):
+        key = state.hash()
+        if self.check_fingerprints:
+            self.check_fingerprint(key, state.text())
+        return key
+
+    # Fingerprint of an observed board, equal to the fingerprint of a state holding the same board
+    def board_fingerprint(self, input_1D, input_2D):
+        key = fingerprint(input_1D, input_2D)
+        if self.check_fingerprints:
+            self.check_fingerprint(key, (str(input_1D), str(input_2D)))
+        return key
+
+    def check_fingerprint(self, key, text):
+        if self.fingerprint_texts.setdefault(key, text) != text:
+            raise AssertionError('fingerprint collision: %s %r %r' % (key, text, self.fingerprint_texts[key]))
+
+    # Builds a fresh predicted state for base_state out of a cached prediction of the same board, action and knowledge
+    def cached_prediction(self, cached, act, base_state):
+        snapshot, predict_rule_2d, predict_rule_1d, uncertainty, exception_uncertainty, exceptions, no_rule_found = cached
+        template, applied_rules, applied_exceptions, applied_rule_ids, applied_exception_ids, anti_goal, no_change = snapshot
+        if self.states[base_state].action is None:
+            prev_action = self.states[base_state].prev_action
+        else:
+            prev_action = self.states[base_state].action
+        predict_state = template.branch(act, base_state, self.states[base_state].step + 1, list(template.last_pos_change_2d), prev_action)
+        predict_state.applied_rules = dict(applied_rules)
+        predict_state.applied_exceptions = dict(applied_exceptions)
+        predict_state.applied_rule_ids = set(applied_rule_ids)
+        predict_state.applied_exception_ids = set(applied_exception_ids)
+        predict_state.anti_goal = anti_goal
+        predict_state.no_change = no_change
+
+        if self.log_predictions:
+            self.trace.write('./predict_log/' + str(self.time_step) + '.txt', predict_state.input_2D)
+
+        return predict_state, dict(predict_rule_2d), predict_rule_1d, uncertainty, exception_uncertainty, dict(exceptions), no_rule_found
+
+    # Scores the rules of every value found at `positions` with one vectorized pass per value (see rule_kernels.py).
+    # prepared keeps the per value setup of the current prediction, scored the results per position
+    def score_positions(self, board, positions, act, input_1D, base_1D, prepared, scored):
+        by_value = dict()
+        for pos in positions:
+            val = float(board.grid[pos[0], pos[1]])
+            try:
+                by_value[val].append(pos)
+            except KeyError:
+                by_value[val] = [pos]
+
+        for val, value_positions in by_value.items():
+            value_rules = self.knowledge.value_rules(val)
+            if value_rules is None or not value_rules.groups:
+                continue
+
+            if val not in prepared:
+                if value_rules.kernel is None:
+                    value_rules.kernel = ValueKernel(value_rules.groups)
+                kernel = value_rules.kernel
+                usable = []
+                change_types = []
+                rule_1d_predictions = []
+                rule_terms = []
+                for gi, group in enumerate(kernel.groups):
+                    if act not in group.act:
+                        change_types.append(None)
+                        rule_1d_predictions.append(None)
+                        rule_terms.append(([], [], 0))
+                        continue
+                    usable.append(gi)
+                    rel_heap = []
+                    for rel_key in group.rel.keys():
+                        heapq.heappush(rel_heap, (-(group.rel[rel_key][0] / group.rel[rel_key][1]), rel_key))
+                    change_types.append(('rel', rel_heap[0][1]))
+                    match_terms, uncertainty_terms, match_count, predict_rule_1d = self.rule_1d_terms(group.id, None, input_1D, base_1D)
+                    rule_terms.append((match_terms, uncertainty_terms, match_count))
+                    rule_1d_predictions.append(predict_rule_1d)
+
+                exception_terms = []
+                for exception in kernel.exceptions:
+                    if act in exception.group.act:
+                        exception_terms.append(self.rule_1d_terms(exception.group.id, exception.id, input_1D, base_1D)[:3])
+                    else:
+                        exception_terms.append(([], [], 0))
+                prepared[val] = (kernel, usable, change_types, rule_1d_predictions, kernel.prepare(act, rule_terms, exception_terms))
+
+            kernel, usable, change_types, rule_1d_predictions, setup = prepared[val]
+            xs = np.array([pos[0] for pos in value_positions], dtype=np.int64)
+            ys = np.array([pos[1] for pos in value_positions], dtype=np.int64)
+            results = kernel.score(board, xs, ys, setup)
+            for pi, pos in enumerate(value_positions):
+                scored[pos] = tuple(result[pi] for result in results)
+
+    # Match terms of a rule's (or one of its exception groups') 1D conditions, plus the 1D changes the rule
+    # predicts. These don't depend on the board position so predict works them out once per value
+    def rule_1d_terms(self, rule, exception_group, input_1D, base_1D):
+        match_terms = []
+        uncertainty_terms = []
+        match_count = 0
+        predict_rule_1d = dict()
+        try:
+            rule_1d_data = self.knowledge.rule_dims[rule]
+            for di in rule_1d_data:
+                if exception_group is None:
+                    predict_rule_1d[di] = []
+                di_heap = []
+                rule_1d = self.knowledge.rule_1d(di, rule)
+                if exception_group is None:
+                    oval_data = rule_1d.oval
+                else:
+                    oval_data = rule_1d.exceptions[exception_group].oval
+                oval = input_1D[di]
+                if oval in oval_data:
+                    match_terms.append(1)
+                    match_count += 1
+                    if self.trace.predict: self.trace.debug('predict', '1d found', rule, exception_group, di)
+                else:
+                    for key in oval_data.keys():
+                        if key != 0 and oval != 0:
+                            if key > 0 and oval > 0:
+                                if key < oval:
+                                    heapq.heappush(di_heap, (-(key / oval), key))
+                                else:
+                                    heapq.heappush(di_heap, (-(oval / key), key))
+                            elif key < 0 and oval < 0:
+                                if key > oval:
+                                    heapq.heappush(di_heap, (-(-key / -oval), key))
+                                else:
+                                    heapq.heappush(di_heap, (-(-oval / -key), key))
+                            else:
+                                if oval < 0:
+                                    hold_val = -oval + key
+                                    heapq.heappush(di_heap, (-(key / hold_val), key))
+                                else:
+                                    hold_val = -key + oval
+                                    heapq.heappush(di_heap, (-(oval / hold_val), key))
+                        else:
+                            heapq.heappush(di_heap, (0, key))
+
+                    if di_heap:
+                        if -(di_heap[0][0]) != 1:
+                            match_terms.append(-(di_heap[0][0]))
+                            if di_heap[0][0] != 0:
+                                uncertainty_terms.append(-(di_heap[0][0]))
+                            else:
+                                uncertainty_terms.append(1)
+                        else:
+                            match_terms.append(1)
+                        match_count += 1
+                        if self.trace.predict: self.trace.debug('predict', 'other 1d', rule, exception_group, di_heap[0][1], 'oval data', oval_data)
+
+                if exception_group is None:
+                    rel_1d_data = rule_1d.rel
+                    for rel_key in rel_1d_data.keys():
+                        heapq.heappush(predict_rule_1d[di], (-(rel_1d_data[rel_key][0] / rel_1d_data[rel_key][1]), 'rel', rel_key, rule_1d.index, base_1D[di]))
+
+        except KeyError:
+            pass
+
+        return match_terms, uncertainty_terms, match_count, predict_rule_1d
+
     def compare(self, compare_state, given_goal, generated, state_num):
-        rule_heap = []
-        rule_list = []
-        change_heap = []
+        best = None
         best_action = None
-        check_rules = []
         if given_goal and not generated:
-            for gi, goal in enumerate(given_goal):
-                if goal:
-                    for goal_data in goal:
-                        if gi == 0:
-                            try:
-                                check_rules = self.knowledge['1d/' + str(goal_data[0])]
-                            except KeyError:
-                                if self.debug: print('compare passing ', '1d/' + str(goal_data[0]))
-                                pass
-                            if goal_data[1] == '+':
-                                for rule in check_rules:
-                                    rule_cond_id = self.knowledge['1d/' + str(goal_data[0]) + '/' + rule]
-                                    change_heap = []
-                                    rel_data = self.knowledge['1d/' + str(goal_data[0]) + '/' + str(rule_cond_id) + '/rel']
-
-                                    for key in rel_data.keys():
-                                        heapq.heappush(change_heap, (-(rel_data[key][0] / rel_data[key][1]), 'rel', key, rule))
-
-                                    if change_heap:
-                                        if change_heap[0][1] == 'rel':
-                                            if change_heap[0][2] > 0:
-                                                rule_list.append(change_heap[0][3])
-
-                                if self.debug: print('Compare rule list', rule_list)
-
-                                for rule in rule_list:
-                                    val = self.knowledge['2d/' + rule]
-                                    if val in compare_state.input_2D_idx.keys():
-                                        rule_2d_cond_id = self.knowledge['2d/' + str(val) + '/' + rule]
-                                        rel_condition_data = self.knowledge['2d/' + str(val) + '/' + str(rule_2d_cond_id) + '/inclusions/rel']
-                                        for key in self.knowledge['2d/' + str(val) + '/' + str(rule_2d_cond_id) + '/act'].keys():
-                                            action = key
-                                        exception_groups = []
-
-                                        for pos in compare_state.input_2D_idx[val]:
-                                            diff = 0
-                                            try:
-                                                for ci, condition in enumerate(rel_condition_data):
-                                                    crx, cry, cod, cor = condition
-                                                    if compare_state.input_2D[pos[0] + crx][pos[1] + cry] == cod:
-                                                        pass
-                                            except IndexError:
-                                                if self.debug: print('Index Error, continuing')
-                                                continue
-
-                                            if self.debug: print('Compare rel_condition_data', rel_condition_data, rule, val)
-                                            for ci, condition in enumerate(rel_condition_data):
-                                                rel_diff_heap = []
-                                                crx, cry, cod, cor = condition
-
-                                                if self.debug: print('Compare cod', cod)
-                                                if cod in compare_state.input_2D_idx.keys():
-                                                    if self.debug: print('Compare cod found')
-                                                    for rel_pos in compare_state.input_2D_idx[cod]:
-                                                        if self.debug: print('Compare rel_pos', rel_pos, pos, crx, cry, abs(rel_pos[0] - (pos[0] + crx)), abs(rel_pos[1] - (pos[1] + cry)))
-                                                        heapq.heappush(rel_diff_heap, abs(rel_pos[0] - (pos[0] + crx)) + abs(rel_pos[1] - (pos[1] + cry)))
-                                                    if self.debug: print('Compare rel_diff_heap')
-                                                    diff += rel_diff_heap[0]
-                                                else:
-                                                    diff += 1
-                                            if self.debug: print('Compare debug ', val, diff, rule, (pos[0], pos[1]), rel_condition_data)
-                                            heapq.heappush(rule_heap, (diff, rule, action))
-
-                            if goal_data[1] == '-':
-                                for rule in check_rules:
-                                    rule_cond_id = self.knowledge['1d/' + str(goal_data[0]) + '/' + rule]
-                                    change_heap = []
-                                    rel_data = self.knowledge['1d/' + str(goal_data[0]) + '/' + str(rule_cond_id) + '/rel']
-
-                                    for key in rel_data.keys():
-                                        heapq.heappush(change_heap, (-(rel_data[key][0] / rel_data[key][1]), 'rel', key, rule))
-
-                                    if change_heap:
-                                        if change_heap[0][1] == 'rel':
-                                            if change_heap[0][2] < 0:
-                                                rule_list.append(change_heap[0][3])
-
-                                if self.debug: print('Compare rule list', rule_list)
-
-                                for rule in rule_list:
-                                    val = self.knowledge['2d/' + rule]
-                                    if val in compare_state.input_2D_idx.keys():
-                                        rule_2d_cond_id = self.knowledge['2d/' + str(val) + '/' + rule]
-                                        rel_condition_data = self.knowledge['2d/' + str(val) + '/' + str(rule_2d_cond_id) + '/inclusions/rel']
-                                        for key in self.knowledge['2d/' + str(val) + '/' + str(rule_2d_cond_id) + '/act'].keys():
-                                            action = key
-                                        exception_groups = []
-
-                                        for pos in compare_state.input_2D_idx[val]:
-                                            diff = 0
-                                            try:
-                                                for ci, condition in enumerate(rel_condition_data):
-                                                    crx, cry, cod, cor = condition
-                                                    if compare_state.input_2D[pos[0] + crx][pos[1] + cry] == cod:
-                                                        pass
-                                            except IndexError:
-                                                if self.debug: print('Index Error, continuing')
-                                                continue
-
-                                            if self.debug: print('Compare rel_condition_data', rel_condition_data, rule, val)
-                                            for ci, condition in enumerate(rel_condition_data):
-                                                rel_diff_heap = []
-                                                crx, cry, cod, cor = condition
-
-                                                if self.debug: print('Compare cod', cod)
-                                                if cod in compare_state.input_2D_idx.keys():
-                                                    if self.debug: print('Compare cod found')
-                                                    for rel_pos in compare_state.input_2D_idx[cod]:
-                                                        if self.debug: print('Compare rel_pos', rel_pos, pos, crx, cry, abs(rel_pos[0] - (pos[0] + crx)), abs(rel_pos[1] - (pos[1] + cry)))
-                                                        heapq.heappush(rel_diff_heap, abs(rel_pos[0] - (pos[0] + crx)) + abs(rel_pos[1] - (pos[1] + cry)))
-                                                    if self.debug: print('Compare rel_diff_heap')
-                                                    diff += rel_diff_heap[0]
-                                                else:
-                                                    diff += 1
-                                            if self.debug: print('Compare debug ', val, diff, rule, (pos[0], pos[1]), rel_condition_data)
-                                            heapq.heappush(rule_heap, (diff, rule, action))
+            width, height = compare_state.shape[:2]
+            for rule_list in self.goal_rules(given_goal):
+                if self.trace.plan: self.trace.debug('plan', 'Compare rule list', [entry[0] for entry in rule_list])
+
+                for rule, val, action, rel_condition_data, reach in rule_list:
+                    positions = compare_state.positions(val)
+                    if not positions:
+                        continue
+
+                    for pos in positions:
+                        # Rules with a condition off the board at this position are skipped
+                        if reach is not None and (pos[0] + reach[0] < -width or pos[0] + reach[1] >= width or pos[1] + reach[2] < -height or pos[1] + reach[3] >= height):
+                            if self.trace.plan: self.trace.debug('plan', 'Index Error, continuing')
+                            continue
+
+                        diff = 0
+                        if self.trace.plan: self.trace.debug('plan', 'Compare rel_condition_data', rel_condition_data, rule, val)
+                        for crx, cry, cod, cor in rel_condition_data:
+                            distance = compare_state.distance(pos[0] + crx, pos[1] + cry, cod)
+                            if distance is not None:
+                                diff += distance
+                            else:
+                                diff += 1
+                        if self.trace.plan: self.trace.debug('plan', 'Compare debug ', val, diff, rule, (pos[0], pos[1]), rel_condition_data)
+                        if best is None or (diff, rule, action) < best:
+                            best = (diff, rule, action)
 
         if generated:
             diff = None
-            for pos in compare_state.input_2D_idx[given_goal[1]]:
-                check_pos = [pos[0] + given_goal[2][0], pos[1] + given_goal[2][1]]
-                for pos_idx in compare_state.input_2D_idx[given_goal[2][2]]:
-                    if diff is None or (abs(pos_idx[0] - check_pos[0]) + abs(pos_idx[1] - check_pos[1])) < diff:
-                        diff = abs(pos_idx[0] - check_pos[0]) + abs(pos_idx[1] - check_pos[1])
-
-        if rule_heap:
-            if self.debug: print('Compare diff:', generated, rule_heap[0][0], rule_heap[0][1], state_num, rule_heap)
-
-            diff = rule_heap[0][0]
-            best_rule = rule_heap[0][1]
-            best_action = rule_heap[0][2]
+            for pos in compare_state.positions(given_goal[1]):
+                distance = compare_state.distance(pos[0] + given_goal[2][0], pos[1] + given_goal[2][1], given_goal[2][2])
+                if distance is not None and (diff is None or distance < diff):
+                    diff = distance
+
+        if best is not None:
+            if self.trace.plan: self.trace.debug('plan', 'Compare diff:', generated, best[0], best[1], state_num)
+
+            diff, best_rule, best_action = best
         else:
             diff = None
             best_rule = None
@@ -1277,76 +1249,71 @@ class AIRIS(object):
         else:
             return diff, best_action, False
 
+    # The rules compare scores a state with, one list per goal dimension checked: rules whose most likely 1D change
+    # moves the goal dimension the way the goal asks. Each list holds the rules of the goals before it too, as the
+    # rule list compare used to rebuild did. Entries are (rule id, value, action, inclusions, reach of the inclusions).
+    # This only depends on the knowledge, so it is built once per knowledge generation rather than for every state
+    def goal_rules(self, given_goal):
+        key = (self.knowledge.generation, str(given_goal))
+        if self.goal_rule_cache is not None and self.goal_rule_cache[0] == key:
+            return self.goal_rule_cache[1]
+
+        goal_rules = []
+        rule_list = []
+        entries = dict()
+        check_rules = []
+        for goal_data in given_goal[0]:
+            try:
+                check_rules = self.knowledge.dims[goal_data[0]].rule_ids
+            except KeyError:
+                if self.trace.plan: self.trace.debug('plan', 'compare passing ', '1d/' + str(goal_data[0]))
+                pass
+            if goal_data[1] != '+' and goal_data[1] != '-':
+                continue
+
+            for rule in check_rules:
+                rel_data = self.knowledge.rule_1d(goal_data[0], rule).rel
+                if not rel_data:
+                    continue
+                change = min([(-(rel_data[key][0] / rel_data[key][1]), key) for key in rel_data.keys()])[1]
+                if (goal_data[1] == '+' and change > 0) or (goal_data[1] == '-' and change < 0):
+                    if rule not in entries:
+                        rule_group = self.knowledge.rules[rule]
+                        action = None
+                        for act in rule_group.act.keys():
+                            action = act
+                        conditions = tuple(rule_group.inclusions or ())
+                        reach = None
+                        if conditions:
+                            reach = (min([c[0] for c in conditions]), max([c[0] for c in conditions]), min([c[1] for c in conditions]), max([c[1] for c in conditions]))
+                        entries[rule] = (rule, rule_group.value, action, conditions, reach)
+                    rule_list.append(entries[rule])
+            goal_rules.append(list(rule_list))
+
+        self.goal_rule_cache = (key, goal_rules)
+        return goal_rules
+
     def create_rule(self, act, dix, diy, oval, rval, aval, rule_id, state, prev_state, prev_1d, post_1d, prev_2d, post_2d, step):
         is_dupe = False
         new_rule = 'ERROR'
-        hold_rules = []
-        try:
-            hold_rules = self.knowledge['2d/' + str(oval)]
-        except KeyError:
-            pass
 
-        for rule_group, r_id in enumerate(hold_rules):
-            dupe_act = False
+        # Only rules with the same action, change and matching inclusions can be duplicates, see duplicate_candidates
+        for group in self.duplicate_candidates(oval, act, rval, dix, diy):
+            r_id = group.id
             dupe_1d = True
             dupe_1d_rel = True
-            dupe_rel = False
-            dupe_inc = False
-            if self.debug: print('checking rule ', r_id)
-            if self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/combined']:
-                if self.debug: print('rule is combined, skipping')
-                continue
-
-            if act in self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/act'].keys():
-                dupe_act = True
-            else:
-                if self.debug: print('rule is not for this action, skipping')
-                continue
-            if self.debug: print('checking rval', rval, self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/rel'].keys())
-            if rval in self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/rel'].keys():
-                dupe_rel = True
-            else:
-                if self.debug: print('rule does not have the same rval, skipping')
-                continue
+            if self.trace.rules: self.trace.debug('rules', 'checking rule ', r_id)
 
             if rval != 0:
-                rel_count = 0
-                rel_total = 0
-                rel_set = set()
-                for rel_data in self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/inclusions/rel']:
-                    rox = rel_data[0]
-                    roy = rel_data[1]
-                    try:
-                        if self.debug: print('checking inclusion', rox, roy, dix, diy, dix + rox, diy + roy, self.input_2D[dix + rox][diy + roy], rel_data[2])
-                    except IndexError:
-                        if self.debug: print('checking inclusion index error')
-                    if (rox, roy) not in rel_set:
-                        rel_total += 1
-                        rel_set.add((rox, roy))
-
-                    try:
-                        if self.input_2D[dix + rox][diy + roy] == rel_data[2]:
-                            rel_count += 1
-                    except IndexError:
-                        pass
-                    if self.debug: print('rel_count', rel_count, 'rel_total', rel_total)
-
-                if rel_count == rel_total:
-                    dupe_inc = True
-                else:
-                    if self.debug: print('rule inclusions do not match, skipping', rel_count, rel_total)
-                    continue
-
                 count_1d = 0
                 total_1d = 0
                 for di, val in enumerate(self.input_1D):
                     try:
-                        di_group = self.knowledge['1d/' + str(di) + '/' + str(r_id)]
-                        found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/oval']
+                        rule_1d = self.knowledge.rule_1d(di, r_id)
                         total_1d += 1
                         try:
-                            found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/oval'][val]
-                            if self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/rel'][post_1d[di] - val]:
+                            found = rule_1d.oval[val]
+                            if rule_1d.rel[post_1d[di] - val]:
                                 count_1d += 1
                         except KeyError:
                             dupe_1d = False
@@ -1362,12 +1329,11 @@ class AIRIS(object):
                     total_1d = 0
                     for di, val in enumerate(self.input_1D):
                         try:
-                            di_group = self.knowledge['1d/' + str(di) + '/' + str(r_id)]
-                            if self.debug: print('1d/' + str(di) + '/' + str(di_group) + '/rel', self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/rel'], post_1d[di], val)
-                            found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/rel']
+                            rule_1d = self.knowledge.rule_1d(di, r_id)
+                            if self.trace.rules: self.trace.debug('rules', '1d rel', di, rule_1d.index, rule_1d.rel, post_1d[di], val)
                             total_1d += 1
                             try:
-                                found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/rel'][post_1d[di] - val]
+                                found = rule_1d.rel[post_1d[di] - val]
                                 count_1d += 1
                             except KeyError:
                                 pass
@@ -1376,37 +1342,41 @@ class AIRIS(object):
                     if total_1d != count_1d:
                         dupe_1d_rel = False
                         is_dupe = False
-                        if self.debug: print('not dupe_1d_rel', dupe_1d_rel, dupe_1d)
-                        if self.debug: print('total 1d / count 1d', total_1d, count_1d)
+                        if self.trace.rules: self.trace.debug('rules', 'not dupe_1d_rel', dupe_1d_rel, dupe_1d)
+                        if self.trace.rules: self.trace.debug('rules', 'total 1d / count 1d', total_1d, count_1d)
 
                     if dupe_1d_rel:
                         dupe_1d = True
-                        if dupe_act and dupe_1d and dupe_inc and dupe_rel:
-                            for di, val in enumerate(self.input_1D):
-                                di_group = self.knowledge['1d/' + str(di) + '/' + str(r_id)]
-                                try:
-                                    found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/oval'][val]
-                                except KeyError:
-                                    self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/oval'] = dict()
+                        for di, val in enumerate(self.input_1D):
+                            rule_1d = self.knowledge.rule_1d(di, r_id)
+                            try:
+                                found = rule_1d.oval[val]
+                            except KeyError:
+                                if rule_1d.oval:
+                                    self.knowledge.touch(oval)
+                                    self.knowledge.mark(rule_1d)
+                                rule_1d.oval = dict()
 
-                if dupe_act and dupe_1d and dupe_inc and dupe_rel:
-                    if self.debug: print('setting is_dupe to true')
+                if dupe_1d:
+                    if self.trace.rules: self.trace.debug('rules', 'setting is_dupe to true')
                     is_dupe = True
-            elif dupe_act and dupe_rel:
-                if self.debug: print('rval is 0 so is_dupe is true')
+            else:
+                if self.trace.rules: self.trace.debug('rules', 'rval is 0 so is_dupe is true')
                 is_dupe = True
 
-            if self.debug: print('all checks for r_id', r_id, dupe_act, dupe_1d, dupe_inc, dupe_rel, dupe_1d_rel, is_dupe)
+            if self.trace.rules: self.trace.debug('rules', 'all checks for r_id', r_id, dupe_1d, dupe_1d_rel, is_dupe)
 
             if is_dupe:
                 try:
-                    data = self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/apos'][str(dix) + ':' + str(diy)]
+                    data = group.apos[str(dix) + ':' + str(diy)]
                     data[0] += 1
                     data[1] += 1
-                    self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/apos'][str(dix) + ':' + str(diy)] = data
                 except KeyError:
-                    if self.debug: print('clearing apos from rule', r_id)
-                    self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/apos'] = {}
+                    if self.trace.rules: self.trace.debug('rules', 'clearing apos from rule', r_id)
+                    if group.apos:
+                        self.knowledge.touch(group.value)
+                    group.apos = {}
+                self.knowledge.mark(group)
 
                 for loc_key in self.states[state].applied_rules.keys():
                     key = loc_key.split(':')
@@ -1417,9 +1387,11 @@ class AIRIS(object):
                     if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
                         cond_group = self.states[state].applied_rules[loc_key][2]
                         check_val = self.states[state].applied_rules[loc_key][11]
-                        if self.debug: print('Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
-                        if self.input_2D[loc_x][loc_y] == check_val and post_2d[loc_x][loc_y] - check_val in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/rel'].keys():
-                            self.knowledge['2d/' + str(oval) + '/' + str(rule_group) + '/mrules'][check_rule] = [1, 1]
+                        if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
+                        if self.input_2D[loc_x][loc_y] == check_val and post_2d[loc_x][loc_y] - check_val in self.knowledge.values[check_val].groups[cond_group].rel.keys():
+                            if check_rule not in group.mrules:
+                                self.knowledge.touch(group.value)
+                            group.mrules[check_rule] = [1, 1]
 
                 new_rule = r_id
                 break
@@ -1428,34 +1400,21 @@ class AIRIS(object):
             starttime = time.time()
             new_rule = rule_id
 
-            self.knowledge['plan_depth'] = self.plan_depth
+            self.knowledge.plan_depth = self.plan_depth
 
-            try:
-                self.knowledge[act].append(rule_id)
-            except KeyError:
-                self.knowledge[act] = [rule_id]
-
-            try:
-                self.knowledge['2d/' + str(oval)].append(rule_id)
-            except KeyError:
-                self.knowledge['2d/' + str(oval)] = [rule_id]
-
-            rule_num = str(len(self.knowledge['2d/' + str(oval)]) - 1)
-
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/act'] = {act: [1, 1]}
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/rel'] = {rval: [1, 1]}
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/abs'] = {aval: [1, 1]}
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/apos'] = {str(dix) + ':' + str(diy): [1, 1]}
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/oraw'] = [self.input_1D, self.input_2D]
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/lraw'] = [self.input_1D, self.input_2D]
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/id'] = rule_id
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/lstep'] = step
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/rstep'] = {}
-            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/combined'] = False
-            self.knowledge['2d/' + str(oval) + '/' + str(rule_id)] = len(self.knowledge['2d/' + str(oval)]) - 1
+            group = self.knowledge.add_rule(act, oval, rule_id)
+            group.act = {act: [1, 1]}
+            group.rel = {rval: [1, 1]}
+            group.abs = {aval: [1, 1]}
+            group.apos = {str(dix) + ':' + str(diy): [1, 1]}
+            group.oraw = [self.input_1D, self.input_2D]
+            group.lraw = [self.input_1D, self.input_2D]
+            group.lstep = step
+            group.rstep = {}
+            group.combined = False
 
             if rval != 0:
-                self.knowledge['2d/' + str(oval) + '/' + rule_num + '/mrules'] = dict()
+                group.mrules = dict()
                 for loc_key in self.states[state].applied_rules.keys():
                     key = loc_key.split(':')
                     loc_x = int(key[0])
@@ -1465,11 +1424,11 @@ class AIRIS(object):
                     if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
                         cond_group = self.states[state].applied_rules[loc_key][2]
                         check_val = self.states[state].applied_rules[loc_key][11]
-                        if self.debug: print('Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
-                        if self.input_2D[loc_x][loc_y] == check_val and post_2d[loc_x][loc_y] - check_val in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/rel'].keys():
-                            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/mrules'][check_rule] = [1, 1]
+                        if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
+                        if self.input_2D[loc_x][loc_y] == check_val and post_2d[loc_x][loc_y] - check_val in self.knowledge.values[check_val].groups[cond_group].rel.keys():
+                            group.mrules[check_rule] = [1, 1]
 
-                if self.debug: print('new rule position ', dix, diy)
+                if self.trace.rules: self.trace.debug('rules', 'new rule position ', dix, diy)
                 for loc_key in self.states[state].applied_rules.keys():
                     key = loc_key.split(':')
                     loc_x = int(key[0])
@@ -1479,21 +1438,19 @@ class AIRIS(object):
                     if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
                         cond_group = self.states[state].applied_rules[loc_key][2]
                         check_val = self.states[state].applied_rules[loc_key][11]
-                        if self.debug: print('Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
-                        if self.debug: print('Adding inclusions from rule ' + str(check_rule), 'val: ' + str(check_val), 'cond_group: ' + str(cond_group))
-                        for check_rel in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/inclusions/rel_set']:
+                        if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
+                        if self.trace.rules: self.trace.debug('rules', 'Adding inclusions from rule ' + str(check_rule), 'val: ' + str(check_val), 'cond_group: ' + str(cond_group))
+                        check_rels = list(self.knowledge.values[check_val].groups[cond_group].inclusion_set)
+                        before, after = self.neighbours(check_rels, loc_x, loc_y)
+                        for check_rel, prev_val, post_val in zip(check_rels, before, after):
                             if (loc_x + check_rel[0]) - dix != 0 or (loc_y + check_rel[1]) - diy != 0:
-                                try:
-                                    if ((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])]) not in self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel']:
-                                        self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'].append(((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])]))
-                                        if self.debug: print('Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])
-                                except KeyError:
-                                    self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'] = [((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])]
-                                    if self.debug: print('Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])
-                                except IndexError:
-                                    if self.debug: print('Location outside view, skipping')
+                                if prev_val is None:
+                                    if self.trace.rules: self.trace.debug('rules', 'Location outside view, skipping')
+                                else:
+                                    self.add_inclusion(group, ((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, prev_val, post_val - prev_val))
+                                    if self.trace.rules: self.trace.debug('rules', 'Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], prev_val)
                             else:
-                                if self.debug: print('Skipped due to same location as new rule')
+                                if self.trace.rules: self.trace.debug('rules', 'Skipped due to same location as new rule')
 
                 for loc_key in self.states[state].applied_exceptions.keys():
                     key = loc_key.split(':')
@@ -1503,85 +1460,98 @@ class AIRIS(object):
                     check_rule = exception_data[1]
                     cond_group = exception_data[2]
                     check_val = exception_data[9]
-                    if self.debug: print('Applied exception at loc ', str(loc_x) + ':' + str(loc_y), exception_data)
+                    if self.trace.rules: self.trace.debug('rules', 'Applied exception at loc ', str(loc_x) + ':' + str(loc_y), exception_data)
                     if self.input_2D[loc_x][loc_y] != post_2d[loc_x][loc_y]:
-                        if self.debug: print('Adding inclusions from rule exception ' + str(check_rule), 'val: ' + str(check_val), 'cond_group: ' + str(cond_group))
-                        for check_rel in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/inclusions/rel_set']:
+                        if self.trace.rules: self.trace.debug('rules', 'Adding inclusions from rule exception ' + str(check_rule), 'val: ' + str(check_val), 'cond_group: ' + str(cond_group))
+                        check_rels = list(self.knowledge.values[check_val].groups[cond_group].inclusion_set)
+                        before, after = self.neighbours(check_rels, loc_x, loc_y)
+                        for check_rel, prev_val, post_val in zip(check_rels, before, after):
                             if (loc_x + check_rel[0]) - dix != 0 or (loc_y + check_rel[1]) - diy != 0:
-                                try:
-                                    if ((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])]) not in self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel']:
-                                        self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'].append(((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])]))
-                                        if self.debug: print('Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])
-                                except KeyError:
-                                    self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'] = [((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])], post_2d[(loc_x + check_rel[0])][(loc_y + check_rel[1])] - self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])]
-                                    if self.debug: print('Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], self.input_2D[(loc_x + check_rel[0])][(loc_y + check_rel[1])])
-                                except IndexError:
-                                    if self.debug: print('Exception location outside view, skipping')
+                                if prev_val is None:
+                                    if self.trace.rules: self.trace.debug('rules', 'Exception location outside view, skipping')
+                                else:
+                                    self.add_inclusion(group, ((loc_x + check_rel[0]) - dix, (loc_y + check_rel[1]) - diy, prev_val, post_val - prev_val))
+                                    if self.trace.rules: self.trace.debug('rules', 'Added loc: ', dix, diy, loc_x, loc_y, check_rel[0], check_rel[1], prev_val)
                             else:
-                                if self.debug: print('Skipped due to same location as new rule')
+                                if self.trace.rules: self.trace.debug('rules', 'Skipped due to same location as new rule')
                     else:
-                        if self.debug: print('Skipped adding inclusions from rule exception due to exception success')
+                        if self.trace.rules: self.trace.debug('rules', 'Skipped adding inclusions from rule exception due to exception success')
 
-                try:
-                    if self.debug: print('pre-added inclusions: ', self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'])
-                except KeyError:
-                    pass
-                for cox, coy, cod, cord, coad in self.last_change_2D:
+                if self.trace.rules: self.trace.debug('rules', 'pre-added inclusions: ', group.inclusions)
+                for cox, coy, cod, cord, coad in self.last_change_2D.tolist():
                     if cox != dix or coy != diy:
-                        try:
-                            if (cox - dix, coy - diy, cod, cord) not in self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel']:
-                                self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'].append((cox - dix, coy - diy, cod, cord))
-                        except KeyError:
-                            self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'] = [(cox - dix, coy - diy, cod, cord)]
+                        self.add_inclusion(group, (cox - dix, coy - diy, cod, cord))
 
-                for item in self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel']:
-                    try:
-                        self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel_set'].add(item)
-                    except KeyError:
-                        self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel_set'] = {item}
+                group.inclusion_set = set(group.inclusions)
             else:
-                self.knowledge['2d/' + str(oval) + '/' + rule_num + '/mrules'] = dict()
-                self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel'] = []
-                self.knowledge['2d/' + str(oval) + '/' + rule_num + '/inclusions/rel_set'] = set()
-
-            try:
-                if oval not in self.knowledge['2d{']:
-                    self.knowledge['2d'].append(oval)
-                    self.knowledge['2d{'].add(oval)
-            except KeyError:
-                self.knowledge['2d'] = [oval]
-                self.knowledge['2d{'] = {oval}
-
-            self.knowledge['2d/' + rule_id] = oval
+                group.mrules = dict()
+                group.inclusions = []
+                group.inclusion_set = set()
 
             if rval != 0:
                 for di, val in enumerate(prev_1d):
-                    try:
-                        if rule_id not in self.knowledge['1d{' + str(di)]:
-                            self.knowledge['1d/' + str(di)].append(rule_id)
-                        self.knowledge['1d{' + str(di)].add(rule_id)
-                    except KeyError:
-                        self.knowledge['1d/' + str(di)] = [rule_id]
-                        self.knowledge['1d{' + str(di)] = {rule_id}
+                    rule_1d = self.knowledge.add_rule_1d(di, rule_id)
+                    rule_1d.oval = {val: [1, 1]}
+                    rule_1d.rel = {post_1d[di] - val: [1, 1]}
+                    rule_1d.abs = {post_1d[di]: [1, 1]}
 
-                    rule_num_1d = str(len(self.knowledge['1d/' + str(di)]) - 1)
-                    self.knowledge['1d/' + str(di) + '/' + rule_num_1d + '/oval'] = {val: [1, 1]}
-                    self.knowledge['1d/' + str(di) + '/' + rule_num_1d + '/rel'] = {post_1d[di] - val: [1, 1]}
-                    self.knowledge['1d/' + str(di) + '/' + rule_num_1d + '/abs'] = {post_1d[di]: [1, 1]}
-                    self.knowledge['1d/' + str(di) + '/' + str(rule_id)] = rule_num_1d
-
-                    try:
-                        self.knowledge['1d/' + rule_id].add(di)
-                    except KeyError:
-                        self.knowledge['1d/' + rule_id] = {di}
-
-            if self.debug: print('================ create condition', dix, diy, 'time:', round(time.time() - starttime, 10), len(self.knowledge), rule_id)
+            self.knowledge.changed(oval)
+            self.knowledge.index_rule(group)
+            if self.trace.rules: self.trace.debug('rules', '================ create condition', dix, diy, 'time:', round(time.time() - starttime, 10), len(self.knowledge), rule_id)
 
         if new_rule == 'ERROR':
-            if self.debug: print('new rule is ERROR')
+            if self.trace.rules: self.trace.debug('rules', 'new rule is ERROR')
             raise Exception
         return new_rule
 
+    # The rules of oval with action act and change rval that an observation at (dix, diy) of the current input could
+    # duplicate, in the order they were created. A rule with a change qualifies when each offset of its inclusions
+    # holds the value it expects. Rules are found in KnowledgeStore.rule_index, so rules for other actions and changes
+    # are never looked at and rules with the same inclusions are checked against the input once. The input under the
+    # inclusions of all of them is read at once
+    def duplicate_candidates(self, oval, act, rval, dix, diy):
+        signatures = self.knowledge.rule_index(oval).get((act, rval))
+        if not signatures:
+            return []
+        if rval != 0:
+            offsets = tuple((condition[0], condition[1]) for signature in signatures for condition in signature)
+            found = self.input_board.gather(stencil(offsets), dix, diy).tolist()
+        start = 0
+        indexes = []
+        for signature, group_indexes in signatures.items():
+            end = start + len(signature)
+            if rval == 0 or self.inclusions_hold(signature, found[start:end]):
+                indexes.extend(group_indexes)
+            elif self.trace.rules: self.trace.debug('rules', 'rule inclusions do not match, skipping', group_indexes)
+            start = end
+        indexes.sort()
+        groups = self.knowledge.values[oval].groups
+        return [groups[i] for i in indexes]
+
+    # Whether a rule_signature() holds given the values found under its inclusions. Each offset counts once however
+    # many inclusions it has, so an offset with more than one inclusion holding the value it finds never matches
+    def inclusions_hold(self, signature, found):
+        rel_count = 0
+        for condition, val in zip(signature, found):
+            if val == condition[2]:
+                rel_count += 1
+        return rel_count == len(set(signature_offsets(signature)))
+
+    # The values before and after the last action at each offset of conditions from (x, y), read with one indexed
+    # read of self.input_board and self.observed_board each. Offsets off the board read as None
+    def neighbours(self, conditions, x, y):
+        offsets = stencil(tuple((condition[0], condition[1]) for condition in conditions))
+        before = self.input_board.gather(offsets, x, y).tolist()
+        after = self.observed_board.gather(offsets, x, y).tolist()
+        return [None if math.isnan(val) else val for val in before], [None if math.isnan(val) else val for val in after]
+
+    # Add a relative condition to a rule's inclusions if it isn't already there
+    def add_inclusion(self, group, condition):
+        if group.inclusions is None:
+            group.inclusions = [condition]
+        elif condition not in group.inclusions:
+            group.inclusions.append(condition)
+
     def update_rule(self, rule_data, update, exception, loc_key, input_2d, input_1d, state, rules_list, exceptions_list, prules_list, applied_rules):
         if loc_key is not None:
             pos = loc_key.split(':')
@@ -1592,46 +1562,23 @@ class AIRIS(object):
         if exception and not update:
             is_dupe = False
             exception_group = None
+            condition_group = self.knowledge.values[oval].groups[rule_data[2]]
             try:
-                for group in self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions']:
-                    dupe_act = False
+                # Only exceptions for the same action whose conditions hold here can be duplicates, see duplicate_exceptions
+                for group in self.duplicate_exceptions(condition_group, pos):
+                    exception = condition_group.exceptions[group]
                     dupe_1d = True
                     dupe_1d_rel = True
-                    dupe_rel = False
-
-                    if self.last_action in self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + group + '/act'].keys():
-                        dupe_act = True
-                    else:
-                        continue
-
-                    rel_count = 0
-                    rel_total = 0
-                    for rel_data in self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + group + '/rel']:
-                        rel_total += 1
-                        rox = rel_data[0]
-                        roy = rel_data[1]
-
-                        try:
-                            if self.input_2D[pos[0] + rox][pos[1] + roy] == rel_data[2]:
-                                rel_count += 1
-
-                        except IndexError:
-                            rel_count += 1
-
-                    if rel_count == rel_total:
-                        dupe_rel = True
-                    else:
-                        continue
 
                     count_1d = 0
                     total_1d = 0
                     for di, val in enumerate(self.input_1D):
                         try:
-                            di_group = self.knowledge['1d/' + str(di) + '/' + str(rule_data[1])]
-                            if self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/oval']:
+                            exception_1d = self.knowledge.rule_1d(di, rule_data[1]).exceptions[group]
+                            if exception_1d.oval:
                                 total_1d += 1
                                 try:
-                                    found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/oval'][val]
+                                    found = exception_1d.oval[val]
                                     count_1d += 1
                                 except KeyError:
                                     dupe_1d = False
@@ -1649,11 +1596,11 @@ class AIRIS(object):
                         total_1d = 0
                         for di, val in enumerate(self.input_1D):
                             try:
-                                di_group = self.knowledge['1d/' + str(di) + '/' + str(rule_data[1])]
-                                if self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/rel']:
+                                exception_1d = self.knowledge.rule_1d(di, rule_data[1]).exceptions[group]
+                                if exception_1d.rel:
                                     total_1d += 1
                                     try:
-                                        found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/rel'][input_1d[di] - val]
+                                        found = exception_1d.rel[input_1d[di] - val]
                                         count_1d += 1
                                     except KeyError:
                                         pass
@@ -1665,50 +1612,62 @@ class AIRIS(object):
 
                         if dupe_1d_rel:
                             dupe_1d = True
-                            if dupe_act and dupe_rel:
-                                for di, val in enumerate(self.input_1D):
-                                    di_group = self.knowledge['1d/' + str(di) + '/' + str(rule_data[1])]
+                            for di, val in enumerate(self.input_1D):
+                                rule_1d = self.knowledge.rule_1d(di, rule_data[1])
+                                try:
+                                    found = rule_1d.exceptions[group].oval[val]
+                                except KeyError:
                                     try:
-                                        found = self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/oval'][val]
+                                        if rule_1d.exceptions[group].oval:
+                                            self.knowledge.touch(oval)
+                                            self.knowledge.mark(rule_1d)
+                                        rule_1d.exceptions[group].oval = dict()
                                     except KeyError:
-                                        self.knowledge['1d/' + str(di) + '/' + str(di_group) + '/exceptions/' + group + '/oval'] = dict()
-
-                                for loc_key in self.states[state].applied_rules.keys():
-                                    key = loc_key.split(':')
-                                    loc_x = int(key[0])
-                                    loc_y = int(key[1])
-
-                                    check_rule = self.states[state].applied_rules[loc_key][1]
-                                    if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
-                                        cond_group = self.states[state].applied_rules[loc_key][2]
-                                        check_val = self.states[state].applied_rules[loc_key][11]
-                                        if self.debug: print('Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
-                                        if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/rel'].keys():
-                                            self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + group + '/mrules'][check_rule] = [1, 1]
-
-                    if dupe_act and dupe_rel and dupe_1d:
+                                        self.knowledge.touch(oval)
+                                        self.knowledge.mark(rule_1d)
+                                        rule_1d.exceptions[group] = Exception1D(dict(), dict())
+
+                            for loc_key in self.states[state].applied_rules.keys():
+                                key = loc_key.split(':')
+                                loc_x = int(key[0])
+                                loc_y = int(key[1])
+
+                                check_rule = self.states[state].applied_rules[loc_key][1]
+                                if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
+                                    cond_group = self.states[state].applied_rules[loc_key][2]
+                                    check_val = self.states[state].applied_rules[loc_key][11]
+                                    if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
+                                    if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in self.knowledge.values[check_val].groups[cond_group].rel.keys():
+                                        exception.mrules[check_rule] = [1, 1]
+                                        self.knowledge.mark(exception)
+
+                    if dupe_1d:
                         is_dupe = True
                         exception_group = group
                         break
 
             except KeyError:
-                if self.debug: print('Exception KeyError')
+                if self.trace.rules: self.trace.debug('rules', 'Exception KeyError')
 
             if not is_dupe:
+                # Each inclusion of the rule is read into the exception, so no exception is made where one is off
+                # the board. None tells the caller there is no exception to apply
+                before, after = self.neighbours(condition_group.inclusions, pos[0], pos[1])
+                if None in before:
+                    if self.trace.rules: self.trace.debug('rules', 'exception conditions off the board', loc_key, rule_data[2])
+                    return None
+
                 exception_group = str(uuid.uuid4())[:6]
-                try:
-                    self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions'].append(exception_group)
-                except KeyError:
-                    self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions'] = [exception_group]
+                exception = self.knowledge.add_exception(condition_group, exception_group)
 
-                if self.debug: print('creating exception ', exception_group, '2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions')
+                if self.trace.rules: self.trace.debug('rules', 'creating exception ', exception_group, oval, rule_data[2])
 
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/act'] = {self.last_action: [1, 1]}
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/apos'] = {loc_key: [1, 1]}
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rstep'] = {}
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/lstep'] = self.time_step
+                exception.act = {self.last_action: [1, 1]}
+                exception.apos = {loc_key: [1, 1]}
+                exception.rstep = {}
+                exception.lstep = self.time_step
 
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/mrules'] = dict()
+                exception.mrules = dict()
                 for loc_key in self.states[state].applied_rules.keys():
                     key = loc_key.split(':')
                     loc_x = int(key[0])
@@ -1718,164 +1677,202 @@ class AIRIS(object):
                     if check_rule is not None and self.states[state].applied_rules[loc_key][3] is not None and self.states[state].applied_rules[loc_key][10][0] != 0:
                         cond_group = self.states[state].applied_rules[loc_key][2]
                         check_val = self.states[state].applied_rules[loc_key][11]
-                        if self.debug: print('Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
-                        if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in self.knowledge['2d/' + str(check_val) + '/' + str(cond_group) + '/rel'].keys():
-                            self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/mrules'][check_rule] = [1, 1]
-                if self.debug: print(rule_data)
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel'] = []
-                for rel_data in self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/inclusions/rel']:
-                    rox = rel_data[0]
-                    roy = rel_data[1]
-                    rod = self.input_2D[pos[0] + rox][pos[1] + roy]
-                    ror = input_2d[pos[0] + rox][pos[1] + roy] - self.input_2D[pos[0] + rox][pos[1] + roy]
-                    self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel'].append((rox, roy, rod, ror))
-
-                hold_rel = set(self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel'])
-
-                if self.debug: print('Exception rel:', self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel'], hold_rel, '2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel')
-                self.knowledge['2d/' + str(oval) + '/' + str(rule_data[2]) + '/exceptions/' + exception_group + '/rel'] = list(hold_rel)
+                        if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_key, self.states[state].applied_rules[loc_key])
+                        if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in self.knowledge.values[check_val].groups[cond_group].rel.keys():
+                            exception.mrules[check_rule] = [1, 1]
+                if self.trace.rules: self.trace.debug('rules', rule_data)
+                hold_rel = set()
+                for rel_data, rod, post_val in zip(condition_group.inclusions, before, after):
+                    hold_rel.add((rel_data[0], rel_data[1], rod, post_val - rod))
+
+                if self.trace.rules: self.trace.debug('rules', 'Exception rel:', hold_rel, oval, rule_data[2], exception_group)
+                exception.rel = frozenset(hold_rel)
 
                 for di_key, di_val in enumerate(self.input_1D):
-                    di_group = self.knowledge['1d/' + str(di_key) + '/' + str(rule_data[1])]
+                    rule_1d = self.knowledge.rule_1d(di_key, rule_data[1])
+                    misc_key = '1d/' + rule_data[1] + '/' + str(rule_1d.index) + '/exceptions/' + exception_group
                     try:
-                        self.knowledge['1d/' + rule_data[1] + '/' + str(di_group) + '/exceptions/' + exception_group].append(di_key)
+                        self.knowledge.misc[misc_key].append(di_key)
                     except KeyError:
-                        self.knowledge['1d/' + rule_data[1] + '/' + str(di_group) + '/exceptions/' + exception_group] = [di_key]
+                        self.knowledge.misc[misc_key] = [di_key]
+                    self.knowledge.mark_key(misc_key)
 
-                    self.knowledge['1d/' + str(di_key) + '/' + str(di_group) + '/exceptions/' + exception_group + '/oval'] = {di_val: [1, 1]}
-                    self.knowledge['1d/' + str(di_key) + '/' + str(di_group) + '/exceptions/' + exception_group + '/rel'] = {input_1d[di_key] - di_val: [1, 1]}
+                    rule_1d.exceptions[exception_group] = Exception1D({di_val: [1, 1]}, {input_1d[di_key] - di_val: [1, 1]})
+                    self.knowledge.mark(rule_1d)
 
-                self.knowledge['2d/exceptions/' + str(exception_group)] = oval
-                self.knowledge['2d/exceptions/' + str(exception_group) + '/cond_group'] = rule_data[2]
+                self.knowledge.changed(oval)
+                self.knowledge.index_exception(exception)
 
             if exception_group is not None:
                 return exception_group, rule_data[1]
             else:
-                if self.debug: print('NONE exception group')
+                if self.trace.rules: self.trace.debug('rules', 'NONE exception group')
                 raise Exception
 
         if update and not exception:
             for rule_id in rules_list:
-                val = self.knowledge['2d/' + str(rule_id)]
-                cond_group = self.knowledge['2d/' + str(val) + '/' + str(rule_id)]
+                group = self.knowledge.rules[rule_id]
 
                 for rule in applied_rules:
                     loc_x = rule[1]
                     loc_y = rule[2]
 
                     check_rule = rule[0]
+                    check_group = self.knowledge.rules[check_rule]
+                    check_val = check_group.value
 
-                    check_val = self.knowledge['2d/' + str(check_rule)]
-                    check_cond_group = self.knowledge['2d/' + str(check_val) + '/' + str(check_rule)]
+                    if self.trace.rules: self.trace.debug('rules', 'Applied rules at loc ', loc_x, loc_y, rule)
+                    if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in check_group.rel.keys():
+                        if check_rule not in group.mrules:
+                            self.knowledge.touch(group.value)
+                        group.mrules[check_rule] = [1, 1]
 
-                    if self.debug: print('Applied rules at loc ', loc_x, loc_y, rule)
-                    if self.input_2D[loc_x][loc_y] == check_val and input_2d[loc_x][loc_y] - check_val in self.knowledge['2d/' + str(check_val) + '/' + str(check_cond_group) + '/rel'].keys():
-                        self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/mrules'][check_rule] = [1, 1]
-
-                try:
-                    if self.debug: print('updating lrules for rule', rule_id, self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'])
-                except KeyError:
-                    if self.debug: print('updating lrules for rule', rule_id, 'no lrules')
+                self.knowledge.mark(group)
+                if self.trace.rules: self.trace.debug('rules', 'updating lrules for rule', rule_id, group.lrules)
                 if prules_list:
-                    try:
-                        if self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules']:
-                            if self.debug: print('updating rule lrules', '2d/' + str(val) + '/' + str(cond_group) + '/lrules', self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'], prules_list, self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] & prules_list)
-                            self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] = self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] & prules_list
-                    except KeyError:
-                        if self.debug: print('updating rule no lrules entry, creating')
-                        self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] = copy.deepcopy(prules_list)
+                    if group.lrules is None:
+                        if self.trace.rules: self.trace.debug('rules', 'updating rule no lrules entry, creating')
+                        group.lrules = copy.deepcopy(prules_list)
+                    elif group.lrules:
+                        if self.trace.rules: self.trace.debug('rules', 'updating rule lrules', rule_id, group.lrules, prules_list, group.lrules & prules_list)
+                        group.lrules = group.lrules & prules_list
                 else:
-                    try:
-                        if self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules']:
-                            if self.debug: print('updating rule no prules, clearing')
-                            self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] = set()
-                    except KeyError:
-                        if self.debug: print('updating rule no lrules entry, creating')
-                        self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/lrules'] = copy.deepcopy(prules_list)
+                    if group.lrules is None:
+                        if self.trace.rules: self.trace.debug('rules', 'updating rule no lrules entry, creating')
+                        group.lrules = copy.deepcopy(prules_list)
+                    elif group.lrules:
+                        if self.trace.rules: self.trace.debug('rules', 'updating rule no prules, clearing')
+                        group.lrules = set()
 
         if update and exception:
             for exception_id in exceptions_list:
-                val = self.knowledge['2d/exceptions/' + str(exception_id)]
-                cond_group = self.knowledge['2d/exceptions/' + str(exception_id) + '/cond_group']
-                try:
-                    if self.debug: print('updating lrules for exception', exception_id, self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'])
-                except KeyError:
-                    if self.debug: print('updating lrules for exception', exception_id, 'no rules')
+                exception = self.knowledge.exceptions[exception_id]
+                self.knowledge.mark(exception)
+                if self.trace.rules: self.trace.debug('rules', 'updating lrules for exception', exception_id, exception.lrules)
                 if prules_list:
-                    try:
-                        if self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules']:
-                            if self.debug: print('updating exception lrules', '2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules', self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'], prules_list, self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] & prules_list)
-                            self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] = self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] & prules_list
-                    except KeyError:
-                        if self.debug: print('updating exception lrules no lrules entry, creating')
-                        self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] = copy.deepcopy(prules_list)
+                    if exception.lrules is None:
+                        if self.trace.rules: self.trace.debug('rules', 'updating exception lrules no lrules entry, creating')
+                        exception.lrules = copy.deepcopy(prules_list)
+                    elif exception.lrules:
+                        if self.trace.rules: self.trace.debug('rules', 'updating exception lrules', exception_id, exception.lrules, prules_list, exception.lrules & prules_list)
+                        exception.lrules = exception.lrules & prules_list
                 else:
-                    try:
-                        if self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules']:
-                            if self.debug: print('updating exception no prules, clearing')
-                            self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] = set()
-                    except KeyError:
-                        if self.debug: print('updating exception lrules no lrules entry, creating')
-                        self.knowledge['2d/' + str(val) + '/' + str(cond_group) + '/exceptions/' + str(exception_id) + '/lrules'] = copy.deepcopy(prules_list)
+                    if exception.lrules is None:
+                        if self.trace.rules: self.trace.debug('rules', 'updating exception lrules no lrules entry, creating')
+                        exception.lrules = copy.deepcopy(prules_list)
+                    elif exception.lrules:
+                        if self.trace.rules: self.trace.debug('rules', 'updating exception no prules, clearing')
+                        exception.lrules = set()
+
+    # Ids of the exceptions of condition_group for the last action that an observation at pos of the current input
+    # could duplicate, in the order they were created. An exception qualifies when each of its conditions on the
+    # board holds the value it expects, conditions off the board always hold. The exceptions are found in
+    # KnowledgeStore.exception_index: the input is read at each set of offsets the exceptions use and what it holds
+    # there is looked up. Only offsets that fall off the board need each of their exceptions checked
+    def duplicate_exceptions(self, condition_group, pos):
+        by_offsets = self.knowledge.exception_index(condition_group).get(self.last_action)
+        if not by_offsets:
+            return []
+        x, y = pos
+        exception_ids = []
+        for offsets, signatures in by_offsets.items():
+            values = self.input_board.gather(stencil(offsets), x, y).tolist()
+            if any(math.isnan(val) for val in values):
+                for signature, signature_ids in signatures.items():
+                    if all(math.isnan(val) or val == condition[2] for condition, val in zip(signature, values)):
+                        exception_ids.extend(signature_ids)
+                continue
+            found = tuple((offset[0], offset[1], val) for offset, val in zip(offsets, values))
+            exception_ids.extend(signatures.get(found, ()))
+        if len(exception_ids) > 1:
+            order = list(condition_group.exceptions)
+            exception_ids.sort(key=order.index)
+        return exception_ids
 
     def clean_rule(self, source_rule, post_2d):
         source_rule_id = source_rule[0]
-        source_val = self.knowledge['2d/' + str(source_rule_id)]
-        source_cond_group = self.knowledge['2d/' + str(source_val) + '/' + str(source_rule_id)]
-        hold_conditions = copy.deepcopy(self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel'])
-        if self.debug: print('cleaning rule', source_rule_id, hold_conditions)
-        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel/cleaned'] = True
-        for condition in hold_conditions:
+        source_group = self.knowledge.rules[source_rule_id]
+        hold_conditions = copy.deepcopy(source_group.inclusions)
+        if self.trace.rules: self.trace.debug('rules', 'cleaning rule', source_rule_id, hold_conditions)
+        if not source_group.cleaned:
+            self.knowledge.mark(source_group)
+        source_group.cleaned = True
+        before, after = self.neighbours(hold_conditions, source_rule[1], source_rule[2])
+        for condition, prev_val, post_val in zip(hold_conditions, before, after):
             crx, cry, cod, cor = condition
             if cor != 0:
                 try:
-                    for except_id in self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/exceptions']:
+                    for except_id, exception in source_group.exceptions.items():
                         is_match = True
                         for i in range(3):
-                            source_1d = self.knowledge['1d/' + str(i) + '/' + str(source_rule_id)]
+                            source_1d = self.knowledge.rule_1d(i, source_rule_id)
                             try:
-                                if self.knowledge['1d/' + str(i) + '/' + str(source_1d) + '/oval'] != self.knowledge['1d/' + str(i) + '/' + str(source_1d) + '/exceptions/' + str(except_id) + '/oval']:
+                                if source_1d.oval != source_1d.exceptions[except_id].oval:
                                     is_match = False
-                                if self.knowledge['1d/' + str(i) + '/' + str(source_1d) + '/rel'] != self.knowledge['1d/' + str(i) + '/' + str(source_1d) + '/exceptions/' + str(except_id) + '/rel']:
+                                if source_1d.rel != source_1d.exceptions[except_id].rel:
                                     is_match = False
                             except KeyError:
-                                if self.debug: print('clean rule exception mismatch')
+                                if self.trace.rules: self.trace.debug('rules', 'clean rule exception mismatch')
                                 self.error_stop = True
                         if is_match:
-                            hold_except_conditions = copy.deepcopy(self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/exceptions/' + str(except_id) + '/rel'])
+                            hold_except_conditions = copy.deepcopy(exception.rel)
                             for exception_cond in hold_except_conditions:
                                 erx, ery, eod, eor = exception_cond
-                                if crx == erx and cry == ery and cod == eod and self.input_2D[source_rule[1] + crx][source_rule[2] + cry] == cod and post_2d[source_rule[1] + crx][source_rule[2] + cry] == self.input_2D[source_rule[1] + crx][source_rule[2] + cry]:
-                                    if self.debug: print('removing condition from inclusions/rel', condition, 'based on', exception_cond)
-                                    try:
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel/removed'].append(condition)
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/exceptions/' + str(except_id) + '/rel/removed'].append(exception_cond)
-                                    except KeyError:
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel/removed'] = [condition]
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/exceptions/' + str(except_id) + '/rel/removed'] = [exception_cond]
+                                if crx == erx and cry == ery and cod == eod and prev_val == cod and post_val == prev_val:
+                                    if self.trace.rules: self.trace.debug('rules', 'removing condition from inclusions/rel', condition, 'based on', exception_cond)
+                                    if source_group.removed is not None and exception.removed is not None:
+                                        source_group.removed.append(condition)
+                                        exception.removed.append(exception_cond)
+                                    else:
+                                        source_group.removed = [condition]
+                                        exception.removed = [exception_cond]
+                                    self.knowledge.unindex_rule(source_group)
+                                    self.knowledge.unindex_exception(exception)
                                     try:
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel'].remove(condition)
-                                        self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/exceptions/' + str(except_id) + '/rel'].remove(exception_cond)
+                                        source_group.inclusions.remove(condition)
+                                        exception.rel = exception.rel - {exception_cond}
                                     except ValueError:
                                         pass
-                                    if self.debug: print('finished removing using', except_id, hold_except_conditions)
+                                    self.knowledge.index_rule(source_group)
+                                    self.knowledge.index_exception(exception)
+                                    self.knowledge.changed(source_group.value)
+                                    self.knowledge.mark(source_group)
+                                    self.knowledge.mark(exception)
+                                    if self.trace.rules: self.trace.debug('rules', 'finished removing using', except_id, hold_except_conditions)
                 except KeyError:
-                    if self.debug: print('clean_rule keyerror')
+                    if self.trace.rules: self.trace.debug('rules', 'clean_rule keyerror')
                     pass
-        if not self.knowledge['2d/' + str(source_val) + '/' + str(source_cond_group) + '/inclusions/rel']:
+        if not source_group.inclusions:
             self.error_stop = True
 
+    # Appends the rules edited since the last save to the knowledge journal. Snapshots are saved in the original flat
+    # dict layout so older tools can still read them, but they only include the journal as of the last compaction
     def save_knowledge(self, fname):
-        np.save(fname, self.knowledge)
-        sorted_keys = list(self.knowledge.keys())
-        sorted_keys.sort()
+        self.knowledge_journal(fname).append(self.knowledge)
 
         if self.error_stop:
+            self.compact_knowledge(fname)
             raise Exception
 
+    # Writes a full snapshot now and waits for it, e.g. before exiting or reading fname with another tool
+    def compact_knowledge(self, fname):
+        self.knowledge_journal(fname).compact(self.knowledge, wait=True)
+
+    def knowledge_journal(self, fname):
+        if self.journal is None or self.journal.fname != fname:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = KnowledgeJournal(fname, self.knowledge_compact_every)
+        return self.journal
+
+    # fname is either a Knowledge.npy file or a knowledge directory written by knowledge_columns.py
     def load_knowledge(self, fname):
-        try:
-            self.knowledge = np.load(fname, allow_pickle=True).item()
-            self.plan_depth = self.knowledge['plan_depth']
-        except FileNotFoundError:
-            self.knowledge = dict()
+        store = self.knowledge_journal(fname).load()
+        if store is not None:
+            self.knowledge = store
+            if self.knowledge.plan_depth is not None:
+                self.plan_depth = self.knowledge.plan_depth
+        else:
+            self.knowledge = KnowledgeStore()
+        self.prediction_cache = OrderedDict()
+        self.goal_rule_cache = None
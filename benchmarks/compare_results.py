@@ -0,0 +1,46 @@
+import sys
+import json
+import argparse
+
+
+# Prints the change of every latency between two run_benchmarks.py results, e.g. from the commits before and after
+# a change. Ratios above 1 are slower
+def compare(old, new, threshold):
+    print('old:', old.get('commit'), 'new:', new.get('commit'))
+    regressions = 0
+    for name in sorted(set(old['functions']) | set(new['functions'])):
+        old_summary = old['functions'].get(name, {})
+        new_summary = new['functions'].get(name, {})
+        for key in sorted(set(old_summary) | set(new_summary)):
+            if not key.endswith('_ms'):
+                continue
+            old_value = old_summary.get(key)
+            new_value = new_summary.get(key)
+            if not old_value or new_value is None:
+                print(name.ljust(12), key.ljust(8), old_value, '->', new_value)
+                continue
+            ratio = new_value / old_value
+            flag = ''
+            if ratio > threshold:
+                flag = ' REGRESSION'
+                regressions += 1
+            print(name.ljust(12), key.ljust(8), round(old_value, 3), '->', round(new_value, 3), ' x' + str(round(ratio, 2)) + flag)
+    print('states expanded/sec:', old.get('states_expanded_per_second'), '->', new.get('states_expanded_per_second'))
+    if old.get('steps') != new.get('steps') or old.get('trace') != new.get('trace') or old.get('knowledge') != new.get('knowledge'):
+        print('warning: the results replayed different traces, knowledge or step counts')
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare two run_benchmarks.py results')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Ratio above which a latency counts as a regression')
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    sys.exit(1 if compare(old, new, args.threshold) else 0)
@@ -0,0 +1,75 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from puzzle_game_driver import Model, HeadlessController
+
+
+# Records the (input_1d, input_2d, action) steps of the AI playing the puzzle levels into a trace for
+# run_benchmarks.py. Each step holds the inputs before the action, the action, the inputs after it, and whether the
+# level was finished or restarted (the driver drops its plan then).
+# The knowledge file is copied into a temporary directory first, so recording doesn't change it
+def record(knowledge_file, max_steps, levels):
+    work_dir = tempfile.mkdtemp(prefix='airis_record_')
+    cwd = os.getcwd()
+    try:
+        for log_dir in ('predict_log', 'plan_log'):
+            os.makedirs(os.path.join(work_dir, log_dir))
+        if os.path.exists(knowledge_file):
+            shutil.copy(knowledge_file, os.path.join(work_dir, 'Knowledge.npy'))
+        os.chdir(work_dir)
+
+        model = Model(HeadlessController(), True, 'Knowledge.npy')
+        model.airis.log_predictions = False
+        steps = {'prior_1d': [], 'prior_2d': [], 'action': [], 'post_1d': [], 'post_2d': [], 'reset': []}
+        capture_input = model.airis.capture_input
+
+        def recording_capture_input(input_1d, input_2d, action, state, prior):
+            if not prior:
+                steps['prior_1d'].append(list(model.airis.input_1D))
+                steps['prior_2d'].append(np.array(model.airis.input_2D))
+                steps['action'].append(action)
+                steps['post_1d'].append(list(input_1d))
+                steps['post_2d'].append(np.array(input_2d))
+                steps['reset'].append(model.batteries_collected == model.num_batteries or model.maze_reset)
+            return capture_input(input_1d, input_2d, action, state, prior)
+
+        model.airis.capture_input = recording_capture_input
+        while len(steps['action']) < max_steps and model.levels_solved < levels:
+            model.update()
+            if model.batteries_collected == model.num_batteries or model.maze_reset:
+                model.update()
+        model.airis.journal.close()
+        print('recorded', len(steps['action']), 'steps,', model.levels_solved, 'levels solved,', model.deaths, 'deaths')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'prior_1d': np.array(steps['prior_1d'], dtype=np.int64),
+            'prior_2d': np.array(steps['prior_2d'], dtype=np.float64),
+            'action': np.array(steps['action']),
+            'post_1d': np.array(steps['post_1d'], dtype=np.int64),
+            'post_2d': np.array(steps['post_2d'], dtype=np.float64),
+            'reset': np.array(steps['reset'], dtype=bool),
+            'action_space': np.array(model.action_space)}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Record a puzzle game trace for run_benchmarks.py')
+    parser.add_argument('--knowledge', default=os.path.join(REPO_DIR, 'Knowledge - Trained Copy.npy'), help='Knowledge the AI plays with, the file itself is not changed')
+    parser.add_argument('--steps', type=int, default=2000, help='Maximum number of steps to record')
+    parser.add_argument('--levels', type=int, default=13, help='Stop after this many levels are solved')
+    parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'traces', 'puzzle_levels.npz'))
+    args = parser.parse_args()
+
+    trace = record(os.path.abspath(args.knowledge), args.steps, args.levels)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    np.savez_compressed(args.output, **trace)
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from collections import defaultdict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from airis_stable import AIRIS
+
+# Goal the puzzle game driver gives the AI: collect a battery
+PUZZLE_GOAL = [[[2, '+']], []]
+TIMED_FUNCTIONS = ('predict', 'make_plan', 'compare', 'create_rule', 'update_rule')
+PERCENTILES = (50, 90, 95, 99)
+
+
+# Replaces the AIRIS methods in `names` on one instance with wrappers that record the seconds of every call.
+# Methods call each other through self, so nested calls are timed too and each time includes its callees
+class CallTimer(object):
+
+    def __init__(self, airis, names):
+        self.times = defaultdict(list)
+        for name in names:
+            self.wrap(airis, name)
+
+    def wrap(self, airis, name):
+        method = getattr(airis, name)
+        times = self.times[name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times.append(time.perf_counter() - start)
+
+        setattr(airis, name, timed)
+
+    def summary(self, name):
+        times = np.array(self.times[name]) * 1000
+        result = {'calls': len(times), 'total_s': round(float(times.sum()) / 1000, 6)}
+        if len(times):
+            result['mean_ms'] = round(float(times.mean()), 6)
+            for percentile in PERCENTILES:
+                result['p' + str(percentile) + '_ms'] = round(float(np.percentile(times, percentile)), 6)
+            result['max_ms'] = round(float(times.max()), 6)
+        return result
+
+
+# Replays a recorded trace against a fresh AIRIS loaded from the knowledge snapshot. At every step the AI makes a
+# plan from the recorded state, then observes the recorded action and its outcome the same way it does when a human
+# plays, so it keeps learning from the trace as it would in the game.
+# make_plan raises plan_depth whenever a search runs out of depth; it is set back to the snapshot's value before every
+# step, so each plan searches the same depth however many plans came before it
+def replay(trace, knowledge_file, steps, planner_processes, plan_max_states=None, plan_deadline_ms=0):
+    airis = AIRIS([], [], [str(act) for act in trace['action_space']])
+    airis.load_knowledge(knowledge_file)
+    plan_depth = airis.plan_depth
+    airis.given_goal_state = PUZZLE_GOAL
+    airis.log_predictions = False
+    airis.planner_processes = planner_processes
+    if plan_max_states is not None:
+        airis.plan_max_states = plan_max_states
+    airis.plan_deadline_ms = plan_deadline_ms
+    timer = CallTimer(airis, TIMED_FUNCTIONS)
+
+    expanded = []
+    peaks = []
+    make_plan = airis.make_plan
+
+    def counting_make_plan(given_goal, generated):
+        result = make_plan(given_goal, generated)
+        expanded.append(len(airis.states) - 1)
+        peaks.append(airis.plan_states_peak)
+        return result
+
+    airis.make_plan = counting_make_plan
+
+    start = time.perf_counter()
+    for step in range(steps):
+        prior_1d = trace['prior_1d'][step].tolist()
+        prior_2d = trace['prior_2d'][step]
+        action = str(trace['action'][step])
+
+        airis.observe_mode = False
+        airis.action_plan = []
+        airis.plan_depth = plan_depth
+        airis.capture_input(prior_1d, prior_2d, None, None, True)
+
+        airis.observe_mode = True
+        airis.action_plan = []
+        act, state = airis.capture_input(prior_1d, prior_2d, action, None, True)
+        airis.capture_input(trace['post_1d'][step].tolist(), trace['post_2d'][step], act, state, False)
+        if trace['reset'][step]:
+            airis.pos_change_2D = []
+    elapsed = time.perf_counter() - start
+    airis.journal.close()
+    airis.close_planner_pool()
+
+    plan_time = sum(timer.times['make_plan'])
+    return {'wall_time_s': round(elapsed, 6),
+            'functions': dict((name, timer.summary(name)) for name in TIMED_FUNCTIONS),
+            'states_expanded': int(sum(expanded)),
+            'states_expanded_per_second': round(sum(expanded) / plan_time, 3) if plan_time else None,
+            'plan_states_peak': max(peaks) if peaks else 0,
+            'plan_states_dropped': airis.plan_states_dropped_total,
+            'prediction_cache_hits': airis.prediction_cache_hits,
+            'prediction_cache_misses': airis.prediction_cache_misses,
+            'prediction_cache_stale': airis.prediction_cache_stale}
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR, stderr=subprocess.DEVNULL).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run(trace_file, knowledge_file, steps, planner_processes, plan_max_states=None, plan_deadline_ms=0):
+    trace = np.load(trace_file)
+    if not steps or steps > len(trace['action']):
+        steps = len(trace['action'])
+    commit, dirty = git_commit()
+
+    # predict and make_plan write their logs to the working directory
+    work_dir = tempfile.mkdtemp(prefix='airis_benchmark_')
+    cwd = os.getcwd()
+    try:
+        for log_dir in ('predict_log', 'plan_log'):
+            os.makedirs(os.path.join(work_dir, log_dir))
+        os.chdir(work_dir)
+        results = replay(trace, knowledge_file, steps, planner_processes, plan_max_states, plan_deadline_ms)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    header = {'commit': commit,
+              'dirty': dirty,
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'trace': os.path.relpath(trace_file, REPO_DIR),
+              'knowledge': os.path.relpath(knowledge_file, REPO_DIR),
+              'steps': steps,
+              'planner_processes': planner_processes,
+              'plan_max_states': plan_max_states,
+              'plan_deadline_ms': plan_deadline_ms}
+    header.update(results)
+    return header
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Replay a recorded puzzle game trace and report per call latencies')
+    parser.add_argument('--trace', default=os.path.join(BENCHMARKS_DIR, 'traces', 'puzzle_levels.npz'), help='Trace written by record_trace.py')
+    parser.add_argument('--knowledge', default=os.path.join(REPO_DIR, 'Knowledge - Trained Copy.npy'), help='Knowledge snapshot to start from, the file itself is not changed')
+    parser.add_argument('--steps', type=int, default=0, help='Number of trace steps to replay, 0 replays the whole trace')
+    parser.add_argument('--planner-processes', type=int, default=0, help='Worker processes for planning predictions (see planner_pool.py)')
+    parser.add_argument('--plan-max-states', type=int, default=None, help='Memory budget of each plan in states (see plan_budget.py), the AIRIS default if not given')
+    parser.add_argument('--plan-deadline-ms', type=float, default=0, help='Milliseconds each plan search may take, 0 for no limit')
+    parser.add_argument('--output', default=None, help='JSON file for the results, benchmarks/results/<commit>.json by default')
+    args = parser.parse_args()
+
+    results = run(os.path.abspath(args.trace), os.path.abspath(args.knowledge), args.steps, args.planner_processes, args.plan_max_states, args.plan_deadline_ms)
+
+    output = args.output
+    if output is None:
+        name = (results['commit'] or 'results')[:10] + ('-dirty' if results['dirty'] else '')
+        output = os.path.join(BENCHMARKS_DIR, 'results', name + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for name in TIMED_FUNCTIONS:
+        summary = results['functions'][name]
+        print(name.ljust(12), 'calls:', summary['calls'], ' '.join(key + ': ' + str(round(summary[key], 3)) for key in ('p50_ms', 'p90_ms', 'p99_ms') if key in summary))
+    print('states expanded/sec:', results['states_expanded_per_second'], 'wall time:', round(results['wall_time_s'], 2))
+    print('most states held by a plan:', results['plan_states_peak'], 'states dropped:', results['plan_states_dropped'])
+    print('results written to', output)
@@ -0,0 +1,93 @@
+import numpy as np
+
+# The vis_ref and aux_ref lists of the conditions stored under one action/output/focus value path of the knowledge,
+# compiled into flat arrays so compare_conditions scores every condition against every position of the focus value in
+# one pass instead of looping over the refs in Python. Refs of consecutive conditions sit next to each other, each
+# condition's run starting at its entry in vis_starts / aux_starts. Conditions are only ever appended to a path and a
+# stored condition's refs don't change, so refresh() only compiles the conditions added since it last ran
+class ConditionRefs(object):
+
+    def __init__(self, condition_list):
+        self.condition_list = condition_list
+        self.condition_ids = []
+        # number of refs lists (vis_ref and aux_ref) each condition has, compare_conditions counts them per position
+        self.ref_lists = []
+
+        self.vis_refs = []
+        self.vis_starts = []
+        self.vis_conditions = []
+        self.aux_refs = []
+        self.aux_starts = []
+        self.aux_conditions = []
+
+    # compiles the conditions of condition_path added to the knowledge since the last call
+    def refresh(self, knowledge, condition_path):
+        if len(self.condition_ids) == len(self.condition_list):
+            return
+        for condition_id in self.condition_list[len(self.condition_ids):]:
+            data_path = condition_path + '/' + str(condition_id) + '/'
+            k = len(self.condition_ids)
+            self.condition_ids.append(condition_id)
+            ref_lists = 0
+            try:
+                vis_ref = knowledge[data_path + 'vis_ref']
+                ref_lists += 1
+                if vis_ref:
+                    self.vis_starts.append(len(self.vis_refs))
+                    self.vis_conditions.append(k)
+                    self.vis_refs.extend((dx, dy, prior_val) for dx, dy, prior_val, _ in vis_ref)
+            except KeyError:
+                pass
+            try:
+                aux_ref = knowledge[data_path + 'aux_ref']
+                ref_lists += 1
+                if aux_ref:
+                    self.aux_starts.append(len(self.aux_refs))
+                    self.aux_conditions.append(k)
+                    self.aux_refs.extend((i, prior_val) for i, prior_val, _ in aux_ref)
+            except KeyError:
+                pass
+            self.ref_lists.append(ref_lists)
+
+        self.ref_list_count = sum(self.ref_lists)
+        # compare_conditions only counts a condition once one of the conditions before it, or itself, has refs
+        self.first_counted = next((k for k, n in enumerate(self.ref_lists) if n), None)
+
+        vis_refs = np.array(self.vis_refs, dtype=np.float64).reshape(-1, 3)
+        self.vis_dx = vis_refs[:, 0].astype(np.int64)
+        self.vis_dy = vis_refs[:, 1].astype(np.int64)
+        self.vis_prior = vis_refs[:, 2].astype(np.float32)
+        aux_refs = np.array(self.aux_refs, dtype=np.float64).reshape(-1, 2)
+        self.aux_i = aux_refs[:, 0].astype(np.int64)
+        self.aux_prior = aux_refs[:, 1].astype(np.float32)
+
+    # difference of every condition (columns) to vis_env and aux_env with the focus value at each of xs, ys (rows),
+    # the sum of abs(actual - prior_val) over the refs inside the env, rounded to round_to decimals
+    def score(self, vis_env, aux_env, xs, ys, round_to):
+        difs = np.zeros((len(xs), len(self.condition_ids)), dtype=np.float32)
+
+        if len(self.vis_dx) and vis_env.size:
+            x = xs[:, None] + self.vis_dx
+            y = ys[:, None] + self.vis_dy
+            inside = (x >= 0) & (x < vis_env.shape[0]) & (y >= 0) & (y < vis_env.shape[1])
+            actual = vis_env[np.where(inside, x, 0), np.where(inside, y, 0)]
+            ref_difs = np.where(inside, np.abs(actual - self.vis_prior), np.float32(0))
+            difs[:, self.vis_conditions] = np.add.reduceat(ref_difs, self.vis_starts, axis=1)
+
+        if len(self.aux_i) and len(aux_env):
+            inside = self.aux_i < len(aux_env)
+            actual = aux_env[np.where(inside, self.aux_i, 0)]
+            ref_difs = np.where(inside, np.abs(actual - self.aux_prior), np.float32(0))
+            aux_difs = np.zeros(len(self.condition_ids), dtype=np.float32)
+            aux_difs[self.aux_conditions] = np.add.reduceat(ref_difs, self.aux_starts)
+            difs += aux_difs
+
+        return np.round(difs, round_to)
+
+    # which entries of score() compare_conditions counts, see first_counted
+    def counted(self, positions):
+        counted = np.zeros((positions, len(self.condition_ids)), dtype=bool)
+        if self.first_counted is not None:
+            counted[0, self.first_counted:] = True
+            counted[1:] = True
+        return counted
@@ -0,0 +1,166 @@
+from collections import deque
+import threading
+import atexit
+import time
+import os
+
+# Debug tracing for AIRIS.
+# Records go to named channels, each with its own level, and are written to the console or appended to a log file.
+# Every channel is also a boolean attribute of the Tracer that is True while it takes DEBUG records, and call sites
+# test it before building a record:
+#     if self.trace.predict: self.trace.debug('predict', 'pos', pos, val)
+# so a channel that is off costs one attribute read and nothing is formatted. Arguments are formatted the way print()
+# does it, and only for records that are written. Wrap anything expensive to format in Lazy so it isn't built before
+# then either.
+# Log files, the trace files as well as ./predict_log and ./plan_log, are written by a LogWriter on a background
+# thread, so the AI doesn't wait on the disk
+OFF = 100
+ERROR = 40
+WARNING = 30
+INFO = 20
+DEBUG = 10
+
+CHANNELS = ('capture', 'plan', 'predict', 'rules', 'knowledge')
+
+
+# An argument formatted only when its record is written: str(function(*args))
+class Lazy(object):
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+
+# A board printed with one row per line, transposed so it reads like the screen, values rounded and zeros left blank
+def board_text(input_2D):
+    lines = []
+    for r, row in enumerate(zip(*input_2D)):
+        cells = []
+        for val in row:
+            cell = '%.0f' % val
+            if cell == '0':
+                cell = '  '
+            elif int(cell) < 10:
+                cell = ' ' + cell
+            cells.append(cell)
+        lines.append(str(cells) + ' ' + str(r))
+    lines.append('')
+    lines.append(str([' ' + str(i) if i < 10 else str(i) for i in range(20)]))
+    return '\n'.join(lines)
+
+
+# Appends lines to files on a background thread. write() only queues the line, the thread writes what is queued
+# every `interval` seconds with one open per file. A line is any object, turned into text with str() on the
+# thread, so it must not change after it is queued. flush() writes everything queued so far and waits for it.
+# Lines for a file that can't be opened are dropped with a message rather than stopping the thread.
+# One writer serves the whole process, see log_writer()
+class LogWriter(object):
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def write(self, path, line):
+        self.queue.append((path, line))
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending = dict()
+            while self.queue:
+                path, line = self.queue.popleft()
+                try:
+                    pending[path].append(line)
+                except KeyError:
+                    pending[path] = [line]
+            for path, lines in pending.items():
+                try:
+                    with open(path, 'a') as f:
+                        f.write(''.join(str(line) + '\n' for line in lines))
+                except OSError as e:
+                    print('Log lines dropped:', e)
+
+
+writer = None
+writer_pid = None
+
+
+# The LogWriter of this process. A forked process doesn't have its parent's writer thread, so it starts its own
+def log_writer():
+    global writer, writer_pid
+    if writer is None or writer_pid != os.getpid():
+        writer = LogWriter()
+        writer_pid = os.getpid()
+    return writer
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.levels = dict.fromkeys(CHANNELS, OFF)
+        # Log file of each channel, None writes to the console
+        self.paths = dict.fromkeys(CHANNELS)
+        for channel in CHANNELS:
+            setattr(self, channel, False)
+
+    # Turns channels (all of them by default) on for records of level and above, written to path or the console
+    def enable(self, channels=CHANNELS, level=DEBUG, path=None):
+        if isinstance(channels, str):
+            channels = (channels,)
+        for channel in channels:
+            self.levels[channel] = level
+            self.paths[channel] = path
+            setattr(self, channel, level <= DEBUG)
+
+    def disable(self, channels=CHANNELS):
+        self.enable(channels, OFF)
+
+    # Whether any channel takes DEBUG records
+    def active(self):
+        return any(getattr(self, channel) for channel in CHANNELS)
+
+    def enabled(self, channel, level):
+        return self.levels[channel] <= level
+
+    def log(self, channel, level, *args):
+        if self.levels[channel] > level:
+            return
+        text = ' '.join([str(arg) for arg in args])
+        path = self.paths[channel]
+        if path is None:
+            print(text)
+        else:
+            log_writer().write(path, text)
+
+    def debug(self, channel, *args):
+        self.log(channel, DEBUG, *args)
+
+    def info(self, channel, *args):
+        self.log(channel, INFO, *args)
+
+    def warning(self, channel, *args):
+        self.log(channel, WARNING, *args)
+
+    def error(self, channel, *args):
+        self.log(channel, ERROR, *args)
+
+    # Appends line to path through the LogWriter, e.g. a predicted board to ./predict_log
+    def write(self, path, line):
+        log_writer().write(path, line)
+
+    # Writes out everything queued for the log files and waits for it
+    def flush(self):
+        if writer is not None and writer_pid == os.getpid():
+            writer.flush()
@@ -10,6 +10,19 @@ class GameObject(object):
 
         # store id and position pixel size
         self.id = identification_number
+        self.game_image_file_path = image_file_path
+        self.representation_image_file_path = represent_file_path
+
+        # images are loaded the first time the object is drawn, so the game
+        # can run without a display (puzzle_game_driver.py --headless)
+        self.floor_image = None
+        self.image1 = None
+        self.rep = None
+
+    def load_images(self):
+
+        if self.image1 is not None:
+            return
 
         # get floor image
         im0 = pygame.image.load('./images/Puzzle_Game/Game/Floor_0.png')
@@ -18,12 +31,10 @@ class GameObject(object):
         self.floor_image = pygame.transform.scale(im0, GAME_POS_SIZE)
 
         # get main image
-        self.game_image_file_path = image_file_path
         im1 = pygame.image.load(self.game_image_file_path)
         self.image1 = pygame.transform.scale(im1, GAME_POS_SIZE)
 
         # get representation image
-        self.representation_image_file_path = represent_file_path
         rep = pygame.image.load(self.representation_image_file_path)
         self.rep = pygame.transform.scale(rep, REP_POS_SIZE)
 
@@ -31,6 +42,8 @@ class GameObject(object):
         # map_start is the pixel coordnates of where the game map starts
         # x and y are the position coordinates of this Floor object
 
+        self.load_images()
+
         # draw floor first every time
         view.surface.blit(self.floor_image, \
             (GAME_MAP_START[0]+x*GAME_POS_SIZE[0], \
@@ -47,6 +60,8 @@ class GameObject(object):
         # map_start is the pixel coordnates of where the game map starts
         # x and y are the position coordinates of this Floor object
 
+        self.load_images()
+
         # draw representation image
         view.surface.blit(self.rep, \
             (REP_MAP_START[0]+x*REP_POS_SIZE[0], \
@@ -193,6 +208,14 @@ class CharacterOnObject(GameObject):
             './images/Puzzle_Game/Game/CharS_0.png', represent_file_path)
 
         self.game_image_file_path2 = image_file_path2
+        self.image2 = None
+
+    def load_images(self):
+
+        if self.image2 is not None:
+            return
+        super(CharacterOnObject, self).load_images()
+
         im2 = pygame.image.load(self.game_image_file_path2)
         colorkey = im2.get_at((0,0))
         im2.set_colorkey(colorkey, RLEACCEL)
@@ -202,6 +225,8 @@ class CharacterOnObject(GameObject):
         # map_start is the pixel coordnates of where the game map starts
         # x and y are the position coordinates of this Floor object
 
+        self.load_images()
+
         # draw floor first
         view.surface.blit(self.floor_image, \
             (GAME_MAP_START[0]+x*GAME_POS_SIZE[0], GAME_MAP_START[1]+y*GAME_POS_SIZE[1]))
@@ -0,0 +1,608 @@
+from knowledge_store import KnowledgeStore, ValueRules, ConditionGroup, ExceptionGroup, Dimension1D, Rule1D, Exception1D
+import numpy as np
+import json
+import sys
+import os
+
+# Pickle-free, memory-mapped knowledge format.
+# A knowledge directory holds header.json and one .npy file per table. Every table is a plain or structured NumPy array,
+# saved without pickle and opened with mmap_mode='r', and several processes reading the same directory share its pages.
+# Loading only reads the ids of the records, each value's rules and each 1D index's rules are built from the mapped
+# tables the first time they are asked for (see ColumnReader), so a process only pays for the rules it reads. The
+# recorded boards of the rules (oraw / lraw), which are most of the data and are never read while planning, stay
+# views into the mapped file.
+# Table files carry the generation of the snapshot they belong to and header.json is replaced last, so a snapshot
+# being written never disturbs the one that is being read.
+#
+# Convert an existing knowledge file with
+#     python knowledge_columns.py "Knowledge - Trained Copy.npy" "Knowledge - Trained Copy"
+# and back with
+#     python knowledge_columns.py "Knowledge - Trained Copy" Knowledge.npy
+
+HEADER = 'header.json'
+FORMAT = 'airis-knowledge-columns'
+VERSION = 1
+
+# Any key or value that is not a record is stored as a scalar: a kind code plus a float and an integer column.
+# Strings are indexes into the string table
+KIND_NONE = 0
+KIND_BOOL = 1
+KIND_INT = 2
+KIND_FLOAT = 3
+KIND_STR = 4
+KIND_NP_INT = 5
+KIND_NP_FLOAT = 6
+SCALAR = [('kind', 'i1'), ('number', 'f8'), ('integer', 'i8')]
+
+# Owners of rows in the shared count, condition and lrules tables
+OWNER_GROUP = 0
+OWNER_EXCEPTION = 1
+OWNER_RULE_1D = 2
+OWNER_EXCEPTION_1D = 3
+
+# Count dicts ({key: [hits, total]}) of each owner, by field code
+COUNT_FIELDS = {
+    OWNER_GROUP: ('act', 'rel', 'abs', 'apos', 'rstep', 'mrules'),
+    OWNER_EXCEPTION: ('act', 'apos', 'rstep', 'mrules'),
+    OWNER_RULE_1D: ('oval', 'rel', 'abs'),
+    OWNER_EXCEPTION_1D: ('oval', 'rel'),
+}
+
+# Condition lists and sets, by field code
+CONDITION_FIELDS = (
+    (OWNER_GROUP, 'inclusions'),
+    (OWNER_GROUP, 'inclusion_set'),
+    (OWNER_GROUP, 'removed'),
+    (OWNER_EXCEPTION, 'rel'),
+    (OWNER_EXCEPTION, 'removed'),
+)
+
+# Bits of the flags column of the groups and exceptions tables, set when the optional field is not None
+FLAG_INCLUSIONS = 1
+FLAG_INCLUSION_SET = 2
+FLAG_REMOVED = 4
+FLAG_LRULES = 8
+
+DTYPES = {
+    'values': np.dtype(SCALAR),
+    'groups': np.dtype([('value', 'i8'), ('index', 'i8'), ('id', 'i8'), ('lstep', SCALAR), ('combined', '?'),
+                        ('cleaned', '?'), ('flags', 'i1'), ('oraw', 'i8'), ('lraw', 'i8')]),
+    'exceptions': np.dtype([('group', 'i8'), ('id', 'i8'), ('lstep', SCALAR), ('flags', 'i1')]),
+    'dims': np.dtype(SCALAR),
+    'rules_1d': np.dtype([('dim', 'i8'), ('index', 'i8')]),
+    'dim_rules': np.dtype([('dim', 'i8'), ('rule', 'i8'), ('rule_1d', 'i8')]),
+    'exceptions_1d': np.dtype([('rule_1d', 'i8'), ('id', 'i8')]),
+    'rule_dims': np.dtype([('rule', 'i8'), ('dim', SCALAR)]),
+    'action_rules': np.dtype([('action', SCALAR), ('rule', 'i8')]),
+    'counts': np.dtype([('owner', 'i1'), ('row', 'i8'), ('field', 'i1'), ('key', SCALAR), ('hits', 'i8'), ('total', 'i8')]),
+    'conditions': np.dtype([('field', 'i1'), ('row', 'i8'), ('x', SCALAR), ('y', SCALAR), ('value', SCALAR), ('change', SCALAR)]),
+    'lrules': np.dtype([('owner', 'i1'), ('row', 'i8'), ('rule', SCALAR)]),
+    'misc': np.dtype([('key', SCALAR), ('length', 'i8')]),
+    'misc_items': np.dtype(SCALAR),
+    'raws': np.dtype([('vector_start', 'i8'), ('vector_length', 'i8'), ('board', 'i8')]),
+    'raw_vectors': np.dtype(SCALAR),
+    'boards': np.dtype([('offset', 'i8'), ('width', 'i8'), ('height', 'i8')]),
+    'cells': np.dtype('f8'),
+}
+
+
+def is_columns(path):
+    return os.path.isfile(os.path.join(path, HEADER))
+
+
+# Builds the tables of a store. Everything is copied out of the store, so the tables can be written on another thread
+class ColumnEncoder(object):
+
+    def __init__(self):
+        self.strings = dict()
+        self.rows = dict((name, []) for name in DTYPES.keys())
+        self.board_rows = dict()
+        self.cell_count = 0
+
+    def string(self, text):
+        try:
+            return self.strings[text]
+        except KeyError:
+            self.strings[text] = len(self.strings)
+            return self.strings[text]
+
+    def scalar(self, val):
+        if val is None:
+            return KIND_NONE, 0.0, 0
+        if isinstance(val, bool):
+            return KIND_BOOL, 0.0, int(val)
+        if isinstance(val, int):
+            return KIND_INT, 0.0, val
+        if isinstance(val, float):
+            return KIND_FLOAT, val, 0
+        if isinstance(val, str):
+            return KIND_STR, 0.0, self.string(val)
+        if isinstance(val, np.integer):
+            return KIND_NP_INT, 0.0, int(val)
+        if isinstance(val, np.floating):
+            return KIND_NP_FLOAT, float(val), 0
+        raise ValueError('cannot store ' + repr(val) + ' in a knowledge table')
+
+    def counts(self, owner, row, record):
+        for field, name in enumerate(COUNT_FIELDS[owner]):
+            for key, data in getattr(record, name).items():
+                if len(data) != 2 or not all(type(d) is int for d in data):
+                    raise ValueError('cannot store count ' + repr(data) + ' in a knowledge table')
+                self.rows['counts'].append((owner, row, field, self.scalar(key), data[0], data[1]))
+
+    def conditions(self, owner, row, record):
+        for field, (field_owner, name) in enumerate(CONDITION_FIELDS):
+            if field_owner != owner:
+                continue
+            for condition in getattr(record, name) or ():
+                if len(condition) != 4:
+                    raise ValueError('cannot store condition ' + repr(condition) + ' in a knowledge table')
+                self.rows['conditions'].append((field, row) + tuple(self.scalar(c) for c in condition))
+
+    def lrules(self, owner, row, lrules):
+        for rule in lrules or ():
+            self.rows['lrules'].append((owner, row, self.scalar(rule)))
+
+    # [input_1D, input_2D] recorded with a rule. Boards shared between raws are stored once
+    def raw(self, raw):
+        if raw is None:
+            return -1
+        vector, board = raw
+        board_row = self.board_rows.get(id(board))
+        if board_row is None:
+            # Boards are stored as floats, which is what the environments pass in
+            if not isinstance(board, np.ndarray) and not all(type(cell) is float for column in board for cell in column):
+                raise ValueError('cannot store a board with non float cells in a knowledge table')
+            cells = np.asarray(board, dtype=float)
+            if cells.ndim != 2:
+                raise ValueError('cannot store a board of shape ' + str(cells.shape) + ' in a knowledge table')
+            board_row = len(self.rows['boards'])
+            self.board_rows[id(board)] = board_row
+            self.rows['boards'].append((self.cell_count, cells.shape[0], cells.shape[1]))
+            self.rows['cells'].append(cells.ravel())
+            self.cell_count += cells.size
+        self.rows['raws'].append((len(self.rows['raw_vectors']), len(vector), board_row))
+        for val in vector:
+            self.rows['raw_vectors'].append(self.scalar(val))
+        return len(self.rows['raws']) - 1
+
+    def encode(self, store):
+        for vi, (value, value_rules) in enumerate(store.values.items()):
+            self.rows['values'].append(self.scalar(value))
+            for group in value_rules.groups:
+                row = len(self.rows['groups'])
+                flags = 0
+                if group.inclusions is not None:
+                    flags |= FLAG_INCLUSIONS
+                if group.inclusion_set is not None:
+                    flags |= FLAG_INCLUSION_SET
+                if group.removed is not None:
+                    flags |= FLAG_REMOVED
+                if group.lrules is not None:
+                    flags |= FLAG_LRULES
+                self.rows['groups'].append((vi, group.index, self.string(group.id), self.scalar(group.lstep), group.combined,
+                                            group.cleaned, flags, self.raw(group.oraw), self.raw(group.lraw)))
+                self.counts(OWNER_GROUP, row, group)
+                self.conditions(OWNER_GROUP, row, group)
+                self.lrules(OWNER_GROUP, row, group.lrules)
+
+                for exception in group.exceptions.values():
+                    exception_row = len(self.rows['exceptions'])
+                    flags = 0
+                    if exception.removed is not None:
+                        flags |= FLAG_REMOVED
+                    if exception.lrules is not None:
+                        flags |= FLAG_LRULES
+                    self.rows['exceptions'].append((row, self.string(exception.id), self.scalar(exception.lstep), flags))
+                    self.counts(OWNER_EXCEPTION, exception_row, exception)
+                    self.conditions(OWNER_EXCEPTION, exception_row, exception)
+                    self.lrules(OWNER_EXCEPTION, exception_row, exception.lrules)
+
+        for di, (dim, dimension) in enumerate(store.dims.items()):
+            self.rows['dims'].append(self.scalar(dim))
+            rule_1d_rows = dict()
+            for rule_1d in dimension.groups:
+                rule_1d_row = len(self.rows['rules_1d'])
+                rule_1d_rows[id(rule_1d)] = rule_1d_row
+                self.rows['rules_1d'].append((di, rule_1d.index))
+                self.counts(OWNER_RULE_1D, rule_1d_row, rule_1d)
+                for exception_id, exception_1d in rule_1d.exceptions.items():
+                    self.counts(OWNER_EXCEPTION_1D, len(self.rows['exceptions_1d']), exception_1d)
+                    self.rows['exceptions_1d'].append((rule_1d_row, self.string(exception_id)))
+            for rule_id in dimension.rule_ids:
+                self.rows['dim_rules'].append((di, self.string(rule_id), rule_1d_rows[id(dimension.rule_groups[rule_id])]))
+
+        for rule_id, dims in store.rule_dims.items():
+            for dim in dims:
+                self.rows['rule_dims'].append((self.string(rule_id), self.scalar(dim)))
+
+        for act, rule_ids in store.action_rules.items():
+            for rule_id in rule_ids:
+                self.rows['action_rules'].append((self.scalar(act), self.string(rule_id)))
+
+        for key, val in store.misc.items():
+            if not isinstance(val, list):
+                raise ValueError('cannot store ' + repr(key) + ' in a knowledge table')
+            self.rows['misc'].append((self.scalar(key), len(val)))
+            for item in val:
+                self.rows['misc_items'].append(self.scalar(item))
+
+        tables = dict()
+        for name, dtype in DTYPES.items():
+            if name == 'cells':
+                tables[name] = np.concatenate(self.rows[name]) if self.rows[name] else np.zeros(0)
+            else:
+                tables[name] = np.array(self.rows[name], dtype=dtype)
+        strings = sorted(self.strings.keys(), key=self.strings.get)
+        tables['strings'] = np.array(strings, dtype=str) if strings else np.zeros(0, dtype='<U1')
+        header = {'format': FORMAT, 'version': VERSION, 'plan_depth': store.plan_depth}
+        return header, tables
+
+
+# Writes encoded tables as a new generation of the knowledge directory at path. sync=False skips the fsyncs, for
+# directories that don't have to survive a crash
+def write_columns(path, header, tables, sync=True):
+    os.makedirs(path, exist_ok=True)
+    generation = 0
+    if is_columns(path):
+        with open(os.path.join(path, HEADER)) as f:
+            generation = json.load(f).get('generation', -1) + 1
+
+    header = dict(header)
+    header['generation'] = generation
+    header['tables'] = dict()
+    for name, table in tables.items():
+        table_name = name + '.' + str(generation) + '.npy'
+        with open(os.path.join(path, table_name), 'wb') as f:
+            np.save(f, table, allow_pickle=False)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        header['tables'][name] = table_name
+
+    temp_name = os.path.join(path, HEADER + '.tmp')
+    with open(temp_name, 'w') as f:
+        json.dump(header, f, indent=1)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+    os.replace(temp_name, os.path.join(path, HEADER))
+
+    # Tables of older generations. Files still mapped by a process can't be removed on some systems, those are
+    # tried again by the next snapshot
+    current = set(header['tables'].values())
+    for fname in os.listdir(path):
+        if fname.endswith('.npy') and fname not in current:
+            try:
+                os.remove(os.path.join(path, fname))
+            except OSError:
+                pass
+
+
+def save_columns(store, path, sync=True):
+    header, tables = ColumnEncoder().encode(store)
+    write_columns(path, header, tables, sync)
+
+
+# A dict of records of a knowledge directory that builds each record the first time it is asked for.
+# pending maps the keys that are not built yet to the row build() takes, build() adds the records of that row with
+# add(). Whatever needs every key (len() aside) builds the rest first, and puts the keys back in table order
+class LazyRecords(dict):
+
+    def __init__(self, pending, build):
+        dict.__init__(self)
+        self.pending = pending
+        self.order = list(pending)
+        self.build = build
+
+    def add(self, key, record):
+        self.pending.pop(key, None)
+        dict.__setitem__(self, key, record)
+
+    def load(self):
+        if not self.order:
+            return
+        while self.pending:
+            self.build(next(iter(self.pending.values())))
+        built = dict(dict.items(self))
+        dict.clear(self)
+        for key in self.order:
+            if key in built:
+                dict.__setitem__(self, key, built.pop(key))
+        dict.update(self, built)
+        self.order = []
+
+    def __missing__(self, key):
+        if key not in self.pending:
+            raise KeyError(key)
+        self.build(self.pending[key])
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self.pending:
+            return self[key]
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key in self.pending or dict.__contains__(self, key)
+
+    def __len__(self):
+        return dict.__len__(self) + len(self.pending)
+
+    def __setitem__(self, key, record):
+        self.add(key, record)
+
+    def __delitem__(self, key):
+        if key in self.pending:
+            del self.pending[key]
+        else:
+            dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self.pending:
+            self[key]
+        return dict.pop(self, key, *default)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def copy(self):
+        self.load()
+        return dict(dict.items(self))
+
+    def __eq__(self, other):
+        self.load()
+        return dict.__eq__(self, other)
+
+    def __repr__(self):
+        self.load()
+        return dict.__repr__(self)
+
+
+# Reads the mapped tables of a knowledge directory into a KnowledgeStore. Only the keys of the store (rule,
+# exception, value and 1D index ids) and the small rule_dims, action_rules and misc tables are read up front. The
+# records of a value (its condition groups and their exceptions) and of a 1D index are built from the rows of the
+# tables that belong to them the first time one of them is asked for, the rest stays in the shared mapped pages
+class ColumnReader(object):
+
+    def __init__(self, header, tables):
+        self.tables = tables
+        self.strings = tables['strings'].tolist()
+        # (positions, owner rows) of the rows of each owner in the counts, conditions and lrules tables, by
+        # (table, owner), built on first use
+        self.owner_index = dict()
+        # Views of the boards built so far, by board row
+        self.boards = dict()
+
+        store = KnowledgeStore()
+        store.plan_depth = header.get('plan_depth')
+        self.values = [self.scalar(data) for data in tables['values'].tolist()]
+        self.dims = [self.scalar(data) for data in tables['dims'].tolist()]
+
+        # The rows of a value's groups, of a group's exceptions, of a 1D index's rules and names and of a 1D rule's
+        # exceptions are contiguous, in the order of the value, group, index and rule they belong to
+        groups = tables['groups']
+        group_values = groups['value'].tolist()
+        self.group_starts = np.searchsorted(groups['value'], np.arange(len(self.values) + 1)).tolist()
+        exception_groups = tables['exceptions']['group']
+        self.exception_starts = np.searchsorted(exception_groups, np.arange(len(groups) + 1)).tolist()
+        self.rule_1d_starts = np.searchsorted(tables['rules_1d']['dim'], np.arange(len(self.dims) + 1)).tolist()
+        self.dim_rule_starts = np.searchsorted(tables['dim_rules']['dim'], np.arange(len(self.dims) + 1)).tolist()
+        self.exception_1d_starts = np.searchsorted(tables['exceptions_1d']['rule_1d'],
+                                                   np.arange(len(tables['rules_1d']) + 1)).tolist()
+
+        store.values = LazyRecords(dict((value, vi) for vi, value in enumerate(self.values)), self.build_value)
+        store.rules = LazyRecords(dict((self.strings[id_row], vi) for vi, id_row in zip(group_values, groups['id'].tolist())),
+                                  self.build_value)
+        exception_values = groups['value'][exception_groups].tolist()
+        store.exceptions = LazyRecords(dict((self.strings[id_row], vi) for vi, id_row in
+                                            zip(exception_values, tables['exceptions']['id'].tolist())), self.build_value)
+        store.dims = LazyRecords(dict((dim, di) for di, dim in enumerate(self.dims)), self.build_dim)
+        self.store = store
+
+        for rule_row, dim in tables['rule_dims'].tolist():
+            rule_id = self.strings[rule_row]
+            try:
+                store.rule_dims[rule_id].add(self.scalar(dim))
+            except KeyError:
+                store.rule_dims[rule_id] = {self.scalar(dim)}
+
+        for act, rule_row in tables['action_rules'].tolist():
+            try:
+                store.action_rules[self.scalar(act)].append(self.strings[rule_row])
+            except KeyError:
+                store.action_rules[self.scalar(act)] = [self.strings[rule_row]]
+
+        start = 0
+        misc_items = tables['misc_items'].tolist()
+        for key, length in tables['misc'].tolist():
+            store.misc[self.scalar(key)] = [self.scalar(val) for val in misc_items[start:start + length]]
+            start += length
+
+    def scalar(self, data):
+        kind, number, integer = data
+        if kind == KIND_NONE:
+            return None
+        if kind == KIND_BOOL:
+            return bool(integer)
+        if kind == KIND_INT:
+            return integer
+        if kind == KIND_FLOAT:
+            return number
+        if kind == KIND_STR:
+            return self.strings[integer]
+        if kind == KIND_NP_INT:
+            return np.int64(integer)
+        if kind == KIND_NP_FLOAT:
+            return np.float64(number)
+        raise ValueError('unknown scalar kind ' + str(kind))
+
+    # The board stays a view into the mapped cells. Raws that shared a board share its view, so saving them again
+    # stores the board once
+    def raw(self, row):
+        if row < 0:
+            return None
+        start, length, board_row = self.tables['raws'][row].tolist()
+        board = self.boards.get(board_row)
+        if board is None:
+            offset, width, height = self.tables['boards'][board_row].tolist()
+            board = self.tables['cells'][offset:offset + width * height].reshape(width, height)
+            self.boards[board_row] = board
+        vector = [self.scalar(val) for val in self.tables['raw_vectors'][start:start + length].tolist()]
+        return [vector, board]
+
+    # Rows of the counts, conditions or lrules table that belong to rows start to stop of an owner.
+    # The encoder writes the rows of each owner in the order of the owner's rows
+    def owner_rows(self, name, owner, start, stop):
+        index = self.owner_index.get((name, owner))
+        if index is None:
+            table = self.tables[name]
+            if name == 'conditions':
+                mask = np.isin(table['field'], [field for field, (field_owner, _) in enumerate(CONDITION_FIELDS) if field_owner == owner])
+            else:
+                mask = table['owner'] == owner
+            positions = np.flatnonzero(mask)
+            index = positions, table['row'][positions]
+            self.owner_index[(name, owner)] = index
+        positions, rows = index
+        found = positions[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+        return self.tables[name][found].tolist()
+
+    # Fills in the counts, conditions and lrules of records, the records of the owner's rows from start on
+    def attach(self, owner, start, records):
+        stop = start + len(records)
+        for _, row, field, key, hits, total in self.owner_rows('counts', owner, start, stop):
+            getattr(records[row - start], COUNT_FIELDS[owner][field])[self.scalar(key)] = [hits, total]
+        if owner in (OWNER_GROUP, OWNER_EXCEPTION):
+            for field, row, x, y, value, change in self.owner_rows('conditions', owner, start, stop):
+                conditions = getattr(records[row - start], CONDITION_FIELDS[field][1])
+                condition = (self.scalar(x), self.scalar(y), self.scalar(value), self.scalar(change))
+                if isinstance(conditions, set):
+                    conditions.add(condition)
+                else:
+                    conditions.append(condition)
+            for _, row, rule in self.owner_rows('lrules', owner, start, stop):
+                records[row - start].lrules.add(self.scalar(rule))
+
+    # Builds the ValueRules of value row vi, with its condition groups and their exceptions
+    def build_value(self, vi):
+        value = self.values[vi]
+        value_rules = ValueRules(value)
+        start, stop = self.group_starts[vi], self.group_starts[vi + 1]
+        groups = []
+        for _, index, id_row, lstep, combined, cleaned, flags, oraw, lraw in self.tables['groups'][start:stop].tolist():
+            group = ConditionGroup(value, index, self.strings[id_row])
+            group.lstep = self.scalar(lstep)
+            group.combined = combined
+            group.cleaned = cleaned
+            group.oraw = self.raw(oraw)
+            group.lraw = self.raw(lraw)
+            if flags & FLAG_INCLUSIONS:
+                group.inclusions = []
+            if flags & FLAG_INCLUSION_SET:
+                group.inclusion_set = set()
+            if flags & FLAG_REMOVED:
+                group.removed = []
+            if flags & FLAG_LRULES:
+                group.lrules = set()
+            value_rules.rule_ids.append(group.id)
+            value_rules.groups.append(group)
+            groups.append(group)
+
+        exception_start, exception_stop = self.exception_starts[start], self.exception_starts[stop]
+        exceptions = []
+        for group_row, id_row, lstep, flags in self.tables['exceptions'][exception_start:exception_stop].tolist():
+            group = groups[group_row - start]
+            exception = ExceptionGroup(group, self.strings[id_row])
+            exception.lstep = self.scalar(lstep)
+            # Collected as a list below, then frozen
+            exception.rel = []
+            if flags & FLAG_REMOVED:
+                exception.removed = []
+            if flags & FLAG_LRULES:
+                exception.lrules = set()
+            group.exceptions[exception.id] = exception
+            exceptions.append(exception)
+
+        self.attach(OWNER_GROUP, start, groups)
+        self.attach(OWNER_EXCEPTION, exception_start, exceptions)
+        for exception in exceptions:
+            exception.rel = frozenset(exception.rel)
+
+        self.store.values.add(value, value_rules)
+        for group in groups:
+            self.store.rules.add(group.id, group)
+        for exception in exceptions:
+            self.store.exceptions.add(exception.id, exception)
+
+    # Builds the Dimension1D of 1D index row di, with its rules and their exceptions
+    def build_dim(self, di):
+        dim = self.dims[di]
+        dimension = Dimension1D(dim)
+        start, stop = self.rule_1d_starts[di], self.rule_1d_starts[di + 1]
+        rules_1d = []
+        for _, index in self.tables['rules_1d'][start:stop].tolist():
+            rule_1d = Rule1D(dim, index)
+            dimension.groups.append(rule_1d)
+            rules_1d.append(rule_1d)
+        for _, rule_row, rule_1d_row in self.tables['dim_rules'][self.dim_rule_starts[di]:self.dim_rule_starts[di + 1]].tolist():
+            rule_id = self.strings[rule_row]
+            dimension.rule_ids.append(rule_id)
+            dimension.rule_set.add(rule_id)
+            dimension.rule_groups[rule_id] = rules_1d[rule_1d_row - start]
+
+        exception_start, exception_stop = self.exception_1d_starts[start], self.exception_1d_starts[stop]
+        exceptions_1d = []
+        for rule_1d_row, id_row in self.tables['exceptions_1d'][exception_start:exception_stop].tolist():
+            exception_1d = Exception1D(dict(), dict())
+            rules_1d[rule_1d_row - start].exceptions[self.strings[id_row]] = exception_1d
+            exceptions_1d.append(exception_1d)
+
+        self.attach(OWNER_RULE_1D, start, rules_1d)
+        self.attach(OWNER_EXCEPTION_1D, exception_start, exceptions_1d)
+        self.store.dims.add(dim, dimension)
+
+
+def load_columns(path):
+    with open(os.path.join(path, HEADER)) as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT or header.get('version') != VERSION:
+        raise ValueError(path + ' is not a version ' + str(VERSION) + ' knowledge directory')
+
+    tables = dict()
+    for name, table_name in header['tables'].items():
+        tables[name] = np.load(os.path.join(path, table_name), mmap_mode='r', allow_pickle=False)
+    return ColumnReader(header, tables).store
+
+
+# Converts between Knowledge.npy files and knowledge directories, in whichever direction the source is
+def convert(source, target):
+    if is_columns(source):
+        np.save(target, load_columns(source).to_dict())
+    else:
+        save_columns(KnowledgeStore.from_dict(np.load(source, allow_pickle=True).item()), target)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python knowledge_columns.py <source> <target>')
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
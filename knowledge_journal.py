@@ -0,0 +1,142 @@
+from knowledge_store import KnowledgeStore
+from knowledge_columns import ColumnEncoder, is_columns, load_columns, write_columns
+import numpy as np
+import threading
+import shutil
+import pickle
+import io
+import os
+
+
+# Append-only persistence for a KnowledgeStore.
+# Every save appends the flat entries of the records edited since the previous save (KnowledgeStore.journal_entries())
+# to '<fname>.journal' instead of writing the whole knowledge dict again. Every compact_every saves the full dict is
+# written to fname as a snapshot on a background thread, and the journal starts over. Snapshots use the original
+# np.save layout when fname ends in .npy, and the memory-mapped table layout of knowledge_columns.py otherwise.
+# Loading reads the snapshot and replays the journals on top of it.
+# A journal left over from a crash is replayed on the next load, so delete '<fname>.journal*' along with fname to
+# start from scratch, or when replacing fname with another knowledge file
+class KnowledgeJournal(object):
+
+    def __init__(self, fname, compact_every=500):
+        self.fname = fname
+        self.journal_name = fname + '.journal'
+        # Journal of the snapshot that is being written, removed once the snapshot is on disk
+        self.old_journal_name = fname + '.journal.old'
+        self.compact_every = compact_every
+        self.columns = is_columns(fname) or not fname.endswith('.npy')
+        self.saves = 0
+        self.file = None
+        self.thread = None
+
+    # The KnowledgeStore of the snapshot with every journal applied in order, None if there is neither
+    def load(self):
+        store = None
+        flat = None
+        if self.columns:
+            if is_columns(self.fname):
+                store = load_columns(self.fname)
+        else:
+            try:
+                flat = np.load(self.fname, allow_pickle=True).item()
+            except FileNotFoundError:
+                pass
+
+        entries = []
+        for name in (self.old_journal_name, self.journal_name):
+            try:
+                with open(name, 'rb') as f:
+                    while True:
+                        try:
+                            entries.append(pickle.load(f))
+                        except EOFError:
+                            break
+                        except (pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+                            # Torn record at the end of a journal that was being written when the process stopped
+                            break
+            except FileNotFoundError:
+                pass
+
+        if entries:
+            if flat is None:
+                flat = store.to_dict() if store is not None else dict()
+            for entry in entries:
+                flat.update(entry)
+        elif store is not None:
+            return store
+        if flat is None:
+            return None
+        return KnowledgeStore.from_dict(flat)
+
+    def append(self, store):
+        self.write_entries(store.journal_entries())
+
+        self.saves += 1
+        if self.saves >= self.compact_every:
+            self.compact(store)
+
+    # Writes a full snapshot and starts a new journal. The snapshot is serialized here, so the store can keep
+    # changing while the background thread writes it out
+    def compact(self, store, wait=False):
+        self.wait()
+        # Edits not saved yet go to the journal first, the snapshot isn't on disk until the background thread is done
+        if store.dirty or store.dirty_keys:
+            self.write_entries(store.journal_entries())
+        if self.columns:
+            snapshot = ColumnEncoder().encode(store)
+        else:
+            buffer = io.BytesIO()
+            np.save(buffer, store.to_dict())
+            snapshot = buffer.getvalue()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.journal_name):
+            if os.path.exists(self.old_journal_name):
+                # The snapshot the old journal belongs to never made it to disk, so both journals are still needed.
+                # The current one is added after it, the old one is only removed once the new snapshot is written
+                with open(self.journal_name, 'rb') as source, open(self.old_journal_name, 'ab') as target:
+                    shutil.copyfileobj(source, target)
+                    target.flush()
+                    os.fsync(target.fileno())
+                os.remove(self.journal_name)
+            else:
+                os.replace(self.journal_name, self.old_journal_name)
+        self.saves = 0
+
+        self.thread = threading.Thread(target=self.write_snapshot, args=(snapshot,))
+        self.thread.start()
+        if wait:
+            self.wait()
+
+    def write_entries(self, entries):
+        if self.file is None:
+            self.file = open(self.journal_name, 'ab')
+        pickle.dump(entries, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+
+    def write_snapshot(self, snapshot):
+        if self.columns:
+            write_columns(self.fname, snapshot[0], snapshot[1])
+        else:
+            temp_name = self.fname + '.tmp'
+            with open(temp_name, 'wb') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_name, self.fname)
+        try:
+            os.remove(self.old_journal_name)
+        except FileNotFoundError:
+            pass
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.wait()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,646 @@
+# [input_1D, input_2D] recorded with a rule, with the board as nested lists. Rules loaded from a knowledge directory
+# (knowledge_columns.py) keep their boards as views into the mapped file
+def raw_entry(raw):
+    if raw is not None and hasattr(raw[1], 'tolist'):
+        return [raw[0], raw[1].tolist()]
+    return raw
+
+
+# A learned 2D rule: how a cell holding `value` changed after an action, and under which conditions.
+# Mirrors the '2d/<value>/<condition group>/...' keys of the original flat knowledge dict
+class ConditionGroup(object):
+    __slots__ = ('value', 'index', 'id', 'act', 'rel', 'abs', 'apos', 'oraw', 'lraw', 'lstep', 'rstep', 'combined',
+                 'mrules', 'inclusions', 'inclusion_set', 'cleaned', 'removed', 'lrules', 'exceptions', 'exception_index')
+
+    def __init__(self, value, index, rule_id):
+        self.value = value
+        self.index = index
+        self.id = rule_id
+        self.act = dict()
+        self.rel = dict()
+        self.abs = dict()
+        self.apos = dict()
+        self.oraw = None
+        self.lraw = None
+        self.lstep = None
+        self.rstep = dict()
+        self.combined = False
+        self.mrules = dict()
+        # None means the inclusions have not been recorded yet
+        self.inclusions = None
+        self.inclusion_set = None
+        self.cleaned = False
+        self.removed = None
+        self.lrules = None
+        # Exception groups keyed by exception id, in creation order
+        self.exceptions = dict()
+        # Exception ids by action and exception_signature(), built on demand by KnowledgeStore.exception_index
+        self.exception_index = None
+
+
+# An exception to a 2D rule. Mirrors '2d/<value>/<condition group>/exceptions/<exception id>/...'
+class ExceptionGroup(object):
+    __slots__ = ('group', 'id', 'act', 'apos', 'rstep', 'lstep', 'mrules', 'rel', 'removed', 'lrules')
+
+    def __init__(self, group, exception_id):
+        self.group = group
+        self.id = exception_id
+        self.act = dict()
+        self.apos = dict()
+        self.rstep = dict()
+        self.lstep = None
+        self.mrules = dict()
+        # Conditions as (x offset, y offset, value, change) tuples
+        self.rel = frozenset()
+        self.removed = None
+        self.lrules = None
+
+
+# The 1D part of a rule for a single 1D index. Mirrors '1d/<index>/<condition group>/...'
+class Rule1D(object):
+    __slots__ = ('dim', 'index', 'oval', 'rel', 'abs', 'exceptions')
+
+    def __init__(self, dim, index):
+        self.dim = dim
+        self.index = index
+        self.oval = dict()
+        self.rel = dict()
+        self.abs = dict()
+        # Exception1D records keyed by exception id
+        self.exceptions = dict()
+
+
+# The 1D part of an exception group. Mirrors '1d/<index>/<condition group>/exceptions/<exception id>/...'
+class Exception1D(object):
+    __slots__ = ('oval', 'rel')
+
+    def __init__(self, oval, rel):
+        self.oval = oval
+        self.rel = rel
+
+
+# All the rules learned for one 2D value
+class ValueRules(object):
+    __slots__ = ('value', 'rule_ids', 'groups', 'kernel', 'rule_index')
+
+    def __init__(self, value):
+        self.value = value
+        self.rule_ids = []
+        self.groups = []
+        # Compiled rule_kernels.ValueKernel, built on demand by AIRIS.predict
+        self.kernel = None
+        # Group indexes by (action, change) and inclusion signature, built on demand by KnowledgeStore.rule_index
+        self.rule_index = None
+
+
+# The conditions of a group create_rule matches an observation against: (x offset, y offset, value) of each
+# inclusion, without the change it saw. Groups with the same signature match the same observations
+def rule_signature(group):
+    return tuple(sorted((condition[0], condition[1], condition[2]) for condition in group.inclusions or ()))
+
+
+# The conditions of an exception update_rule matches an observation against: the sorted (x offset, y offset, value)
+# of each of them, without the change it saw
+def exception_signature(exception):
+    return tuple(sorted(set((condition[0], condition[1], condition[2]) for condition in exception.rel)))
+
+
+# The offsets of an exception_signature(). An exception's conditions are read off the board at the offsets of its
+# rule's inclusions, so the exceptions of a rule mostly share their offsets
+def signature_offsets(signature):
+    return tuple((condition[0], condition[1]) for condition in signature)
+
+
+# All the rules learned for one 1D index
+class Dimension1D(object):
+    __slots__ = ('dim', 'rule_ids', 'rule_set', 'groups', 'rule_groups')
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.rule_ids = []
+        self.rule_set = set()
+        self.groups = []
+        self.rule_groups = dict()
+
+
+# Nested, typed replacement for the flat string-keyed knowledge dict.
+# Lookups go straight to the records instead of building and hashing keys like '2d/0.0/3/inclusions/rel'.
+# to_dict() / from_dict() convert to and from the original flat layout, which is what is saved to disk
+# so rule_viewer.py and Knowledge_View.py can keep reading Knowledge.npy unchanged
+class KnowledgeStore(object):
+
+    def __init__(self):
+        self.values = dict()
+        self.rules = dict()
+        self.dims = dict()
+        self.rule_dims = dict()
+        self.exceptions = dict()
+        self.action_rules = dict()
+        self.plan_depth = None
+        # Keys of the flat layout that have no typed record
+        self.misc = dict()
+        # Bumped on every edit that can change a prediction, so cached predictions can tell they are stale
+        self.generation = 0
+        # Generation of the last edit to the rules of each value, and of the last edit not made to the rules of one value.
+        # A prediction only reads the rules of the values on the positions it checks, so it stays valid through edits
+        # to the rules of other values (see unchanged_since)
+        self.value_generations = dict()
+        self.base_generation = 0
+        # Records edited since the last journal_entries() call, mapped to whether they were created in that time
+        self.dirty = dict()
+        # Keys of misc edited since the last journal_entries() call
+        self.dirty_keys = set()
+        # (records, misc keys) edited since the last delta() call of each reader other than the journal, see track()
+        self.trackers = []
+
+    def __len__(self):
+        return len(self.rules)
+
+    def value_rules(self, value):
+        return self.values.get(value)
+
+    # Must be called after any edit that can change what predict() returns, with the value whose rules were edited
+    # when there is one
+    def touch(self, value=None):
+        self.generation += 1
+        if value is None:
+            self.base_generation = self.generation
+        else:
+            self.value_generations[value] = self.generation
+
+    # Must be called after the conditions of any rule or exception group of `value` change
+    def changed(self, value):
+        self.touch(value)
+        value_rules = self.values.get(value)
+        if value_rules is not None:
+            value_rules.kernel = None
+
+    # Whether a prediction made at `generation` that read the rules of `values` still holds
+    def unchanged_since(self, generation, values):
+        if self.base_generation > generation:
+            return False
+        for value in values:
+            if self.value_generations.get(value, 0) > generation:
+                return False
+        return True
+
+    # The groups of `value` keyed by (action, change) and then by rule_signature(), for create_rule to find the
+    # groups an observation duplicates without going through every group of the value. Combined groups are left out
+    def rule_index(self, value):
+        value_rules = self.values.get(value)
+        if value_rules is None:
+            return dict()
+        if value_rules.rule_index is None:
+            value_rules.rule_index = dict()
+            for group in value_rules.groups:
+                self.index_rule(group)
+        return value_rules.rule_index
+
+    # Must be called once the action, change and inclusions of a new group are set, and after its inclusions change
+    # (with unindex_rule before the change). Does nothing until rule_index() built the index of the value
+    def index_rule(self, group):
+        index = self.values[group.value].rule_index
+        if index is None or group.combined:
+            return
+        signature = rule_signature(group)
+        for act in group.act:
+            for rel in group.rel:
+                index.setdefault((act, rel), dict()).setdefault(signature, []).append(group.index)
+
+    def unindex_rule(self, group):
+        index = self.values[group.value].rule_index
+        if index is None or group.combined:
+            return
+        signature = rule_signature(group)
+        for act in group.act:
+            for rel in group.rel:
+                signatures = index.get((act, rel), dict())
+                group_indexes = signatures.get(signature, [])
+                if group.index in group_indexes:
+                    group_indexes.remove(group.index)
+                    if not group_indexes:
+                        del signatures[signature]
+
+    # The exception ids of a condition group keyed by action, signature_offsets() and exception_signature(), for
+    # update_rule to find the exception an observation duplicates by reading the board at each set of offsets and
+    # looking up what it finds, instead of going through every exception of the group
+    def exception_index(self, group):
+        if group.exception_index is None:
+            group.exception_index = dict()
+            for exception in group.exceptions.values():
+                self.index_exception(exception)
+        return group.exception_index
+
+    # Must be called once the action and conditions of a new exception are set, and after its conditions change
+    # (with unindex_exception before the change). Does nothing until exception_index() built the index of the group
+    def index_exception(self, exception):
+        index = exception.group.exception_index
+        if index is None:
+            return
+        signature = exception_signature(exception)
+        offsets = signature_offsets(signature)
+        for act in exception.act:
+            index.setdefault(act, dict()).setdefault(offsets, dict()).setdefault(signature, []).append(exception.id)
+
+    def unindex_exception(self, exception):
+        index = exception.group.exception_index
+        if index is None:
+            return
+        signature = exception_signature(exception)
+        offsets = signature_offsets(signature)
+        for act in exception.act:
+            by_offsets = index.get(act, dict())
+            signatures = by_offsets.get(offsets, dict())
+            exception_ids = signatures.get(signature, [])
+            if exception.id in exception_ids:
+                exception_ids.remove(exception.id)
+                if not exception_ids:
+                    del signatures[signature]
+                    if not signatures:
+                        del by_offsets[offsets]
+
+    # Must be called after any edit to a ConditionGroup, ExceptionGroup or Rule1D so the edit reaches the journal and
+    # the trackers
+    def mark(self, record, created=False):
+        self.dirty[record] = created or self.dirty.get(record, False)
+        for records, _ in self.trackers:
+            records[record] = created or records.get(record, False)
+
+    def mark_key(self, key):
+        self.dirty_keys.add(key)
+        for _, keys in self.trackers:
+            keys.add(key)
+
+    # Starts collecting the edits made from now on for a reader other than the journal, which takes them with
+    # delta(tracker)
+    def track(self):
+        tracker = (dict(), set())
+        self.trackers.append(tracker)
+        return tracker
+
+    def untrack(self, tracker):
+        if tracker in self.trackers:
+            self.trackers.remove(tracker)
+
+    def add_rule(self, act, value, rule_id):
+        try:
+            self.action_rules[act].append(rule_id)
+        except KeyError:
+            self.action_rules[act] = [rule_id]
+
+        value_rules = self.values.get(value)
+        if value_rules is None:
+            value_rules = ValueRules(value)
+            self.values[value] = value_rules
+
+        group = ConditionGroup(value, len(value_rules.groups), rule_id)
+        value_rules.rule_ids.append(rule_id)
+        value_rules.groups.append(group)
+        self.rules[rule_id] = group
+        self.changed(value)
+        self.mark(group, True)
+        return group
+
+    def add_rule_1d(self, dim, rule_id):
+        dimension = self.dims.get(dim)
+        if dimension is None:
+            dimension = Dimension1D(dim)
+            self.dims[dim] = dimension
+
+        if rule_id not in dimension.rule_set:
+            dimension.rule_ids.append(rule_id)
+        dimension.rule_set.add(rule_id)
+
+        rule_1d = Rule1D(dim, len(dimension.rule_ids) - 1)
+        dimension.groups.append(rule_1d)
+        dimension.rule_groups[rule_id] = rule_1d
+
+        try:
+            self.rule_dims[rule_id].add(dim)
+        except KeyError:
+            self.rule_dims[rule_id] = {dim}
+        self.mark(rule_1d, True)
+        return rule_1d
+
+    def rule_1d(self, dim, rule_id):
+        return self.dims[dim].rule_groups[rule_id]
+
+    def add_exception(self, group, exception_id):
+        exception = ExceptionGroup(group, exception_id)
+        group.exceptions[exception_id] = exception
+        self.exceptions[exception_id] = exception
+        self.changed(group.value)
+        self.mark(group)
+        self.mark(exception, True)
+        return exception
+
+    # Flat entries of one condition group, without its exceptions
+    def group_entries(self, group, flat):
+        value_key = '2d/' + str(group.value)
+        flat['2d/' + group.id] = group.value
+        flat[value_key + '/' + group.id] = group.index
+        prefix = value_key + '/' + str(group.index)
+        flat[prefix + '/act'] = group.act
+        flat[prefix + '/rel'] = group.rel
+        flat[prefix + '/abs'] = group.abs
+        flat[prefix + '/apos'] = group.apos
+        flat[prefix + '/oraw'] = raw_entry(group.oraw)
+        flat[prefix + '/lraw'] = raw_entry(group.lraw)
+        flat[prefix + '/id'] = group.id
+        flat[prefix + '/lstep'] = group.lstep
+        flat[prefix + '/rstep'] = group.rstep
+        flat[prefix + '/combined'] = group.combined
+        flat[prefix + '/mrules'] = group.mrules
+        if group.inclusions is not None:
+            flat[prefix + '/inclusions/rel'] = group.inclusions
+        if group.inclusion_set is not None:
+            flat[prefix + '/inclusions/rel_set'] = group.inclusion_set
+        if group.cleaned:
+            flat[prefix + '/inclusions/rel/cleaned'] = True
+        if group.removed is not None:
+            flat[prefix + '/inclusions/rel/removed'] = group.removed
+        if group.lrules is not None:
+            flat[prefix + '/lrules'] = group.lrules
+        if group.exceptions:
+            flat[prefix + '/exceptions'] = list(group.exceptions.keys())
+
+    def exception_entries(self, exception, flat):
+        group = exception.group
+        exception_key = '2d/' + str(group.value) + '/' + str(group.index) + '/exceptions/' + exception.id
+        flat[exception_key + '/act'] = exception.act
+        flat[exception_key + '/apos'] = exception.apos
+        flat[exception_key + '/rstep'] = exception.rstep
+        flat[exception_key + '/lstep'] = exception.lstep
+        flat[exception_key + '/mrules'] = exception.mrules
+        flat[exception_key + '/rel'] = list(exception.rel)
+        if exception.removed is not None:
+            flat[exception_key + '/rel/removed'] = exception.removed
+        if exception.lrules is not None:
+            flat[exception_key + '/lrules'] = exception.lrules
+        flat['2d/exceptions/' + exception.id] = group.value
+        flat['2d/exceptions/' + exception.id + '/cond_group'] = group.index
+
+    def rule_1d_entries(self, rule_1d, flat):
+        prefix = '1d/' + str(rule_1d.dim) + '/' + str(rule_1d.index)
+        flat[prefix + '/oval'] = rule_1d.oval
+        flat[prefix + '/rel'] = rule_1d.rel
+        flat[prefix + '/abs'] = rule_1d.abs
+        for exception_id, exception_1d in rule_1d.exceptions.items():
+            flat[prefix + '/exceptions/' + exception_id + '/oval'] = exception_1d.oval
+            flat[prefix + '/exceptions/' + exception_id + '/rel'] = exception_1d.rel
+
+    # Flat entries of every record edited since the last call, plus the index keys of the ones that were created.
+    # Applied over the flat dict of an earlier snapshot, in order, they give the same dict as to_dict()
+    def journal_entries(self):
+        flat = dict()
+        if self.plan_depth is not None:
+            flat['plan_depth'] = self.plan_depth
+
+        for record, created in self.dirty.items():
+            if isinstance(record, ConditionGroup):
+                if created:
+                    flat['2d'] = list(self.values.keys())
+                    flat['2d{'] = set(self.values.keys())
+                    flat['2d/' + str(record.value)] = self.values[record.value].rule_ids
+                    for act in record.act.keys():
+                        if act in self.action_rules:
+                            flat[act] = self.action_rules[act]
+                self.group_entries(record, flat)
+            elif isinstance(record, ExceptionGroup):
+                self.exception_entries(record, flat)
+            else:
+                if created:
+                    dimension = self.dims[record.dim]
+                    dim_key = '1d/' + str(record.dim)
+                    flat[dim_key] = dimension.rule_ids
+                    flat['1d{' + str(record.dim)] = dimension.rule_set
+                    for rule_id, rule_1d in dimension.rule_groups.items():
+                        if rule_1d is record:
+                            flat[dim_key + '/' + rule_id] = str(rule_1d.index)
+                            flat['1d/' + rule_id] = self.rule_dims[rule_id]
+                self.rule_1d_entries(record, flat)
+
+        for key in self.dirty_keys:
+            flat[key] = self.misc[key]
+
+        self.dirty = dict()
+        self.dirty_keys = set()
+        return flat
+
+    # The records edited since the last call for tracker, for apply_delta() to bring a copy of the store taken before
+    # those edits up to date: the edited condition groups (with all their exceptions), the edited 1D rules with the
+    # rule ids they are stored under and whether they are new, the action_rules lists new groups were added to and
+    # the edited misc keys, and plan_depth. It is meant to be pickled, which copies the records
+    def delta(self, tracker):
+        records, keys = tracker
+        groups = dict()
+        rules_1d = []
+        action_rules = dict()
+        rule_ids_1d = dict()
+        for record, created in records.items():
+            if isinstance(record, ConditionGroup):
+                groups[record.id] = record
+                if created:
+                    for act in record.act.keys():
+                        if act in self.action_rules:
+                            action_rules[act] = self.action_rules[act]
+            elif isinstance(record, ExceptionGroup):
+                groups[record.group.id] = record.group
+            else:
+                if record.dim not in rule_ids_1d:
+                    rule_ids_1d[record.dim] = dict()
+                    for rule_id, rule_1d in self.dims[record.dim].rule_groups.items():
+                        rule_ids_1d[record.dim].setdefault(id(rule_1d), []).append(rule_id)
+                rule_ids = rule_ids_1d[record.dim].get(id(record), [])
+                rules_1d.append((record, created, [(rule_id, self.rule_dims[rule_id]) for rule_id in rule_ids]))
+        misc = dict((key, self.misc[key]) for key in keys)
+        records.clear()
+        keys.clear()
+        # New groups of a value have to be added in index order
+        return sorted(groups.values(), key=lambda group: group.index), rules_1d, action_rules, misc, self.plan_depth
+
+    def apply_delta(self, delta):
+        groups, rules_1d, action_rules, misc, self.plan_depth = delta
+        for group in groups:
+            value_rules = self.values.get(group.value)
+            if value_rules is None:
+                value_rules = ValueRules(group.value)
+                self.values[group.value] = value_rules
+            if group.index < len(value_rules.groups):
+                value_rules.groups[group.index] = group
+            else:
+                value_rules.rule_ids.append(group.id)
+                value_rules.groups.append(group)
+            group.exception_index = None
+            value_rules.rule_index = None
+            self.rules[group.id] = group
+            for exception in group.exceptions.values():
+                self.exceptions[exception.id] = exception
+            self.changed(group.value)
+
+        for rule_1d, created, rule_ids in rules_1d:
+            dimension = self.dims.get(rule_1d.dim)
+            if dimension is None:
+                dimension = Dimension1D(rule_1d.dim)
+                self.dims[rule_1d.dim] = dimension
+            old = dimension.rule_groups.get(rule_ids[0][0]) if rule_ids and not created else None
+            if old is None:
+                dimension.groups.append(rule_1d)
+            else:
+                dimension.groups[next(i for i, group in enumerate(dimension.groups) if group is old)] = rule_1d
+            for rule_id, dims in rule_ids:
+                if rule_id not in dimension.rule_set:
+                    dimension.rule_ids.append(rule_id)
+                dimension.rule_set.add(rule_id)
+                dimension.rule_groups[rule_id] = rule_1d
+                self.rule_dims[rule_id] = dims
+
+        self.action_rules.update(action_rules)
+        self.misc.update(misc)
+        # The 1D rules and misc keys say nothing about the values whose predictions they change
+        if rules_1d or misc:
+            self.touch()
+
+    def to_dict(self):
+        flat = dict()
+        if self.plan_depth is not None:
+            flat['plan_depth'] = self.plan_depth
+
+        for act, rule_ids in self.action_rules.items():
+            flat[act] = rule_ids
+
+        if self.values:
+            flat['2d'] = list(self.values.keys())
+            flat['2d{'] = set(self.values.keys())
+
+        for value, value_rules in self.values.items():
+            value_key = '2d/' + str(value)
+            flat[value_key] = value_rules.rule_ids
+            for group in value_rules.groups:
+                self.group_entries(group, flat)
+                for exception in group.exceptions.values():
+                    self.exception_entries(exception, flat)
+
+        for dim, dimension in self.dims.items():
+            dim_key = '1d/' + str(dim)
+            flat[dim_key] = dimension.rule_ids
+            flat['1d{' + str(dim)] = dimension.rule_set
+            for rule_id, rule_1d in dimension.rule_groups.items():
+                flat[dim_key + '/' + rule_id] = str(rule_1d.index)
+            for rule_1d in dimension.groups:
+                self.rule_1d_entries(rule_1d, flat)
+
+        for rule_id, dims in self.rule_dims.items():
+            flat['1d/' + rule_id] = dims
+
+        flat.update(self.misc)
+        return flat
+
+    @classmethod
+    def from_dict(cls, flat):
+        store = cls()
+        used = set()
+
+        def take(key, default=None):
+            if key in flat:
+                used.add(key)
+                return flat[key]
+            return default
+
+        store.plan_depth = take('plan_depth')
+        take('2d{')
+        for value in take('2d', []):
+            value_key = '2d/' + str(value)
+            value_rules = ValueRules(value)
+            store.values[value] = value_rules
+            for rule_id in take(value_key, []):
+                index = take(value_key + '/' + rule_id)
+                take('2d/' + rule_id)
+                prefix = value_key + '/' + str(index)
+                group = ConditionGroup(value, index, rule_id)
+                group.act = take(prefix + '/act', dict())
+                group.rel = take(prefix + '/rel', dict())
+                group.abs = take(prefix + '/abs', dict())
+                group.apos = take(prefix + '/apos', dict())
+                group.oraw = take(prefix + '/oraw')
+                group.lraw = take(prefix + '/lraw')
+                take(prefix + '/id')
+                group.lstep = take(prefix + '/lstep')
+                group.rstep = take(prefix + '/rstep', dict())
+                group.combined = take(prefix + '/combined', False)
+                group.mrules = take(prefix + '/mrules', dict())
+                group.inclusions = take(prefix + '/inclusions/rel')
+                group.inclusion_set = take(prefix + '/inclusions/rel_set')
+                group.cleaned = take(prefix + '/inclusions/rel/cleaned', False)
+                group.removed = take(prefix + '/inclusions/rel/removed')
+                group.lrules = take(prefix + '/lrules')
+                for exception_id in take(prefix + '/exceptions', []):
+                    exception_key = prefix + '/exceptions/' + exception_id
+                    exception = ExceptionGroup(group, exception_id)
+                    exception.act = take(exception_key + '/act', dict())
+                    exception.apos = take(exception_key + '/apos', dict())
+                    exception.rstep = take(exception_key + '/rstep', dict())
+                    exception.lstep = take(exception_key + '/lstep')
+                    exception.mrules = take(exception_key + '/mrules', dict())
+                    exception.rel = frozenset(take(exception_key + '/rel', ()))
+                    exception.removed = take(exception_key + '/rel/removed')
+                    exception.lrules = take(exception_key + '/lrules')
+                    take('2d/exceptions/' + exception_id)
+                    take('2d/exceptions/' + exception_id + '/cond_group')
+                    group.exceptions[exception_id] = exception
+                    store.exceptions[exception_id] = exception
+                value_rules.rule_ids.append(rule_id)
+                value_rules.groups.append(group)
+                store.rules[rule_id] = group
+
+        dims = []
+        for key in flat.keys():
+            if isinstance(key, str) and key.startswith('1d{'):
+                dims.append(int(key[3:]))
+        for dim in sorted(dims):
+            dim_key = '1d/' + str(dim)
+            dimension = Dimension1D(dim)
+            store.dims[dim] = dimension
+            dimension.rule_ids = take(dim_key, [])
+            dimension.rule_set = take('1d{' + str(dim), set())
+            groups = dict()
+            for rule_id in dimension.rule_ids:
+                index = int(take(dim_key + '/' + rule_id))
+                rule_1d = groups.get(index)
+                if rule_1d is None:
+                    rule_1d = Rule1D(dim, index)
+                    prefix = dim_key + '/' + str(index)
+                    rule_1d.oval = take(prefix + '/oval', dict())
+                    rule_1d.rel = take(prefix + '/rel', dict())
+                    rule_1d.abs = take(prefix + '/abs', dict())
+                    groups[index] = rule_1d
+                dimension.rule_groups[rule_id] = rule_1d
+            dimension.groups = [groups[index] for index in sorted(groups.keys())]
+
+        for rule_id in store.rules.keys():
+            rule_dims = take('1d/' + rule_id)
+            if rule_dims is not None:
+                store.rule_dims[rule_id] = rule_dims
+
+        for key in list(flat.keys()):
+            if not isinstance(key, str) or not key.startswith('1d/') or not key.endswith('/oval'):
+                continue
+            parts = key.split('/')
+            if len(parts) != 6 or parts[3] != 'exceptions':
+                continue
+            dimension = store.dims.get(int(parts[1]))
+            if dimension is None:
+                continue
+            rule_1d = dimension.groups[int(parts[2])]
+            prefix = '/'.join(parts[:5])
+            rule_1d.exceptions[parts[4]] = Exception1D(take(prefix + '/oval'), take(prefix + '/rel', dict()))
+
+        for key, value in flat.items():
+            if key in used:
+                continue
+            if isinstance(key, str) and '/' not in key and '{' not in key and isinstance(value, list):
+                store.action_rules[key] = value
+            else:
+                store.misc[key] = value
+
+        return store
@@ -6,6 +6,82 @@ import copy
 from other_useful_functions import *
 
 
+# Min-heap of (count, value) pairs, one per value, that keeps the heap index of every value in self.index so a count
+# can change with one sift, O(log n), instead of a scan of the heap and a heapify. It is a valid heapq heap at all
+# times, so it is read, copied with list() and popped from like the plain list it replaced
+class CountHeap(list):
+
+    def __init__(self, entries=(), index=None):
+        list.__init__(self, entries)
+        if index is None:
+            heapq.heapify(self)
+            index = {val: i for i, (count, val) in enumerate(self)}
+        self.index = index
+
+    def copy(self):
+        return CountHeap(self, dict(self.index))
+
+    # adds delta to the count of val, pushing val with a count of delta if it isn't in the heap yet.
+    # val is removed when its count drops to 0
+    def change(self, val, delta):
+        i = self.index.get(val)
+        if i is None:
+            self.index[val] = len(self)
+            self.append((delta, val))
+            self.sift_up(len(self) - 1)
+            return
+        count = self[i][0] + delta
+        if count:
+            entry = self[i] = (count, val)
+            # only sift when the entry is out of place
+            if delta < 0:
+                if i and self[(i - 1) >> 1] > entry:
+                    self.sift_up(i)
+            elif 2 * i + 1 < len(self):
+                self.sift_down(i)
+            return
+        del self.index[val]
+        last = self.pop()
+        if i < len(self):
+            self[i] = last
+            self.index[last[1]] = i
+            self.sift_up(i)
+            self.sift_down(self.index[last[1]])
+
+    def sift_up(self, i):
+        entry = self[i]
+        while i:
+            parent = (i - 1) >> 1
+            if self[parent] <= entry:
+                break
+            self[i] = self[parent]
+            self.index[self[i][1]] = i
+            i = parent
+        self[i] = entry
+        self.index[entry[1]] = i
+
+    def sift_down(self, i):
+        entry = self[i]
+        end = len(self)
+        child = 2 * i + 1
+        while child < end:
+            if child + 1 < end and self[child + 1] < self[child]:
+                child += 1
+            if entry <= self[child]:
+                break
+            self[i] = self[child]
+            self.index[self[i][1]] = i
+            i = child
+            child = 2 * i + 1
+        self[i] = entry
+        self.index[entry[1]] = i
+
+
+# A model of the environment, the observed one or one predicted from another model.
+# A model made from another one (prev_model) shares its vis_env, aux_env and vis_count tallies with it instead of
+# copying them. Whichever of the two changes a value first copies what it changes: update_vis_value copies vis_env and
+# the tallies, and the position list of each value it moves, update_aux_value copies aux_env. The own_* flags say what
+# a model has copied already
 class Model(object):
 
     def __init__(self, vis_env=None, aux_env=None,
@@ -45,41 +121,38 @@ class Model(object):
 
     def initialize_from_env(self, vis_env, aux_env):
 
-        # visual and non-visual inputs of this model
-        self.vis_env = copy.deepcopy(vis_env)
-        self.aux_env = copy.deepcopy(aux_env)
+        # visual and non-visual inputs of this model, still the caller's until a value is updated
+        self.vis_env = vis_env
+        self.aux_env = aux_env
+        self.own_vis_env = False
+        self.own_aux_env = False
 
         # tally of how many of a particular visual subsymbolic input value
         # is in this model. (used to determine focus value)
         # In the puzzle game it counts how many walls, empty spaces, characters, etc.
         self.vis_count = {}
 
-        # list of different inputs its ever seen since birth
-        self.vis_count_list = []
-
         # dictionary of different subsymbolic visual input values
         # key: subsymoblic input value
-        # value: list of position tuples of locations of said subsymbolic input key
+        # value: positions of said subsymbolic input key, a dict used as an ordered set of (x, y) tuples
+        # (first_position() is the earliest one still there)
         self.vis_count_pos = {}
 
         # fill self.vis_count with the frequency of input values in this vis_env
-        # and append any never seen before values
-        # fill and self.vis_count_list with the values never seen before
         for pos, val in np.ndenumerate(self.vis_env):
             try:
                 self.vis_count[val] += 1
-                self.vis_count_pos[val].append(pos)
+                self.vis_count_pos[val][pos] = None
             except KeyError:
                 self.vis_count[val] = 1
-                self.vis_count_pos[val] = [pos]
-                if val not in self.vis_count_list:
-                    self.vis_count_list.append(val)
+                self.vis_count_pos[val] = {pos: None}
 
         # heap (specifically a min-heap) of different sub-symbolic input values
         # key: count,  value: subsymbolic input value
-        self.vis_count_heap = list(map(lambda x: (x[1], x[0]),
-                                       list(self.vis_count.items())))
-        heapq.heapify(self.vis_count_heap)
+        self.vis_count_heap = CountHeap((count, val) for val, count in self.vis_count.items())
+        self.own_counts = True
+        # values whose vis_count_pos positions this model has copied
+        self.own_positions = set(self.vis_count_pos.keys())
 
         # distance of the goal value in
         # this model's vis_env to the airis's goal source value
@@ -87,67 +160,99 @@ class Model(object):
 
     def initialize_from_model(self, model):
 
-        # visual and non-visual inputs of this model
-        self.vis_env = copy.deepcopy(model.vis_env)
-        self.aux_env = copy.deepcopy(model.aux_env)
+        # visual and non-visual inputs of this model, shared with the source model
+        self.vis_env = model.vis_env
+        self.aux_env = model.aux_env
 
         # copy the focus_value position from the source models
-        self.focus_pos = copy.deepcopy(model.focus_pos)
-        self.focus_value = copy.deepcopy(model.focus_value)
-        self.focus_value_is_aux = copy.deepcopy(model.focus_value_is_aux)
-        self.focus_index = copy.deepcopy(model.focus_index)
+        self.focus_pos = model.focus_pos
+        self.focus_value = model.focus_value
+        self.focus_value_is_aux = model.focus_value_is_aux
+        self.focus_index = model.focus_index
 
         # tally of how many of a particular visual subsymbolic input value
         # is in this model. (used to determine focus value)
         # In the puzzle game it counts how many walls, empty spaces, characters, etc.
-        self.vis_count = copy.deepcopy(model.vis_count)
-
-        # list of different inputs its ever seen since birth
-        self.vis_count_list = copy.deepcopy(model.vis_count_list)
+        self.vis_count = model.vis_count
 
         # dictionary of different subsymbolic visual input values
         # key: subsymoblic input value
-        # value: list of position tuples of locations of said subsymbolic input key
-        self.vis_count_pos = copy.deepcopy(model.vis_count_pos)
+        # value: positions of said subsymbolic input key, a dict used as an ordered set of (x, y) tuples
+        self.vis_count_pos = model.vis_count_pos
 
         # heap (specifically a min-heap) of different sub-symbolic input values
         # key: count,  value: subsymbolic input value
-        self.vis_count_heap = copy.deepcopy(model.vis_count_heap)
+        self.vis_count_heap = model.vis_count_heap
+
+        # neither model may change what they share now without copying it first
+        self.own_vis_env = model.own_vis_env = False
+        self.own_aux_env = model.own_aux_env = False
+        self.own_counts = model.own_counts = False
+        self.own_positions = set()
+        model.own_positions = set()
 
         # distance of the goal value in
         # this model's vis_env to the airis's goal source value
-        self.compare = copy.deepcopy(model.compare)
+        self.compare = model.compare
+
+    # copies vis_env and the tallies if they are still shared
+    def own_vis(self):
+        if not self.own_vis_env:
+            self.vis_env = copy.deepcopy(self.vis_env)
+            self.own_vis_env = True
+        if not self.own_counts:
+            self.vis_count = dict(self.vis_count)
+            self.vis_count_heap = self.vis_count_heap.copy()
+            self.vis_count_pos = dict(self.vis_count_pos)
+            self.own_counts = True
+
+    # the positions of val, copied first if they are still shared
+    def positions_for_update(self, val):
+        if val not in self.own_positions:
+            self.vis_count_pos[val] = dict(self.vis_count_pos[val])
+            self.own_positions.add(val)
+        return self.vis_count_pos[val]
+
+    # the earliest position of val still in vis_env, KeyError if val isn't in it
+    def first_position(self, val):
+        return next(iter(self.vis_count_pos[val]))
+
+    # Manhattan distance from (x, y) to the closest position of val in vis_env other than (x, y) itself,
+    # None if there is none
+    def nearest_distance(self, val, x, y):
+        distances = [abs(px - x) + abs(py - y) for px, py in self.vis_count_pos.get(val, ())]
+        distances = [d for d in distances if d]
+        return min(distances) if distances else None
+
+    # the different values in vis_env
+    @property
+    def vis_count_list(self):
+        return list(self.vis_count)
 
     def update_vis_value(self, posterior_val, value_pos, focus_value=None):
 
         # things to modify:
         # vis_env
         # vis_count
-        # vis_count_list
         # vis_count_heap
         # vis_count_pos
 
         # get the actual prior for the focus index
         x, y = value_pos
         prior_val = self.vis_env[x][y]
+        self.own_vis()
 
         # decrement the prior's count
         self.vis_count[prior_val] -= 1
         if self.vis_count[prior_val] == 0:
             del self.vis_count[prior_val]
-            self.vis_count_list.remove(prior_val)
-            self.vis_count_heap.remove((1, prior_val))
-        else:
-            for i, (count, val) in enumerate(self.vis_count_heap):
-                if val == prior_val:
-                    self.vis_count_heap[i] = (count - 1, val)
-                    break
-        heapq.heapify(self.vis_count_heap)
+        self.vis_count_heap.change(prior_val, -1)
 
         # remove this pos from vis_count_pos
-        self.vis_count_pos[prior_val].remove((x, y))
-        if self.vis_count_pos[prior_val] == []:
+        del self.positions_for_update(prior_val)[(x, y)]
+        if not self.vis_count_pos[prior_val]:
             del self.vis_count_pos[prior_val]
+            self.own_positions.discard(prior_val)
 
         # set the value to the posterior
         self.vis_env[x][y] = posterior_val
@@ -157,21 +262,14 @@ class Model(object):
             self.vis_count[posterior_val] += 1
         except KeyError:
             self.vis_count[posterior_val] = 1
-            self.vis_count_list.append(posterior_val)
-            self.vis_count_heap.append((0, posterior_val))
-
-        # increment the posterior's count in the heap
-        for i, (count, val) in enumerate(self.vis_count_heap):
-            if val == posterior_val:
-                self.vis_count_heap[i] = (count + 1, val)
-                break
-        heapq.heapify(self.vis_count_heap)
+        self.vis_count_heap.change(posterior_val, 1)
 
         # add the posterior value to the model's vis_count_pos
         try:
-            self.vis_count_pos[posterior_val].append((x, y))
+            self.positions_for_update(posterior_val)[(x, y)] = None
         except KeyError:
-            self.vis_count_pos[posterior_val] = [(x, y)]
+            self.vis_count_pos[posterior_val] = {(x, y): None}
+            self.own_positions.add(posterior_val)
 
         #if the posterior value is the focus_value, return the new position of the focus_value
         if posterior_val == focus_value:
@@ -187,6 +285,9 @@ class Model(object):
 
         # get the actual prior and predicted posterior for the focus index
         prior_val = self.aux_env[focus_index]
+        if not self.own_aux_env:
+            self.aux_env = copy.deepcopy(self.aux_env)
+            self.own_aux_env = True
 
         # set the value to the posterior
         self.aux_env[focus_index] = posterior_val
@@ -207,14 +308,17 @@ class Model(object):
                     new_line_end=False,
                     draw_line=DEFAULT_DRAW_LINE):
 
+        if not debugging():
+            return
+
         if title:
             pprint(title, indent=indent, num_indents=num_indents,
                 new_line_start=new_line_start, draw_line=draw_line)
-        pprint('size: %s' % sys.getsizeof(self),
+        pprint('size: %s', sys.getsizeof(self),
             indent=indent, num_indents=num_indents + 1)
 
 
-        pprint('id: %s' % self.id,
+        pprint('id: %s', self.id,
             indent=indent, num_indents=num_indents + 1)
 
         if vis_env:
@@ -228,11 +332,11 @@ class Model(object):
         if vis_count_heap:
             pprint('vis count heap:', indent=indent, num_indents=num_indents + 1)
             for count, value in self.vis_count_heap:
-                pprint('  %d  \tinstances of\t%s' % (count, int(value)),
+                pprint('  %d  \tinstances of\t%s', count, int(value),
                     indent=indent, num_indents=num_indents + 1)
 
         if compare:
-            pprint('compare (distance between goal values):\t%s' % self.compare,
+            pprint('compare (distance between goal values):\t%s', self.compare,
                 indent=indent, num_indents=num_indents + 1)
 
         if focus:
@@ -242,28 +346,28 @@ class Model(object):
                 indent=indent, num_indents=num_indents + 2)
             pprint('     from the prior to posterior environment)',
                 indent=indent, num_indents=num_indents + 2)
-            pprint('value:      %s' % self.focus_value,
+            pprint('value:      %s', self.focus_value,
                 indent=indent, num_indents=num_indents + 2)
-            pprint('pos:        %s' % self.focus_pos,
+            pprint('pos:        %s', self.focus_pos,
                 indent=indent, num_indents=num_indents + 2)
-            pprint('index:      %s' % self.focus_index,
+            pprint('index:      %s', self.focus_index,
                 indent=indent, num_indents=num_indents + 2)
-            pprint('is_aux:     %s' % self.focus_value_is_aux,
+            pprint('is_aux:     %s', self.focus_value_is_aux,
                 indent=indent, num_indents=num_indents + 2)
 
         if pred_vis_chng:
-            pprint('Predicted Visual Changes:\t%s' % self.predicted_vis_change,
+            pprint('Predicted Visual Changes:\t%s', self.predicted_vis_change,
                 indent=indent, num_indents=num_indents + 1)
 
         if pred_aux_chng:
-            pprint('Predicted Auxiliary Changes:\t%s' % self.predicted_vis_change,
+            pprint('Predicted Auxiliary Changes:\t%s', self.predicted_vis_change,
                 indent=indent, num_indents=num_indents + 1)
 
         if best_condition:
             pprint('Best Condition:', indent=indent, num_indents=num_indents + 1)
-            pprint('dif:            %s' % self.best_condition_dif, indent=indent, num_indents=num_indents + 2)
-            pprint('id:             %s' % self.best_condition_id, indent=indent, num_indents=num_indents + 2)
-            pprint('focus value:    %s' % self.focus_value, indent=indent, num_indents=num_indents + 2,
+            pprint('dif:            %s', self.best_condition_dif, indent=indent, num_indents=num_indents + 2)
+            pprint('id:             %s', self.best_condition_id, indent=indent, num_indents=num_indents + 2)
+            pprint('focus value:    %s', self.focus_value, indent=indent, num_indents=num_indents + 2,
                 new_line_end=new_line_end, draw_line=draw_line)
             # also print out which part of the knowledge airis is
             # using to make a prediction and plans (uses predictions to make plans)
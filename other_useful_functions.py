@@ -1,13 +1,44 @@
 import numpy as np
 import heapq
 import re
+import atexit
 from numba import vectorize
 from constants import *
 
+# whether pprint writes anywhere, the console or the debug log file.
+# Call sites that build something only to print it check this first
+def debugging():
+    return DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE
+
+
+debug_log = None
+
+
+# the debug log file, opened on first use and kept open (buffered) until the program exits
+def debug_log_file():
+    global debug_log
+    if debug_log is None:
+        debug_log = open(DEBUG_LOGFILE_PATH, 'a')
+        atexit.register(debug_log.close)
+    return debug_log
+
+
+# empties the debug log file
+def clear_debug_log():
+    debug_log_file().truncate(0)
+
+
 # cleaner way to print things
-def pprint(string='', indent=DEFAULT_INDENT, num_indents=0,
+# string is only formatted when debugging is on: pprint('x = %s', x) formats string % args,
+# and anything that isn't a str (a list, an array) is turned into one with str()
+def pprint(string='', *args, indent=DEFAULT_INDENT, num_indents=0,
            new_line_start=False, new_line_end=False, draw_line=DEFAULT_DRAW_LINE):
 
+    if not (DEBUG_WITH_CONSOLE or DEBUG_WITH_LOGFILE):
+        return
+
+    string = str(string) % args if args else str(string)
+
     if DEBUG_WITH_CONSOLE:
 
         total_indent0 = ''.join([indent] * num_indents)
@@ -23,7 +54,7 @@ def pprint(string='', indent=DEFAULT_INDENT, num_indents=0,
 
     if DEBUG_WITH_LOGFILE:
 
-        f = open(DEBUG_LOGFILE_PATH, 'a')
+        f = debug_log_file()
 
         new_indent = '\t'
 
@@ -43,13 +74,14 @@ def pprint(string='', indent=DEFAULT_INDENT, num_indents=0,
         if new_line_end:
             f.write((total_indent1 if draw_line else total_indent0) + '\n')
 
-        f.close()
-
 # pretty prints the 2d numpy array env
 def print_vis_env(env, title=None, indent=DEFAULT_INDENT, num_indents=0,
                   new_line_start=False, new_line_end=False,
                   draw_line=DEFAULT_DRAW_LINE):
 
+    if not debugging():
+        return
+
     if title:
         pprint(title, indent=indent, num_indents=num_indents,
             new_line_start=new_line_start, draw_line=draw_line)
@@ -75,6 +107,9 @@ def print_aux_env(env, title=None, indent=DEFAULT_INDENT, num_indents=0,
                   new_line_start=False, new_line_end=False,
                   draw_line=DEFAULT_DRAW_LINE):
 
+    if not debugging():
+        return
+
     if title:
         pprint(title, indent=indent, num_indents=num_indents,
             new_line_start=new_line_start, draw_line=draw_line)
@@ -0,0 +1,107 @@
+import heapq
+import sys
+
+# Memory budget of one make_plan search.
+# make_plan keeps every state it predicts in AIRIS.states and refers to them by index from its heaps and from each
+# state's prev_state. When the states held pass max_states (or roughly max_mb megabytes) trim() drops states the
+# search can no longer end a plan on, down to 90% of the budget so it doesn't run again for every new state.
+# Only leaves are dropped, states no kept state was predicted from, so every state a plan can still end on keeps its
+# whole chain of predecessors. A dropped state is set to None in AIRIS.states and its heap entries are removed, which
+# keeps the indexes of the other states valid. The order states are dropped in:
+#   1. states in neither heap, e.g. expanded states whose successors were all dropped already
+#   2. duplicates of a state predicted earlier in the search
+#   3. the rest of confidence_heap, worst first
+#   4. the far end of state_heap, which makes the search incomplete, so it only happens when 1 to 3 were not enough
+# A limit of 0 turns it off
+
+
+# Rough size in bytes of what a state holds on its own, not counting what it shares with the states it branched from
+def state_bytes(state):
+    size = sys.getsizeof(state) + sys.getsizeof(state.input_1D) + sys.getsizeof(state.applied_rules) + sys.getsizeof(state.applied_exceptions)
+    for entry in state.applied_rules.values():
+        size += sys.getsizeof(entry)
+    # the cells it changed, and the layer it got when its chain of BoardLayers was merged
+    size += sys.getsizeof(state.diff) + 64 * (len(state.diff) + state.flat_cells)
+    return size
+
+
+class PlanBudget(object):
+
+    def __init__(self, max_states, max_mb):
+        self.max_states = max_states
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.live = 0
+        self.bytes = 0
+        # Size of each live state, only measured when there is a byte limit
+        self.sizes = dict()
+        self.dupes = set()
+        self.peak = 0
+        self.dropped = 0
+
+    def add(self, index, state, dupe=False):
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        if dupe:
+            self.dupes.add(index)
+        if self.max_bytes:
+            size = state_bytes(state)
+            self.sizes[index] = size
+            self.bytes += size
+
+    def over(self):
+        return (self.max_states and self.live > self.max_states) or (self.max_bytes and self.bytes > self.max_bytes)
+
+    def drop(self, states, index):
+        states[index] = None
+        self.live -= 1
+        self.bytes -= self.sizes.pop(index, 0)
+        self.dupes.discard(index)
+        self.dropped += 1
+
+    # protected holds the states that must stay whatever happens, e.g. the base state and the state being expanded
+    def trim(self, states, state_heap, confidence_heap, protected):
+        target_states = self.max_states * 0.9
+        target_bytes = self.max_bytes * 0.9
+
+        def done():
+            return (not self.max_states or self.live <= target_states) and (not self.max_bytes or self.bytes <= target_bytes)
+
+        children = dict()
+        for state in states:
+            if state is not None and state.prev_state is not None:
+                children[state.prev_state] = children.get(state.prev_state, 0) + 1
+        frontier = dict()
+        for entry in state_heap:
+            frontier[entry[1]] = max(frontier.get(entry[1], entry[0]), entry[0])
+        confidence = dict()
+        for entry in confidence_heap:
+            confidence[entry[1]] = max(confidence.get(entry[1], entry[0]), entry[0])
+
+        def rank(index):
+            if index in frontier:
+                return 3, -frontier[index], -index
+            if index in confidence:
+                if index in self.dupes:
+                    return 1, -confidence[index], -index
+                return 2, -confidence[index], -index
+            return 0, 0, -index
+
+        candidates = []
+        for index, state in enumerate(states):
+            if state is not None and index not in protected and not children.get(index):
+                candidates.append((rank(index), index))
+        heapq.heapify(candidates)
+
+        while candidates and not done():
+            _, index = heapq.heappop(candidates)
+            parent = states[index].prev_state
+            self.drop(states, index)
+            if parent is not None:
+                children[parent] -= 1
+                if not children[parent] and parent not in protected and states[parent] is not None:
+                    heapq.heappush(candidates, (rank(parent), parent))
+
+        state_heap[:] = [entry for entry in state_heap if states[entry[1]] is not None]
+        heapq.heapify(state_heap)
+        confidence_heap[:] = [entry for entry in confidence_heap if states[entry[1]] is not None]
+        heapq.heapify(confidence_heap)
@@ -0,0 +1,64 @@
+import heapq
+
+# The frontier of a make_plan search that ran out of time (AIRIS.plan_deadline_ms), kept so the next call carries on
+# with it instead of starting over. make_plan hands out a partial plan when time runs out. After the AI takes a step
+# of it, rebase() makes the state it reached the new base state. The states predicted from that state are renumbered
+# under it and their steps shifted, so they look as if a fresh search had predicted them. Everything else is dropped,
+# since the AI can't get back to it
+class PlanSearch(object):
+
+    def __init__(self, goal, state_heap, confidence_heap, depth):
+        self.goal = goal
+        self.state_heap = state_heap
+        self.confidence_heap = confidence_heap
+        self.depth = depth
+        # Index of the state the AI is in, the base state until it takes a step of the partial plan
+        self.node = 0
+
+    # The states list of the search with base_state, the state just observed, in place of self.node.
+    # None if the search can't carry on from it, e.g. because the observation is not the predicted state
+    def rebase(self, states, base_state):
+        node = self.node
+        if node is None or node >= len(states) or states[node] is None or states[node].hash() != base_state.hash():
+            return None
+
+        offset = states[node].step
+        index = {node: 0}
+        rebased = [base_state]
+        for i in range(node + 1, len(states)):
+            state = states[i]
+            if state is not None and state.prev_state in index:
+                index[i] = len(rebased)
+                state.prev_state = index[state.prev_state]
+                state.step -= offset
+                rebased.append(state)
+
+        # Nothing left to expand under node, a new search does better
+        if not any(entry[1] in index for entry in self.state_heap) and len(rebased) > 1:
+            return None
+
+        self.state_heap = [(entry[0] - offset, index[entry[1]], entry[2] - offset) for entry in self.state_heap if entry[1] in index]
+
+        # A duplicate is never expanded, the state it duplicates is. When that state was dropped, the duplicate goes
+        # on the frontier the way the first state with its board would have
+        expanded = set(state.prev_state for state in rebased[1:])
+        seen = set(rebased[i].hash() for i in expanded)
+        seen.update(rebased[entry[1]].hash() for entry in self.state_heap)
+        for i in range(1, len(rebased)):
+            state = rebased[i]
+            if i in expanded or state.anti_goal or state.confidence != 1:
+                continue
+            key = state.hash()
+            if key not in seen:
+                seen.add(key)
+                if state.compare is not None:
+                    self.state_heap.append((state.compare + state.step, i, state.step))
+                else:
+                    self.state_heap.append((state.step, i, state.step))
+        self.confidence_heap = [(entry[0], index[entry[1]]) for entry in self.confidence_heap if entry[1] in index and entry[1] != node]
+        if len(rebased) == 1:
+            self.state_heap = [(0, 0, 0)]
+        heapq.heapify(self.state_heap)
+        heapq.heapify(self.confidence_heap)
+        self.node = 0
+        return rebased
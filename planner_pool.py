@@ -0,0 +1,106 @@
+from knowledge_columns import save_columns, load_columns
+import multiprocessing
+import tempfile
+import shutil
+import pickle
+import atexit
+import os
+
+# Worker processes that run AIRIS.predict for make_plan.
+# The parent writes a snapshot of its knowledge to a knowledge directory (knowledge_columns.py), in shared memory where
+# the system has it. Workers map that directory read-only, so they share one copy of it, and only build the rules they
+# read from it. After that the parent only writes the records edited since the last batch (KnowledgeStore.delta()) to
+# a delta file next to the snapshot, and each batch carries the number of delta files, so every worker applies the ones
+# it hasn't applied yet. Once the deltas add up to more than max_delta_bytes the parent writes a new snapshot instead.
+# Results are stored in the parent's prediction cache, which is what makes them visible to make_plan
+
+# Knowledge directory, snapshot version, AIRIS instance and deltas applied of this worker process
+worker = None
+
+
+def delta_name(path, version, delta):
+    return os.path.join(path, 'delta.' + str(version) + '.' + str(delta) + '.pickle')
+
+
+# The result of AIRIS.predict, followed by the values whose rules it read (see AIRIS.valid_prediction)
+def predict_task(task):
+    global worker
+    path, version, deltas, action_space, base_index, base_state, act = task
+    if worker is None or worker[0] != path or worker[1] != version:
+        from airis_stable import AIRIS
+        airis = AIRIS([], [], action_space)
+        airis.knowledge = load_columns(path)
+        airis.log_predictions = False
+        worker = [path, version, airis, 0]
+    airis = worker[2]
+    for delta in range(worker[3], deltas):
+        with open(delta_name(path, version, delta), 'rb') as f:
+            airis.knowledge.apply_delta(pickle.load(f))
+    worker[3] = deltas
+    airis.states = {base_index: base_state}
+    return airis.predict(act, base_index, base_state.step + 1) + (airis.prediction_values,)
+
+
+class PlannerPool(object):
+
+    max_delta_bytes = 1 << 20
+
+    def __init__(self, processes):
+        self.processes = processes
+        shared_memory = '/dev/shm'
+        self.path = tempfile.mkdtemp(prefix='airis_knowledge_', dir=shared_memory if os.path.isdir(shared_memory) else None)
+        # The store the snapshot was written from, its edits since (KnowledgeStore.track()), the generation the last
+        # delta was taken at and a count of the snapshots
+        self.knowledge = None
+        self.tracker = None
+        self.generation = None
+        self.version = 0
+        # Delta files written since the snapshot, and their size
+        self.deltas = 0
+        self.delta_bytes = 0
+        self.pool = multiprocessing.Pool(processes)
+        atexit.register(self.close)
+
+    def snapshot(self, knowledge):
+        if self.knowledge is not knowledge:
+            if self.knowledge is not None:
+                self.knowledge.untrack(self.tracker)
+            self.knowledge = knowledge
+            self.tracker = knowledge.track()
+        else:
+            knowledge.delta(self.tracker)
+        for delta in range(self.deltas):
+            os.remove(delta_name(self.path, self.version, delta))
+        # Nothing reads the snapshot after a crash, so it isn't synced to disk
+        save_columns(knowledge, self.path, sync=False)
+        self.version += 1
+        self.deltas = 0
+        self.delta_bytes = 0
+
+    # Predicts every (base index, base state, action) task on the workers, returning the results in task order
+    def predict(self, knowledge, action_space, tasks):
+        if self.knowledge is not knowledge:
+            self.snapshot(knowledge)
+        elif self.generation != knowledge.generation:
+            delta = pickle.dumps(knowledge.delta(self.tracker), protocol=pickle.HIGHEST_PROTOCOL)
+            if self.delta_bytes + len(delta) > self.max_delta_bytes:
+                self.snapshot(knowledge)
+            else:
+                with open(delta_name(self.path, self.version, self.deltas), 'wb') as f:
+                    f.write(delta)
+                self.deltas += 1
+                self.delta_bytes += len(delta)
+        self.generation = knowledge.generation
+
+        tasks = [(self.path, self.version, self.deltas, action_space, base_index, base_state, act) for base_index, base_state, act in tasks]
+        return self.pool.map(predict_task, tasks, chunksize=max(1, -(-len(tasks) // self.processes)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.knowledge is not None:
+            self.knowledge.untrack(self.tracker)
+            self.knowledge = None
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,4 +1,6 @@
 import time, sys, os
+import argparse
+import numpy as np
 from pygame.locals import QUIT, KEYDOWN
 from game_objects import *
 from constants import *
@@ -81,7 +83,7 @@ class Model(object):
     '''
 
     # this function initializes the model
-    def __init__(self, controller, ai_controlled):
+    def __init__(self, controller, ai_controlled, knowledge_file='Knowledge.npy'):
         '''
             initialize model, environment, and default keyboard controller states
         Args:
@@ -92,6 +94,9 @@ class Model(object):
         # game setup parameters
         self.show = True # show current model
         self.controller = controller
+        self.knowledge_file = knowledge_file
+        self.levels_solved = 0
+        self.deaths = 0
 
         # maze game setup
         self.mover_list = []
@@ -105,18 +110,14 @@ class Model(object):
         self.state = None
         self.final_action_step = False
 
-        # AGI setup
-        self.screen_input = []
-        for x in range(GAME_MAP_GRID[0]):
-            self.screen_input.append([])
-            for y in range(GAME_MAP_GRID[1]):
-                self.screen_input[x].append(0.0)
+        # AGI setup. The board is handed to AIRIS as a NumPy array, which it diffs without converting
+        self.screen_input = np.zeros((GAME_MAP_GRID[0], GAME_MAP_GRID[1]))
         self.aux_input = [self.keys_collected, self.extinguishers_collected, 0]
         self.action_space = ['up', 'down', 'left', 'right']
         self.ai_controlled = ai_controlled
         self.time_counter = 0
         self.airis = AIRIS(self.aux_input, self.screen_input, self.action_space)
-        self.airis.load_knowledge('Knowledge.npy')
+        self.airis.load_knowledge(self.knowledge_file)
         if not ai_controlled:
             self.airis.observe_mode = True
         self.airis.given_goal_state = [[[2, '+']], []]
@@ -171,12 +172,14 @@ class Model(object):
             # go to next level if player beats the current level
             if self.batteries_collected == self.num_batteries:
                 level_change = True
+                self.levels_solved += 1
                 self.airis.capture_input(self.aux_input, self.screen_input, player_action, state, False)
                 self.get_next_maze()
 
             # reset the maze if the character dies
             if self.maze_reset:
                 player_death = True
+                self.deaths += 1
                 self.aux_input[2] -= 1
                 self.airis.capture_input(self.aux_input, self.screen_input, player_action, state, False)
                 self.get_next_maze()
@@ -187,14 +190,14 @@ class Model(object):
                 self.airis.action_plan = []
                 self.airis.pos_change_2D = []
 
-            self.airis.save_knowledge('Knowledge.npy')
+            self.airis.save_knowledge(self.knowledge_file)
 
             if self.airis.action_plan:
                 self.plan_made = True
             else:
                 self.plan_made = False
 
-            if not controller.approval_mode:
+            if not self.controller.approval_mode:
                 self.plan_made = True
 
     def get_action(self):
@@ -204,7 +207,7 @@ class Model(object):
 
         for x in range(GAME_MAP_GRID[0]):
             for y in range(GAME_MAP_GRID[1]):
-                self.screen_input[x][y] = self.game_map[x][y].id
+                self.screen_input[x, y] = self.game_map[x][y].id
 
         self.aux_input[0] = self.keys_collected
         self.aux_input[1] = self.extinguishers_collected
@@ -1237,8 +1240,83 @@ class PyGameKeyboardController(object):
         return True, is_there_input
 
 
+class HeadlessController(object):
+    '''
+        Controller for headless runs, the AI plays without a keyboard or window
+    '''
+
+    def __init__(self):
+
+        self.paused = False
+        self.player_input = 'nothing'
+        self.time_slow = False
+        self.exit = False
+        self.approval_mode = False
+
+
+def print_report(model, steps, start_time):
+    elapsed = time.time() - start_time
+    print('steps:', steps, 'steps/sec:', round(steps / max(elapsed, 1e-9), 2), 'levels solved:', model.levels_solved,
+          'deaths:', model.deaths, 'maze:', model.current_maze, 'rules:', len(model.airis.knowledge), 'time:', round(elapsed, 2))
+    sys.stdout.flush()
+
+
+# Runs the AI on the puzzle game without pygame's display: no window, no images and no screenshots.
+# steps = 0 runs until interrupted with Ctrl+C
+def run_headless(steps, report_every, knowledge_file, planner_processes=0, plan_max_states=None, plan_max_mb=None, plan_deadline_ms=0, logs=False):
+    if logs:
+        for log_dir in ('./predict_log', './plan_log'):
+            os.makedirs(log_dir, exist_ok=True)
+
+    model = Model(HeadlessController(), True, knowledge_file)
+    # ./predict_log and ./plan_log are only written with --logs, a throughput run doesn't wait on them
+    model.airis.log_predictions = logs
+    model.airis.log_plans = logs
+    model.airis.planner_processes = planner_processes
+    if plan_max_states is not None:
+        model.airis.plan_max_states = plan_max_states
+    if plan_max_mb is not None:
+        model.airis.plan_max_mb = plan_max_mb
+    model.airis.plan_deadline_ms = plan_deadline_ms
+    start_time = time.time()
+    step = 0
+    try:
+        while not steps or step < steps:
+            model.update()
+            step += 1
+
+            # update again if player won or died, the same as the windowed loop
+            if model.batteries_collected == model.num_batteries or model.maze_reset:
+                model.update()
+
+            if report_every and step % report_every == 0:
+                print_report(model, step, start_time)
+    except KeyboardInterrupt:
+        pass
+
+    model.airis.compact_knowledge(knowledge_file)
+    model.airis.close_planner_pool()
+    print_report(model, step, start_time)
+
+
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description=None)
+    parser.add_argument('--headless', action='store_true', help='Run without a window, images or screenshots and report steps/sec and levels solved')
+    parser.add_argument('--steps', type=int, default=0, help='Number of steps of a headless run, 0 runs until interrupted')
+    parser.add_argument('--report', type=int, default=100, help='Steps between headless progress reports, 0 only reports at the end')
+    parser.add_argument('--knowledge', default='Knowledge.npy', help='Knowledge file, or knowledge directory (see knowledge_columns.py)')
+    parser.add_argument('--planner-processes', type=int, default=0, help='Worker processes for planning predictions, 0 plans in this process')
+    parser.add_argument('--plan-max-states', type=int, default=None, help='Most states a plan search holds (see plan_budget.py), 0 for no limit')
+    parser.add_argument('--plan-max-mb', type=float, default=None, help='Rough memory limit of a plan search in megabytes, 0 for no limit')
+    parser.add_argument('--plan-deadline-ms', type=float, default=0, help='Milliseconds a plan search may take before the AI acts on a partial plan, 0 for no limit')
+    parser.add_argument('--logs', action='store_true', help='Write ./predict_log and ./plan_log during a headless run')
+    args = parser.parse_args()
+
+    if args.headless:
+        run_headless(args.steps, args.report, args.knowledge, args.planner_processes, args.plan_max_states, args.plan_max_mb, args.plan_deadline_ms, args.logs)
+        sys.exit()
+
     # pygame setup
     ai_controlled = True
     approval_mode = False
@@ -1248,7 +1326,13 @@ if __name__ == '__main__':
     controller.approval_mode = approval_mode
     if ai_controlled:
         controller.time_slow = False
-    model = Model(controller, ai_controlled)
+    model = Model(controller, ai_controlled, args.knowledge)
+    model.airis.planner_processes = args.planner_processes
+    if args.plan_max_states is not None:
+        model.airis.plan_max_states = args.plan_max_states
+    if args.plan_max_mb is not None:
+        model.airis.plan_max_mb = args.plan_max_mb
+    model.airis.plan_deadline_ms = args.plan_deadline_ms
     if GAME_SHOW_SCREEN:
         view = PyGameView(model)
 
@@ -1334,5 +1418,6 @@ if __name__ == '__main__':
         else:
             pygame.display.set_caption('Ai ' + str(id(pygame)))
 
+    model.airis.compact_knowledge(args.knowledge)
     pygame.quit()
     sys.exit()
\ No newline at end of file
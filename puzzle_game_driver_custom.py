@@ -662,5 +662,6 @@ if __name__ == '__main__':
         else:
             pygame.display.set_caption('Ai ' + str(id(pygame)))
 
+    model.airis.compact_knowledge('Knowledge.npy')
     pygame.quit()
     sys.exit()
\ No newline at end of file
@@ -0,0 +1,228 @@
+from functools import lru_cache
+import numpy as np
+
+# What a PaddedBoard reads past any edge of the board. NaN equals nothing, so a condition off the board never holds
+OFF_BOARD = np.nan
+
+
+# Offsets of a list of conditions from the position they are checked at
+class Stencil(object):
+
+    def __init__(self, dx, dy):
+        self.dx = np.asarray(dx, dtype=np.int64)
+        self.dy = np.asarray(dy, dtype=np.int64)
+        if len(self.dx):
+            self.reach = int(max(np.abs(self.dx).max(), np.abs(self.dy).max()))
+        else:
+            self.reach = 0
+        self.flat = dict()
+
+    # The offsets as indexes into a flattened board with rows of `stride` cells
+    def flat_offsets(self, stride):
+        try:
+            return self.flat[stride]
+        except KeyError:
+            offsets = self.dx * stride + self.dy
+            self.flat[stride] = offsets
+            return offsets
+
+
+# The Stencil of a tuple of (x, y) offsets, built once per tuple
+@lru_cache(maxsize=4096)
+def stencil(offsets):
+    return Stencil([offset[0] for offset in offsets], [offset[1] for offset in offsets])
+
+
+# A board with a border of OFF_BOARD cells around it, as wide as the furthest offset read from it so far, so the cells
+# under a stencil are read with one indexed read whatever the position. Cells past an edge read as OFF_BOARD, the
+# ones before the first row or column included, where indexing the nested lists used to wrap around to the far side.
+# The padded board is kept flattened, a stencil then only takes an add to find its cells
+class PaddedBoard(object):
+
+    def __init__(self, grid):
+        self.grid = np.asarray(grid, dtype=float)
+        self.pad(0)
+
+    def pad(self, margin):
+        self.margin = margin
+        if self.grid.ndim == 2:
+            width, height = self.grid.shape
+            padded = np.full((width + 2 * margin, height + 2 * margin), OFF_BOARD)
+            padded[margin:margin + width, margin:margin + height] = self.grid
+            self.stride = height + 2 * margin
+            self.cells = padded.ravel()
+        else:
+            self.stride = 0
+            self.cells = self.grid
+
+    # Whether (x, y) lies on the board
+    def inside(self, x, y):
+        return 0 <= x < self.grid.shape[0] and 0 <= y < self.grid.shape[1]
+
+    # The values under each offset of a stencil from (x, y), which must lie on the board. x and y can be arrays of
+    # positions too, the values of each position are one row then
+    def gather(self, stencil, x, y):
+        if stencil.reach > self.margin:
+            self.pad(stencil.reach)
+        start = (x + self.margin) * self.stride + y + self.margin
+        if isinstance(start, np.ndarray):
+            start = start[:, None]
+        return self.cells[start + stencil.flat_offsets(self.stride)]
+
+
+# Relative conditions of a list of rules (or exception groups) compiled into flat arrays, so they can be
+# matched against many board positions in one vectorized pass instead of one condition at a time.
+# Conditions that point at the same cell form a slot and a slot scores its best condition, the same as the
+# hold_rel heaps in AIRIS.predict used to
+class ConditionKernel(object):
+
+    def __init__(self, condition_lists):
+        self.size = len(condition_lists)
+        self.slot_counts = np.zeros(self.size, dtype=np.int64)
+        dx = []
+        dy = []
+        expected = []
+        slot_starts = []
+        slot_owners = []
+        slot_columns = []
+        owner_starts = []
+        owners = []
+        for li, conditions in enumerate(condition_lists):
+            slots = dict()
+            for condition in conditions or ():
+                try:
+                    slots[(condition[0], condition[1])].append(condition[2])
+                except KeyError:
+                    slots[(condition[0], condition[1])] = [condition[2]]
+
+            if slots:
+                owner_starts.append(len(dx))
+                owners.append(li)
+            # Column 0 of the score terms holds the base score, slots follow in order of first appearance
+            for column, (offset, values) in enumerate(slots.items()):
+                slot_starts.append(len(dx))
+                slot_owners.append(li)
+                slot_columns.append(column + 1)
+                for cod in values:
+                    dx.append(offset[0])
+                    dy.append(offset[1])
+                    expected.append(cod)
+            self.slot_counts[li] = len(slots)
+
+        if self.size:
+            self.width = int(self.slot_counts.max())
+        else:
+            self.width = 0
+        self.dx = np.array(dx, dtype=np.int64)
+        self.dy = np.array(dy, dtype=np.int64)
+        self.expected = np.array(expected, dtype=float)
+        self.slot_starts = np.array(slot_starts, dtype=np.int64)
+        self.slot_owners = np.array(slot_owners, dtype=np.int64)
+        self.slot_columns = np.array(slot_columns, dtype=np.int64)
+        self.owner_starts = np.array(owner_starts, dtype=np.int64)
+        self.owners = np.array(owners, dtype=np.int64)
+        self.stencil = Stencil(self.dx, self.dy)
+
+    # Match and uncertainty per (position, list), plus whether every condition of the list fell on the board.
+    # base_match is added first and extra_match / extra_uncertainty (one row of terms per list) last.
+    # Terms are summed left to right with cumsum, zero padded, so the totals are bit for bit the ones the
+    # scalar loop produced and ties between rules break the same way
+    def score(self, board, xs, ys, base_match, extra_match, extra_uncertainty):
+        count = len(xs)
+        columns = 1 + self.width + max(extra_match.shape[1], extra_uncertainty.shape[1])
+        match_terms = np.zeros((count, self.size, columns))
+        uncertainty_terms = np.zeros((count, self.size, columns))
+        inside_all = np.ones((count, self.size), dtype=bool)
+        match_terms[:, :, 0] = base_match
+
+        if len(self.dx):
+            actual = board.gather(self.stencil, xs, ys)
+            inside = ~np.isnan(actual)
+            expected = self.expected
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(expected < actual, expected / actual, actual / expected)
+            similarity = np.where(actual == expected, 1.0, np.where((expected != 0) & (actual != 0), ratio, 0.0))
+            similarity[~inside] = 0.0
+
+            best = np.maximum.reduceat(similarity, self.slot_starts, axis=1)
+            exact = best == 1
+            match_terms[:, self.slot_owners, self.slot_columns] = np.where(exact, 1.0, best)
+            uncertainty_terms[:, self.slot_owners, self.slot_columns] = np.where(exact, 0.0, np.where(best != 0, best, 1.0))
+            inside_all[:, self.owners] = np.logical_and.reduceat(inside, self.owner_starts, axis=1)
+
+        match_terms[:, :, 1 + self.width:1 + self.width + extra_match.shape[1]] = extra_match
+        uncertainty_terms[:, :, 1 + self.width:1 + self.width + extra_uncertainty.shape[1]] = extra_uncertainty
+        match = np.cumsum(match_terms, axis=2)[:, :, -1]
+        uncertainty = np.cumsum(uncertainty_terms, axis=2)[:, :, -1]
+        return match, uncertainty, inside_all
+
+
+# Terms of varying length as one zero padded 2D array
+def pad_terms(terms):
+    width = max([len(t) for t in terms] + [0])
+    padded = np.zeros((len(terms), width))
+    for i, t in enumerate(terms):
+        padded[i, :len(t)] = t
+    return padded
+
+
+# Compiled conditions of every rule and exception group learned for one 2D value.
+# Cached on ValueRules.kernel and dropped by KnowledgeStore.changed() whenever those conditions change
+class ValueKernel(object):
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        self.rules = ConditionKernel([group.inclusions for group in self.groups])
+        exception_lists = []
+        self.exceptions = []
+        self.exception_ranges = []
+        for group in self.groups:
+            start = len(exception_lists)
+            for exception in group.exceptions.values():
+                exception_lists.append(exception.rel)
+                self.exceptions.append(exception)
+            self.exception_ranges.append((start, len(exception_lists)))
+        self.exception_rules = ConditionKernel(exception_lists)
+
+    # Everything that depends on the action and the 1D input but not on the board position.
+    # rule_terms / exception_terms are (match terms, uncertainty terms, match count) per group / exception
+    def prepare(self, act, rule_terms, exception_terms):
+        base = np.zeros(len(self.groups))
+        rule_count = []
+        for gi, group in enumerate(self.groups):
+            base_count = 0
+            if act in group.act:
+                act_data = group.act[act]
+                if act_data[0] / act_data[1] == 1:
+                    base_count = 1
+            base[gi] = base_count
+            rule_count.append(base_count + int(self.rules.slot_counts[gi]) + rule_terms[gi][2])
+
+        exception_base = np.zeros(len(self.exceptions))
+        exception_count = []
+        for ei, exception in enumerate(self.exceptions):
+            if act in exception.act:
+                if exception.act[act][0] / exception.act[act][1] == 1:
+                    exception_base[ei] = 1
+                    base_count = 1
+                else:
+                    base_count = 0
+            else:
+                if len(exception.act) == 0:
+                    exception_base[ei] = 1
+                base_count = 1
+            exception_count.append(base_count + int(self.exception_rules.slot_counts[ei]) + exception_terms[ei][2])
+
+        return (base, np.array(rule_count, dtype=float), pad_terms([t[0] for t in rule_terms]), pad_terms([t[1] for t in rule_terms]),
+                exception_base, np.array(exception_count, dtype=float), pad_terms([t[0] for t in exception_terms]), pad_terms([t[1] for t in exception_terms]))
+
+    # Negated match ratios, uncertainties and board checks of every rule and exception group at each
+    # position, as nested lists indexed [position][group] / [position][exception]
+    def score(self, board, xs, ys, prepared):
+        base, rule_count, match_terms, uncertainty_terms, exception_base, exception_count, exception_match_terms, exception_uncertainty_terms = prepared
+        match, uncertainty, inside = self.rules.score(board, xs, ys, base, match_terms, uncertainty_terms)
+        exception_score, exception_uncertainty, _ = self.exception_rules.score(board, xs, ys, exception_base, exception_match_terms, exception_uncertainty_terms)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = -(match / rule_count)
+            exception_ratio = -(exception_score / exception_count)
+        return ratio.tolist(), uncertainty.tolist(), inside.tolist(), exception_ratio.tolist(), exception_uncertainty.tolist()
@@ -1,13 +1,136 @@
-from collections import Counter, defaultdict
-from copy import deepcopy
+from collections import defaultdict
 import numpy as np
-import heapq
+import struct
 
+# Zobrist-style fingerprints. Every (position, value) pair of the board and every (index, value) pair of the 1D input
+# is mixed into a 64 bit word and the words are XORed together, so changing one cell only takes the old and the new
+# word of that cell. Values are mixed by their float64 bits
+FINGERPRINT_SEED = 0x9E3779B97F4A7C15
+FINGERPRINT_MASK = (1 << 64) - 1
+FINGERPRINT_1D = 1 << 63
+
+
+# splitmix64 finalizer
+def mix(x):
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & FINGERPRINT_MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & FINGERPRINT_MASK
+    return x ^ (x >> 31)
+
+
+def mix_array(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def cell_word(x, y, val):
+    return mix(struct.unpack('<Q', struct.pack('<d', val))[0] ^ mix(((x << 32) | y) ^ FINGERPRINT_SEED))
+
+
+def board_fingerprint(grid):
+    grid = np.asarray(grid, dtype=np.float64)
+    if grid.ndim != 2 or not grid.size:
+        return 0
+    xs, ys = np.indices(grid.shape, dtype=np.uint64)
+    keys = mix_array(((xs << np.uint64(32)) | ys) ^ np.uint64(FINGERPRINT_SEED))
+    return int(np.bitwise_xor.reduce(mix_array(grid.view(np.uint64) ^ keys), axis=None))
+
+
+def vector_fingerprint(input_1D):
+    fingerprint = 0
+    for i, val in enumerate(input_1D):
+        fingerprint ^= mix(struct.unpack('<Q', struct.pack('<d', val))[0] ^ mix((FINGERPRINT_1D | i) ^ FINGERPRINT_SEED))
+    return fingerprint
+
+
+# Fingerprint of a raw observation, equal to State.hash() of a state holding the same board and 1D input
+def fingerprint(input_1D, input_2D):
+    return board_fingerprint(input_2D) ^ vector_fingerprint(input_1D)
+
+
+# Rows of board_changes(): position, value before, rounded change and value after
+CHANGE_2D = np.dtype([('x', np.int64), ('y', np.int64), ('old', np.float64), ('delta', np.float64), ('new', np.float64)])
+
+
+# The cells that differ between two boards of the same shape as a CHANGE_2D array, in row-major order.
+# Boards without two dimensions have no cells
+def board_changes(before, after, round_to):
+    if before.ndim != 2 or after.ndim != 2:
+        return np.empty(0, dtype=CHANGE_2D)
+    xs, ys = np.nonzero(before != after)
+    changes = np.empty(len(xs), dtype=CHANGE_2D)
+    changes['x'] = xs
+    changes['y'] = ys
+    changes['old'] = before[xs, ys]
+    changes['new'] = after[xs, ys]
+    changes['delta'] = np.round(changes['new'] - changes['old'], round_to)
+    return changes
+
+
+# Manhattan distance from every cell of a width x height board to the nearest of `positions`, as nested lists.
+# Two passes of 1D distance transforms, one along each axis, each a forward and a backward running minimum
+def distance_field(positions, width, height):
+    field = np.full((width, height), width + height, dtype=np.int64)
+    xs, ys = zip(*positions)
+    field[list(xs), list(ys)] = 0
+    for axis, size in ((1, height), (0, width)):
+        shape = [1, 1]
+        shape[axis] = size
+        idx = np.arange(size).reshape(shape)
+        forward = np.minimum.accumulate(field - idx, axis=axis) + idx
+        backward = np.flip(np.minimum.accumulate(np.flip(field + idx, axis=axis), axis=axis), axis=axis) - idx
+        field = np.minimum(forward, backward)
+    return field.tolist()
+
+
+# Cells a state changed, frozen when a state is branched from it, on top of the layers below it. depth counts the
+# layers down to the board
+class BoardLayer(object):
+    __slots__ = ('cells', 'below', 'depth')
+
+    def __init__(self, cells, below):
+        self.cells = cells
+        self.below = below
+        self.depth = 1 if below is None else below.depth + 1
+
+
+# A node of the planning graph. The 2D board is stored copy-on-write: every state descended from the same observed
+# board shares its NumPy grid. A state keeps the cells it changed itself in self.diff and reads the cells its
+# predecessors changed through a chain of BoardLayers, so a predicted state costs memory and time for the cells it
+# changed rather than for the board or the changes accumulated along its plan. branch() freezes the cells the state
+# changed so far into a layer both states read. Reading a cell walks the chain, so a chain deeper than MAX_LAYERS is
+# merged into a single layer when a state is branched from it. That copies the changes accumulated along the plan once
+# every MAX_LAYERS steps, which flat_cells counts for the plan budget.
+# board_idx maps each value to the sorted positions holding it on the grid, positions() applies the changes to it.
+# distance_fields holds the distance_field() of values compare asked for. States that branched from each other share
+# it until one of them changes a cell, which drops the fields of the old and the new value from its own copy
 class State(object):
+    __slots__ = ('input_1D', 'grid', 'diff', 'layer', 'flat_cells', 'board_idx', 'distance_fields', 'own_fields', 'board_fingerprint', 'action', 'prev_state',
+                 'prev_action', 'change_1D', 'change_2D', 'uncertainty', 'step', 'applied_rules', 'applied_exceptions',
+                 'applied_exception_ids', 'applied_rule_ids', 'anti_goal', 'last_1D', 'last_2D', 'compare', 'confidence',
+                 'last_pos_change_2d', 'no_change', 'bad_rules', 'check_set')
+
+    MAX_LAYERS = 8
 
     def __init__(self, env1, env2, env2indexes, act, prev, step, last_pos_change_2d, prev_action):
+        self.grid = np.array(env2)
+        self.diff = dict()
+        self.layer = None
+        self.flat_cells = 0
+        self.distance_fields = dict()
+        self.own_fields = True
+        self.board_fingerprint = board_fingerprint(self.grid)
+        if env2indexes is None:
+            self.heap()
+        else:
+            self.board_idx = dict()
+            for key in env2indexes.keys():
+                self.board_idx[key] = sorted(env2indexes[key])
+        self.reset(env1, act, prev, step, last_pos_change_2d, prev_action)
+
+    # Fields that belong to this node only
+    def reset(self, env1, act, prev, step, last_pos_change_2d, prev_action):
         self.input_1D = env1.copy()
-        self.input_2D = deepcopy(env2)
         self.action = act
         self.prev_state = prev
         self.prev_action = prev_action
@@ -15,10 +138,6 @@ class State(object):
         self.change_2D = []
         self.uncertainty = 0
         self.step = step
-        self.input_2D_idx = deepcopy(env2indexes)
-        self.input_2D_heap = []
-        for key in self.input_2D_idx.keys():
-            heapq.heappush(self.input_2D_heap, (len(self.input_2D_idx[key]), key))
         self.applied_rules = dict()
         self.applied_exceptions = dict()
         self.applied_exception_ids = set()
@@ -33,14 +152,134 @@ class State(object):
         self.bad_rules = []
         self.check_set = set()
 
+    # A successor state with the same board. Neither state copies the board, see BoardLayer
+    def branch(self, act, prev, step, last_pos_change_2d, prev_action):
+        if self.diff:
+            self.layer = BoardLayer(self.diff, self.layer)
+            self.diff = dict()
+        flat_cells = 0
+        if self.layer is not None and self.layer.depth > State.MAX_LAYERS:
+            self.layer = BoardLayer(self.changes(), None)
+            flat_cells = len(self.layer.cells)
+        state = State.__new__(State)
+        state.grid = self.grid
+        state.diff = dict()
+        state.layer = self.layer
+        state.flat_cells = flat_cells
+        state.board_idx = self.board_idx
+        state.distance_fields = self.distance_fields
+        state.own_fields = False
+        state.board_fingerprint = self.board_fingerprint
+        self.own_fields = False
+        state.reset(self.input_1D, act, prev, step, last_pos_change_2d, prev_action)
+        return state
+
+    # Every cell that differs from the grid, with its value on this state's board
+    def changes(self):
+        layers = []
+        layer = self.layer
+        while layer is not None:
+            layers.append(layer.cells)
+            layer = layer.below
+        cells = dict()
+        for layer_cells in reversed(layers):
+            cells.update(layer_cells)
+        cells.update(self.diff)
+        return cells
+
+    # The board as a list of lists, built fresh on every access. Edits to it don't reach the state, use set() instead
+    @property
+    def input_2D(self):
+        rows = self.grid.tolist()
+        for pos, val in self.changes().items():
+            rows[pos[0]][pos[1]] = val
+        return rows
+
+    @property
+    def shape(self):
+        return self.grid.shape
+
+    # The board as a float NumPy array
+    def array(self):
+        grid = self.grid.astype(float)
+        for pos, val in self.changes().items():
+            grid[pos] = val
+        return grid
+
+    # Turns an index into a board position the same way indexing the nested lists did: negative indexes count from
+    # the end and anything else out of range raises IndexError
+    def position(self, x, y):
+        width, height = self.grid.shape[:2]
+        if x < 0:
+            x += width
+        if y < 0:
+            y += height
+        if x < 0 or x >= width or y < 0 or y >= height:
+            raise IndexError('position out of range')
+        return x, y
+
+    def get(self, x, y):
+        pos = self.position(x, y)
+        val = self.diff.get(pos)
+        if val is not None:
+            return val
+        layer = self.layer
+        while layer is not None:
+            val = layer.cells.get(pos)
+            if val is not None:
+                return val
+            layer = layer.below
+        return self.grid[pos].item()
+
+    def set(self, x, y, val):
+        pos = self.position(x, y)
+        old = self.get(pos[0], pos[1])
+        self.diff[pos] = val
+        self.board_fingerprint ^= cell_word(pos[0], pos[1], old) ^ cell_word(pos[0], pos[1], val)
+
+        if old != val:
+            if not self.own_fields:
+                self.distance_fields = dict(self.distance_fields)
+                self.own_fields = True
+            self.distance_fields.pop(old, None)
+            self.distance_fields.pop(val, None)
+
+    # The sorted positions holding val on this state's board
+    def positions(self, val):
+        changes = self.changes()
+        positions = [pos for pos in self.board_idx.get(val, ()) if pos not in changes]
+        positions.extend(pos for pos, cell in changes.items() if cell == val)
+        positions.sort()
+        return positions
+
+    # Manhattan distance from (x, y) to the nearest cell holding val, or None if the board has no val.
+    # (x, y) may lie off the board, its distance to the nearest cell on the board is added then
+    def distance(self, x, y, val):
+        field = self.distance_fields.get(val)
+        if field is None:
+            positions = self.positions(val)
+            if not positions:
+                return None
+            width, height = self.grid.shape[:2]
+            field = distance_field(positions, width, height)
+            self.distance_fields[val] = field
+        width = len(field)
+        height = len(field[0])
+        cx = min(max(x, 0), width - 1)
+        cy = min(max(y, 0), height - 1)
+        return field[cx][cy] + abs(x - cx) + abs(y - cy)
+
+    # Fixed width fingerprint of the board and the 1D input. The 1D input is edited in place, so its part is mixed in here
     def hash(self):
+        return self.board_fingerprint ^ vector_fingerprint(self.input_1D)
+
+    # The full text of the state, what hash() used to return. Used to check fingerprints for collisions
+    def text(self):
         return str(self.input_1D), str(self.input_2D)
 
+    # Builds the value index of the grid
     def heap(self):
-        self.input_2D_heap = []
-        self.input_2D_idx = defaultdict(list)
-        for pos, val in np.ndenumerate(self.input_2D):
-            self.input_2D_idx[val].append(pos)
-
-        for key in self.input_2D_idx.keys():
-            heapq.heappush(self.input_2D_heap, (len(self.input_2D_idx[key]), key))
+        index = defaultdict(list)
+        for pos, val in np.ndenumerate(self.grid):
+            index[val].append(pos)
+        self.board_idx = dict(index)